@@ -5,6 +5,7 @@ import flet as ft
 import logging
 import sys
 import subprocess
+import multiprocessing
 
 # Убираем детальные логи от flet, urllib3 и нашего search_manager
 logging.getLogger("flet").setLevel(logging.INFO)
@@ -24,44 +25,6 @@ import platform
 import ctypes
 from modules.search_manager import load_index, smart_search, build_index, save_index_chunks, get_current_index, start_search_monitoring
 
-# Определяем путь к портативному Python (предполагаем, что он лежит рядом с main.py)
-portable_python = os.path.join(os.path.dirname(__file__), 'python.exe')
-requirements = os.path.join(os.path.dirname(__file__), 'requirements.txt')
-
-# Попытка импортировать все модули из requirements.txt, если что-то не найдено — установить всё и перезапустить main.py
-req_path = os.path.join(os.path.dirname(__file__), "requirements.txt")
-if os.path.exists(req_path):
-    with open(req_path, encoding="utf-8") as f:
-        pkgs = [line.strip().split('==')[0].split('>=')[0].split('<=')[0] for line in f if line.strip() and not line.startswith('#')]
-    need_install = False
-    for pkg in pkgs:
-        try:
-            __import__(pkg.replace('-', '_'))
-        except ImportError:
-            need_install = True
-            break
-    if need_install:
-        python_exe = sys.executable
-        subprocess.check_call([python_exe, "-m", "pip", "install", "-r", req_path])
-        os.execl(python_exe, python_exe, *sys.argv)
-
-# Если портативный Python существует, устанавливаем зависимости
-if os.path.exists(portable_python) and os.path.exists(requirements):
-    subprocess.run([portable_python, '-m', 'pip', 'install', '-r', requirements], check=True)
-
-load_index()  # загружаем индекс из thumbnail_index.json
-results = smart_search("ваш поисковый запрос")
-
-load_index()
-if not get_current_index():  # если индекс пуст
-    index = build_index()
-    save_index_chunks(index)
-
-start_search_monitoring()  # Запуск фонового мониторинга индекса
-
-
-
-
 def main(page: ft.Page):
     from modules.settings_manager import load_settings, save_settings
     from modules.enhanced_neural_processor import (
@@ -194,4 +157,50 @@ def main(page: ft.Page):
     navigate_to("main")
 
 
-ft.app(target=main)
+def prepare_environment():
+    """
+    Проверяет зависимости и готовит индекс перед запуском интерфейса.
+    Вызывается только из главного процесса: при сборке индекса в нескольких
+    процессах (spawn в Windows) дочерние процессы заново импортируют этот модуль.
+    """
+    # Определяем путь к портативному Python (предполагаем, что он лежит рядом с main.py)
+    portable_python = os.path.join(os.path.dirname(__file__), 'python.exe')
+    requirements = os.path.join(os.path.dirname(__file__), 'requirements.txt')
+
+    # Попытка импортировать все модули из requirements.txt, если что-то не найдено — установить всё и перезапустить main.py
+    req_path = os.path.join(os.path.dirname(__file__), "requirements.txt")
+    if os.path.exists(req_path):
+        with open(req_path, encoding="utf-8") as f:
+            pkgs = [line.strip().split('==')[0].split('>=')[0].split('<=')[0] for line in f if line.strip() and not line.startswith('#')]
+        need_install = False
+        for pkg in pkgs:
+            try:
+                __import__(pkg.replace('-', '_'))
+            except ImportError:
+                need_install = True
+                break
+        if need_install:
+            python_exe = sys.executable
+            subprocess.check_call([python_exe, "-m", "pip", "install", "-r", req_path])
+            os.execl(python_exe, python_exe, *sys.argv)
+
+    # Если портативный Python существует, устанавливаем зависимости
+    if os.path.exists(portable_python) and os.path.exists(requirements):
+        subprocess.run([portable_python, '-m', 'pip', 'install', '-r', requirements], check=True)
+
+    load_index()  # загружаем индекс из thumbnail_index.json
+    results = smart_search("ваш поисковый запрос")
+
+    load_index()
+    if not get_current_index():  # если индекс пуст
+        index = build_index()
+        save_index_chunks(index)
+
+    start_search_monitoring()  # Запуск фонового мониторинга индекса
+
+
+if __name__ == "__main__":
+    # Нужно для пула процессов сборки индекса в собранном exe (Windows)
+    multiprocessing.freeze_support()
+    prepare_environment()
+    ft.app(target=main)
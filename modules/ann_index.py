@@ -0,0 +1,390 @@
+"""
+Модуль приближённого поиска ближайших соседей (ANN) для векторов описаний.
+Инвертированный файл (IVF): векторы разбиты на кластеры сферическим k-means,
+запрос сравнивается только с векторами nprobe ближайших кластеров.
+Векторы внутри кластеров хранятся как есть (float32), в int8 (скалярное
+квантование по измерениям) или кодами product quantization остатка
+относительно центроида кластера (байт на подвектор, как в IVF-PQ);
+лучшие кандидаты при квантовании переоцениваются по точным векторам.
+
+Все массивы лежат на диске в порядке кластеров и открываются через memory map.
+При обновлении k-means не переобучается: векторы, которые не изменились,
+сохраняют кластер и код, кодируются только новые и изменившиеся.
+
+Запуск бенчмарка полноты и скорости: python -m modules.ann_index [векторов]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANN_DIR = Path("Cache") / "semantic" / "ann"
+
+QUANTIZATIONS = ("float32", "int8", "pq")
+
+# Сколько векторов брать для обучения k-means
+_TRAIN_SAMPLE = 65536
+_BLOCK = 16384
+
+
+def vector_digests(vectors):
+    """Векторизованный 64-битный отпечаток каждой строки (для поиска изменившихся векторов)."""
+    words = np.ascontiguousarray(vectors, dtype=np.float32).view(np.uint32).astype(np.uint64)
+    primes = (np.arange(words.shape[1], dtype=np.uint64) * np.uint64(2654435761) + np.uint64(97)) | np.uint64(1)
+    with np.errstate(over="ignore"):
+        return (words * primes).sum(axis=1, dtype=np.uint64) ^ (words.sum(axis=1, dtype=np.uint64) << np.uint64(32))
+
+
+def _nearest(vectors, centroids, metric="ip"):
+    """Индекс ближайшего центроида для каждой строки (блоками, чтобы не раздувать память)."""
+    out = np.empty(len(vectors), dtype=np.int32)
+    if metric == "l2":
+        c_norms = (centroids * centroids).sum(axis=1)
+    for start in range(0, len(vectors), _BLOCK):
+        block = np.asarray(vectors[start:start + _BLOCK], dtype=np.float32)
+        scores = block @ centroids.T
+        if metric == "l2":
+            scores = 2 * scores - c_norms
+        out[start:start + len(block)] = scores.argmax(axis=1)
+    return out
+
+
+def kmeans(vectors, k, iterations=15, spherical=True, seed=0):
+    """
+    Кластеризация k-means (по скалярному произведению для нормированных векторов
+    или по евклидову расстоянию — для подпространств PQ).
+
+    Returns:
+        np.ndarray: Центроиды k x d (float32)
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = max(1, min(k, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    metric = "ip" if spherical else "l2"
+    for _ in range(iterations):
+        assign = _nearest(vectors, centroids, metric)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=k).astype(np.float32)
+        empty = counts == 0
+        # Пустые кластеры заново засеваем случайными векторами
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+        if spherical:
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = centroids / norms
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    IVF-индекс по нормированным векторам (близость — скалярное произведение).
+    Записи упорядочены по кластерам: offsets[c]..offsets[c+1] — кластер c.
+    Для каждой записи хранится путь кадра, отпечаток вектора и код.
+    """
+    def __init__(self, centroids, quantization="float32", scale=None, codebooks=None):
+        """
+        Args:
+            centroids (np.ndarray): Центроиды кластеров (nlist x dim)
+            quantization (str): "float32", "int8" или "pq"
+            scale (np.ndarray): Множители int8 по измерениям
+            codebooks (np.ndarray): Словари PQ (m x 256 x dim/m)
+        """
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.quantization = quantization
+        self.scale = scale
+        self.codebooks = codebooks
+        self.paths = []
+        self.offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        self.digests = np.zeros(0, dtype=np.uint64)
+        self.codes = self._empty_codes()
+        self.generation = None
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    def __len__(self):
+        return len(self.paths)
+
+    # --- Обучение и кодирование ---
+
+    @classmethod
+    def train(cls, vectors, nlist=0, quantization="int8", pq_subvectors=0, seed=0):
+        """
+        Обучает кластеры (и словари квантования) на выборке векторов.
+
+        Args:
+            vectors (np.ndarray): Нормированные векторы n x dim
+            nlist (int): Число кластеров; 0 — 4 * sqrt(n)
+            quantization (str): "float32", "int8" или "pq"
+            pq_subvectors (int): Число подвекторов PQ; 0 — dim / 8
+            seed (int): Зерно генератора
+
+        Returns:
+            IVFIndex: Пустой индекс с обученными параметрами
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Неизвестный тип квантования: {quantization}")
+        rng = np.random.default_rng(seed)
+        n, dim = vectors.shape
+        if n > _TRAIN_SAMPLE:
+            sample = np.asarray(vectors[np.sort(rng.choice(n, size=_TRAIN_SAMPLE, replace=False))], dtype=np.float32)
+        else:
+            sample = np.asarray(vectors, dtype=np.float32)
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        centroids = kmeans(sample, nlist, seed=seed)
+        scale = codebooks = None
+        if quantization == "int8":
+            scale = (np.abs(sample).max(axis=0) / 127.0).astype(np.float32)
+            scale[scale == 0] = 1.0
+        elif quantization == "pq":
+            m = pq_subvectors or max(1, dim // 8)
+            while dim % m:
+                m -= 1
+            sub = dim // m
+            residuals = sample - centroids[_nearest(sample, centroids)]
+            codebooks = np.stack([
+                kmeans(residuals[:, j * sub:(j + 1) * sub], 256, iterations=10, spherical=False, seed=seed + j)
+                for j in range(m)
+            ])
+            if codebooks.shape[1] < 256:
+                pad = np.zeros((m, 256 - codebooks.shape[1], sub), dtype=np.float32)
+                codebooks = np.concatenate([codebooks, pad], axis=1)
+        return cls(centroids, quantization, scale, codebooks)
+
+    def _empty_codes(self):
+        if self.quantization == "int8":
+            return np.zeros((0, self.dim), dtype=np.int8)
+        if self.quantization == "pq":
+            return np.zeros((0, len(self.codebooks)), dtype=np.uint8)
+        return np.zeros((0, self.dim), dtype=np.float32)
+
+    def encode(self, vectors, lists):
+        """Коды векторов, отнесённых к кластерам lists."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.quantization == "int8":
+            return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+        if self.quantization == "pq":
+            vectors = vectors - self.centroids[lists]
+            m, _, sub = self.codebooks.shape
+            codes = np.empty((len(vectors), m), dtype=np.uint8)
+            for j in range(m):
+                codes[:, j] = _nearest(vectors[:, j * sub:(j + 1) * sub], self.codebooks[j], "l2")
+            return codes
+        return vectors
+
+    # --- Обновление ---
+
+    def update(self, paths, vectors, generation=None):
+        """
+        Приводит индекс в соответствие с новым набором векторов.
+        Неизменившиеся векторы (тот же путь и отпечаток) сохраняют кластер и код,
+        новые и изменившиеся кластеризуются и кодируются, исчезнувшие удаляются.
+
+        Args:
+            paths (list): Пути кадров
+            vectors (np.ndarray): Их нормированные векторы
+            generation (int): Поколение индекса
+
+        Returns:
+            int: Сколько векторов пришлось закодировать заново
+        """
+        digests = vector_digests(vectors) if len(paths) else np.zeros(0, dtype=np.uint64)
+        lists = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.offsets))
+        old = {path: i for i, path in enumerate(self.paths)}
+        keep_new, keep_old, fresh = [], [], []
+        for row, path in enumerate(paths):
+            i = old.get(path)
+            if i is not None and self.digests[i] == digests[row]:
+                keep_new.append(row)
+                keep_old.append(i)
+            else:
+                fresh.append(row)
+        fresh = np.asarray(fresh, dtype=np.int64)
+        keep_old = np.asarray(keep_old, dtype=np.int64)
+
+        new_lists = np.empty(len(paths), dtype=np.int32)
+        codes = np.empty((len(paths),) + self.codes.shape[1:], dtype=self.codes.dtype)
+        if len(keep_old):
+            new_lists[keep_new] = lists[keep_old]
+            codes[keep_new] = self.codes[keep_old]
+        if len(fresh):
+            block = np.asarray(vectors[fresh], dtype=np.float32)
+            new_lists[fresh] = _nearest(block, self.centroids)
+            codes[fresh] = self.encode(block, new_lists[fresh])
+
+        order = np.argsort(new_lists, kind="stable")
+        self.paths = [paths[i] for i in order]
+        self.digests = digests[order]
+        self.codes = codes[order]
+        counts = np.bincount(new_lists, minlength=self.nlist)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.generation = generation
+        return len(fresh)
+
+    # --- Поиск ---
+
+    def search(self, query, top_k=200, nprobe=16, rerank=4, exact_vectors=None):
+        """
+        Приближённый поиск ближайших векторов.
+
+        Args:
+            query (np.ndarray): Нормированный вектор запроса
+            top_k (int): Сколько результатов вернуть
+            nprobe (int): Сколько ближайших кластеров просматривать (больше — точнее и медленнее)
+            rerank (int): Во сколько раз больше кандидатов переоценивать точно (0 — не переоценивать)
+            exact_vectors (callable): Путь(и) -> точные векторы для переоценки
+
+        Returns:
+            list: Пары (близость, путь) по убыванию близости
+        """
+        if not len(self.paths):
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        ranges = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe]
+        rows = np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.int64)
+        if not len(rows):
+            return []
+        codes = self.codes[rows]
+        if self.quantization == "int8":
+            scores = codes.astype(np.float32) @ (query * self.scale)
+        elif self.quantization == "pq":
+            m, _, sub = self.codebooks.shape
+            table = np.einsum("jcs,js->jc", self.codebooks, query.reshape(m, sub))
+            # Близость = близость к центроиду кластера + вклад закодированного остатка
+            base = np.repeat(centroid_scores[probe], [len(r) for r in ranges])
+            scores = base + table[np.arange(m), codes.astype(np.int64)].sum(axis=1)
+        else:
+            scores = np.asarray(codes, dtype=np.float32) @ query
+
+        depth = top_k * rerank if rerank and self.quantization != "float32" and exact_vectors else top_k
+        depth = min(depth, len(scores))
+        best = np.argpartition(-scores, depth - 1)[:depth]
+        if depth > top_k:
+            candidates = [self.paths[rows[i]] for i in best]
+            exact = np.asarray(exact_vectors(candidates), dtype=np.float32) @ query
+            order = np.argsort(-exact, kind="stable")[:top_k]
+            return [(float(exact[i]), candidates[i]) for i in order]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(float(scores[i]), self.paths[rows[i]]) for i in best]
+
+    # --- Хранение ---
+
+    def save(self, directory=ANN_DIR):
+        """
+        Сохраняет индекс. Файлы массивов получают новое имя при каждом сохранении:
+        предыдущая версия может быть ещё открыта через memory map в другом потоке,
+        а открытый файл в Windows нельзя заменить. Старые файлы удаляются, когда это возможно.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        arrays = {"centroids": self.centroids, "offsets": self.offsets, "digests": self.digests, "codes": self.codes}
+        if self.scale is not None:
+            arrays["scale"] = self.scale
+        if self.codebooks is not None:
+            arrays["codebooks"] = self.codebooks
+        tag = uuid.uuid4().hex[:8]
+        files = {}
+        for name, array in arrays.items():
+            files[name] = f"{name}_{tag}.npy"
+            np.save(directory / files[name], np.ascontiguousarray(array))
+        tmp = directory / "index.tmp.json"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"quantization": self.quantization, "generation": self.generation, "files": files,
+                       "paths": self.paths}, f, ensure_ascii=False)
+        os.replace(tmp, directory / "index.json")
+        for stale in directory.glob("*.npy"):
+            if stale.name not in files.values():
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, directory=ANN_DIR):
+        """
+        Returns:
+            IVFIndex | None: Индекс с диска (коды открыты через memory map) или None
+        """
+        directory = Path(directory)
+        try:
+            with open(directory / "index.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            files = meta["files"]
+            optional = {name: np.load(directory / files[name]) for name in ("scale", "codebooks") if name in files}
+            ann = cls(np.load(directory / files["centroids"]), meta["quantization"], **optional)
+            ann.offsets = np.load(directory / files["offsets"])
+            ann.digests = np.load(directory / files["digests"], mmap_mode="r")
+            ann.codes = np.load(directory / files["codes"], mmap_mode="r")
+            ann.paths = meta["paths"]
+            ann.generation = meta.get("generation")
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"ANN-индекс не загружен: {e}")
+            return None
+        if len(ann.paths) != len(ann.codes) or ann.offsets[-1] != len(ann.codes):
+            logger.warning("ANN-индекс повреждён, будет построен заново")
+            return None
+        return ann
+
+
+def benchmark(n=200000, dim=128, clusters=500, queries=100, top_k=10, seed=0):
+    """
+    Полнота (recall@k) и время запроса IVF в сравнении с точным перебором
+    на синтетических кластеризованных векторах.
+
+    Returns:
+        list: Кортежи (квантование, nprobe, recall, мс на запрос)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    data = centers[rng.integers(0, clusters, n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    qs = data[rng.choice(n, queries, replace=False)] + 0.1 * rng.standard_normal((queries, dim)).astype(np.float32)
+    qs /= np.linalg.norm(qs, axis=1, keepdims=True)
+    paths = [str(i) for i in range(n)]
+
+    started = time.perf_counter()
+    truth = [set(np.argpartition(-(data @ q), top_k)[:top_k].tolist()) for q in qs]
+    exact_ms = (time.perf_counter() - started) / queries * 1000
+    print(f"точный перебор: {exact_ms:.2f} мс/запрос ({n} x {dim})")
+
+    results = []
+    for quantization in QUANTIZATIONS:
+        started = time.perf_counter()
+        ann = IVFIndex.train(data, quantization=quantization, seed=seed)
+        ann.update(paths, data)
+        print(f"{quantization}: обучение и кодирование {time.perf_counter() - started:.1f} с, "
+              f"коды {ann.codes.nbytes / 2**20:.1f} МБ, кластеров {ann.nlist}")
+        lookup = lambda ps: data[[int(p) for p in ps]]
+        for nprobe in (1, 4, 16, 64):
+            started = time.perf_counter()
+            found = [ann.search(q, top_k, nprobe=nprobe, exact_vectors=lookup) for q in qs]
+            ms = (time.perf_counter() - started) / queries * 1000
+            recall = np.mean([len(t & {int(p) for _, p in f}) / top_k for t, f in zip(truth, found)])
+            results.append((quantization, nprobe, float(recall), ms))
+            print(f"  nprobe {nprobe:3d}: recall@{top_k} {recall:.3f}, {ms:.2f} мс/запрос")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark(*[int(a) for a in sys.argv[1:2]])
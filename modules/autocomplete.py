@@ -0,0 +1,118 @@
+"""
+Модуль автодополнения поисковых запросов.
+Подсказки берутся из словаря индекса (леммы) и из кэша лемматизации
+(словоформы, которые встречались в описаниях), а ранжируются по числу
+кадров, в которых встречается лемма.
+"""
+
+import bisect
+import heapq
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних префиксов держать в кэше подсказок
+PREFIX_CACHE_SIZE = 512
+
+
+class PrefixCompleter:
+    """
+    Автодополнение по префиксу.
+    Слова хранятся в отсортированном списке, поэтому диапазон слов с нужным
+    префиксом находится двумя бинарными поисками, а лучшие N из него выбираются
+    кучей. Документные частоты не копируются, а читаются из текущего индекса,
+    так что после перестроения индекса они всегда актуальны; новые слова
+    добавляются в список вставкой, без полной пересортировки.
+    """
+    def __init__(self, get_index, lemma_cache=None):
+        """
+        Args:
+            get_index (callable): Возвращает текущий SearchIndex
+            lemma_cache (LemmaCache): Источник словоформ (слово -> лемма)
+        """
+        self._get_index = get_index
+        self._lemma_cache = lemma_cache
+        self._words = []        # отсортированные леммы и словоформы
+        self._lemma_of = {}     # слово -> лемма
+        self._sizes = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Добавляет слова, появившиеся в индексе или кэше лемм с прошлого вызова.
+        Проверка дешёвая: словарь просматривается, только если изменился его размер.
+        """
+        index = self._get_index()
+        vocabulary = index.vocabulary()
+        cache = self._lemma_cache
+        sizes = (id(index), index.generation, len(vocabulary), len(cache) if cache is not None else 0)
+        with self._lock:
+            if sizes == self._sizes:
+                return
+            new = {lemma: lemma for lemma in vocabulary if lemma not in self._lemma_of}
+            if cache is not None:
+                for word, lemma in cache.items():
+                    if word not in self._lemma_of and word not in new:
+                        new[word] = lemma
+            self._lemma_of.update(new)
+            if len(new) > 64:
+                # При первом заполнении и крупных перестроениях дешевле досортировать
+                self._words.extend(new)
+                self._words.sort()
+            else:
+                for word in new:
+                    bisect.insort(self._words, word)
+            self._sizes = sizes
+            self._cache.clear()
+            if new:
+                logger.debug(f"Автодополнение: добавлено {len(new)} слов, всего {len(self._words)}")
+
+    def complete(self, prefix, limit=8):
+        """
+        Лучшие слова, начинающиеся с префикса.
+
+        Args:
+            prefix (str): Начало слова
+            limit (int): Максимальное количество подсказок
+
+        Returns:
+            list: Пары (слово, число кадров) по убыванию частоты
+        """
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        self.refresh()
+        key = (prefix, limit)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+            words = self._words
+            lo = bisect.bisect_left(words, prefix)
+            hi = bisect.bisect_left(words, prefix + "\uffff", lo)
+            candidates = words[lo:hi]
+            lemma_of = self._lemma_of
+        # Для каждой леммы показываем одно, самое короткое подходящее слово:
+        # на "танк" — "танк", а на "танка" — "танками", если это единственная форма
+        shortest = {}
+        for word in candidates:
+            lemma = lemma_of[word]
+            current = shortest.get(lemma)
+            if current is None or len(word) < len(current) or (len(word) == len(current) and word == lemma):
+                shortest[lemma] = word
+        doc_freq = self._get_index().doc_freq
+        scored = ((doc_freq(lemma), word) for lemma, word in shortest.items())
+        best = heapq.nsmallest(limit, ((-df, len(w), w) for df, w in scored if df > 0))
+        result = [(w, -neg_df) for neg_df, _, w in best]
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > PREFIX_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def __len__(self):
+        return len(self._words)
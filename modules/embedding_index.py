@@ -0,0 +1,197 @@
+"""
+Модуль хранения векторов описаний, полученных через эндпоинт Mistral embeddings.
+Каждое описание векторизуется один раз: рядом с вектором хранится отпечаток
+текста, и при синхронизации с индексом запрашиваются векторы только для новых
+и изменившихся описаний. Поиск по запросу — один запрос embeddings
+и локальный top-k по косинусной близости.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from modules.mistral_client import EMBED_MODEL
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_DIR = Path("Cache") / "embeddings"
+
+# Сколько описаний отправлять в одном запросе embeddings
+DEFAULT_BATCH_SIZE = 64
+
+
+def text_digest(text):
+    """Отпечаток текста описания (по нему определяется, нужно ли векторизовать заново)."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class EmbeddingIndex:
+    """
+    Векторы описаний кадров (строки матрицы нормированы) с отпечатками текстов.
+    Матрица читается с диска через memory map.
+    """
+    def __init__(self, paths=(), digests=(), vectors=None, model=EMBED_MODEL, generation=None):
+        """
+        Args:
+            paths (list): Пути кадров в порядке строк матрицы
+            digests (list): Отпечатки текстов, по которым получены векторы
+            vectors (np.ndarray): Матрица n x dim (float32)
+            model (str): Модель, которой получены векторы
+            generation (int): Поколение индекса, с которым синхронизированы векторы
+        """
+        self.paths = list(paths)
+        self.digests = list(digests)
+        self.vectors = vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        self.model = model
+        self.generation = generation
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def sync(self, texts, embed, model=EMBED_MODEL, batch_size=DEFAULT_BATCH_SIZE, workers=1, generation=None):
+        """
+        Приводит векторы в соответствие с текстами кадров. Векторы неизменившихся
+        описаний переиспользуются, новые и изменившиеся запрашиваются пачками.
+        Пачки, которые не удалось векторизовать, пропускаются и будут запрошены
+        при следующей синхронизации.
+
+        Args:
+            texts (dict): {путь: текст описания}
+            embed (callable): Список текстов -> список векторов или None при ошибке
+            model (str): Модель embeddings; при смене модели векторизуется всё заново
+            batch_size (int): Описаний в одном запросе
+            workers (int): Сколько запросов выполнять параллельно (обычно по числу ключей)
+            generation (int): Поколение индекса
+
+        Returns:
+            tuple: (новый EmbeddingIndex, dict со счётчиками reused/embedded/failed/removed)
+        """
+        started = time.perf_counter()
+        old = {path: row for row, path in enumerate(self.paths)} if model == self.model else {}
+        kept_paths, kept_digests, kept_rows = [], [], []
+        pending = []
+        for path, text in texts.items():
+            if not text or not text.strip():
+                continue
+            digest = text_digest(text)
+            row = old.pop(path, None)
+            if row is not None and self.digests[row] == digest:
+                kept_paths.append(path)
+                kept_digests.append(digest)
+                kept_rows.append(row)
+            else:
+                pending.append((path, text, digest))
+        stats = {"reused": len(kept_rows), "embedded": 0, "failed": 0, "removed": len(old)}
+
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            answers = list(executor.map(lambda batch: embed([text for _, text, _ in batch]), batches))
+
+        dim = self.dim if kept_rows else 0
+        fresh_paths, fresh_digests, fresh_vectors = [], [], []
+        for batch, vectors in zip(batches, answers):
+            if vectors is None:
+                stats["failed"] += len(batch)
+                continue
+            vectors = np.asarray(vectors, dtype=np.float32)
+            dim = dim or vectors.shape[1]
+            if vectors.ndim != 2 or vectors.shape[1] != dim:
+                logger.warning(f"Пропущена пачка векторов неожиданной размерности {vectors.shape}")
+                stats["failed"] += len(batch)
+                continue
+            fresh_paths.extend(path for path, _, _ in batch)
+            fresh_digests.extend(digest for _, _, digest in batch)
+            fresh_vectors.append(_normalize_rows(vectors))
+        stats["embedded"] = len(fresh_paths)
+
+        parts = []
+        if kept_rows:
+            parts.append(np.asarray(self.vectors[np.asarray(kept_rows, dtype=np.int64)], dtype=np.float32))
+        parts.extend(fresh_vectors)
+        matrix = np.concatenate(parts) if parts else np.zeros((0, dim), dtype=np.float32)
+        logger.info(
+            f"Векторы описаний синхронизированы за {time.perf_counter() - started:.2f} с: "
+            f"переиспользовано {stats['reused']}, получено {stats['embedded']}, "
+            f"ошибок {stats['failed']}, удалено {stats['removed']}"
+        )
+        updated = EmbeddingIndex(kept_paths + fresh_paths, kept_digests + fresh_digests, matrix, model, generation)
+        return updated, stats
+
+    def search(self, query_vector, top_k=200, min_similarity=0.0):
+        """
+        Косинусный поиск ближайших к запросу описаний.
+
+        Args:
+            query_vector (list): Вектор запроса той же модели
+            top_k (int): Максимальное число результатов
+            min_similarity (float): Минимальная косинусная близость
+
+        Returns:
+            list: Пары (близость, путь) по убыванию близости
+        """
+        if not len(self.paths) or query_vector is None:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if query.shape != (self.dim,) or not norm:
+            return []
+        scores = self.vectors @ (query / norm)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(float(scores[i]), self.paths[i]) for i in best if scores[i] >= min_similarity]
+
+    def save(self, directory=EMBEDDINGS_DIR):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        # Как и у семантического индекса: открытую через memory map матрицу
+        # в Windows нельзя заменить, поэтому имя файла новое при каждом сохранении
+        vectors_file = f"vectors_{uuid.uuid4().hex[:8]}.npy"
+        np.save(directory / vectors_file, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        tmp = directory / "index.tmp.json"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "generation": self.generation, "vectors": vectors_file,
+                       "paths": self.paths, "digests": self.digests}, f, ensure_ascii=False)
+        os.replace(tmp, directory / "index.json")
+        for stale in directory.glob("vectors*.npy"):
+            if stale.name != vectors_file:
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, directory=EMBEDDINGS_DIR):
+        """
+        Returns:
+            EmbeddingIndex | None: Векторы с диска или None, если их нет
+        """
+        directory = Path(directory)
+        try:
+            with open(directory / "index.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.load(directory / meta["vectors"], mmap_mode="r")
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"Векторы описаний не загружены: {e}")
+            return None
+        if len(vectors) != len(meta["paths"]) or len(meta["digests"]) != len(meta["paths"]):
+            logger.warning("Файл векторов описаний повреждён: число векторов не совпадает с числом кадров")
+            return None
+        return cls(meta["paths"], meta["digests"], vectors, meta.get("model", EMBED_MODEL), meta.get("generation"))
@@ -1,6 +1,8 @@
 """
 Улучшенная версия модуля для обработки изображений с помощью Pixtral API
-с поддержкой параллельной обработки несколькими API ключами
+с поддержкой параллельной обработки несколькими API ключами.
+Вторым этапом из описания Pixtral строится краткое поисковое описание
+с тегами (<кадр>_summary.json), если включены frame_summaries_enabled.
 """
 
 import os
@@ -11,6 +13,13 @@ from pathlib import Path
 from modules.settings_manager import load_settings
 from modules.parallel_processor import ParallelProcessor
 from modules.pixtral_api import PixtralAPI
+from modules.neural_processor import MistralAPI
+from modules.frame_summaries import needs_summary, write_summary
+
+# Повтор неудавшегося краткого описания: пауза удваивается после каждой
+# неудачи (секунды), пока не изменится описание Pixtral
+SUMMARY_RETRY_DELAY = 60
+SUMMARY_RETRY_MAX_DELAY = 6 * 3600
 
 class EnhancedNeuralProcessor:
     """
@@ -27,6 +36,10 @@ class EnhancedNeuralProcessor:
         # Инициализируем API
         self.pixtral = PixtralAPI()
         
+        # Mistral для кратких описаний: один экземпляр, чтобы ключи чередовались
+        # между запросами (создаётся при первом запросе и при смене ключей)
+        self.mistral = None
+        
         # Инициализируем параллельный процессор
         self.processor = ParallelProcessor()
         
@@ -48,6 +61,12 @@ class EnhancedNeuralProcessor:
         # Мьютекс для доступа к множествам файлов
         self.files_lock = threading.Lock()
         
+        # Строить ли краткие описания (обновляется вместе со списком ключей)
+        self.summaries = self.settings.get("frame_summaries_enabled", False)
+        
+        # Неудачные краткие описания: {кадр: (mtime описания Pixtral, неудач, когда повторить)}
+        self.summary_failures = {}
+        
         # Обработчик, вызываемый при завершении обработки файла
         self.on_file_processed = lambda path, result: None
         
@@ -116,10 +135,12 @@ class EnhancedNeuralProcessor:
             if now - last_checked > 60:
                 last_checked = now
                 self.processor.update_api_keys()
+                self.summaries = load_settings().get("frame_summaries_enabled", False)
         
     def needs_processing(self, image_path):
         """
         Проверяет, требует ли файл обработки через Pixtral API
+        (или построения краткого описания по уже готовому)
         """
         if not os.path.exists(image_path):
             return False
@@ -128,11 +149,74 @@ class EnhancedNeuralProcessor:
         base_path = os.path.splitext(image_path)[0]
         pixtral_json = f"{base_path}_pixtral.json"
         
-        # Если уже есть результат Pixtral, файл не нуждается в обработке
+        # Если уже есть результат Pixtral, нужна разве что сводка
         if os.path.exists(pixtral_json):
-            return False
+            return self.summary_due(image_path)
             
         return True
+
+    def summaries_enabled(self):
+        return self.summaries
+
+    def summary_due(self, image_path):
+        """
+        Нужно ли строить краткое описание сейчас: оно включено и устарело,
+        а после неудачи прошла пауза (или описание Pixtral с тех пор изменилось).
+        """
+        if not (self.summaries_enabled() and needs_summary(image_path)):
+            return False
+        with self.files_lock:
+            failure = self.summary_failures.get(image_path)
+        if failure is None:
+            return True
+        return failure[0] != self._pixtral_mtime(image_path) or time.time() >= failure[2]
+
+    def _pixtral_mtime(self, image_path):
+        try:
+            return os.path.getmtime(f"{os.path.splitext(image_path)[0]}_pixtral.json")
+        except OSError:
+            return None
+
+    def _summary_failed(self, image_path):
+        mtime = self._pixtral_mtime(image_path)
+        with self.files_lock:
+            known, failures, _ = self.summary_failures.get(image_path, (mtime, 0, 0))
+            failures = failures + 1 if known == mtime else 1
+            delay = min(SUMMARY_RETRY_DELAY * 2 ** (failures - 1), SUMMARY_RETRY_MAX_DELAY)
+            self.summary_failures[image_path] = (mtime, failures, time.time() + delay)
+        print(f"⚠️ Не удалось получить краткое описание для {image_path}, повтор через {delay} с")
+
+    def summarize(self, image_path, pixtral_text):
+        """
+        Строит краткое поисковое описание с тегами из описания Pixtral
+        (через общую очередь запросов, с учётом лимитов ключей)
+        """
+        settings = load_settings()
+        keys = settings.get("api_keys", [])
+        if not keys:
+            return None
+        if self.mistral is None or self.mistral.api_keys != keys:
+            self.mistral = MistralAPI(keys)
+        done_event, result_queue = self.processor.add_task(
+            "mistral",
+            self.mistral.process_text,
+            pixtral_text,
+            settings.get("language", "ru"),
+            max_tokens=settings.get("summary_max_tokens", 200)
+        )
+        done_event.wait()
+        summary = result_queue.get()
+        if not summary:
+            self._summary_failed(image_path)
+            return None
+        with self.files_lock:
+            self.summary_failures.pop(image_path, None)
+        try:
+            write_summary(image_path, summary, pixtral_text)
+            print(f"✅ Краткое описание сохранено: {image_path}")
+        except Exception as e:
+            print(f"❌ Ошибка при сохранении краткого описания: {e}")
+        return summary
         
     def save_pixtral_result(self, image_path, result):
         """
@@ -204,11 +288,16 @@ class EnhancedNeuralProcessor:
                     self.save_pixtral_result(image_path, pixtral_text)
                 else:
                     print(f"⚠️ Не удалось получить ответ от Pixtral API для {image_path}")
+
+            summary = None
+            if pixtral_text and self.summary_due(image_path):
+                summary = self.summarize(image_path, pixtral_text)
                     
             # Вызываем обработчик завершения
             if pixtral_text and self.on_file_processed:
                 self.on_file_processed(image_path, {
-                    "pixtral": pixtral_text
+                    "pixtral": pixtral_text,
+                    "summary": summary
                 })
                     
             # Отмечаем, что файл обработан
@@ -234,6 +323,7 @@ class EnhancedNeuralProcessor:
             return
             
         self.active = True
+        self.summaries = load_settings().get("frame_summaries_enabled", False)
         
         # Очищаем множества обработанных и ожидающих файлов
         with self.files_lock:
@@ -325,7 +415,7 @@ def _auto_loop():
                     full = os.path.join(root, file)
                     base = os.path.splitext(full)[0]
                     json_path = base + "_pixtral.json"
-                    if not os.path.exists(json_path):
+                    if not os.path.exists(json_path) or _neural_processor.summary_due(full):
                         targets.append(full)
 
         if targets:
@@ -0,0 +1,80 @@
+"""
+Модуль кратких поисковых описаний кадров.
+Рядом с <кадр>_pixtral.json фоновая обработка кладёт <кадр>_summary.json:
+сжатое описание с тегами, полученное из полного описания Pixtral.
+Краткое описание используется в индексе и в промптах smart-поиска вместо
+полного, пока оно соответствует текущему описанию Pixtral (по отпечатку).
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SUFFIX = "_summary.json"
+
+
+def description_digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def summary_path(image_path):
+    return f"{os.path.splitext(image_path)[0]}{SUMMARY_SUFFIX}"
+
+
+def needs_summary(image_path):
+    """
+    Дешёвая проверка по времени изменения файлов (без чтения):
+    описание Pixtral есть, а краткого нет или оно старше.
+    """
+    base = os.path.splitext(image_path)[0]
+    try:
+        pixtral_mtime = os.path.getmtime(f"{base}_pixtral.json")
+    except OSError:
+        return False
+    try:
+        return os.path.getmtime(f"{base}{SUMMARY_SUFFIX}") < pixtral_mtime
+    except OSError:
+        return True
+
+
+def read_summary(image_path, description):
+    """
+    Краткое описание кадра, если оно построено по этому описанию Pixtral.
+
+    Args:
+        image_path (str): Путь к кадру
+        description (str): Текущее полное описание
+
+    Returns:
+        str | None: Краткое описание или None, если его нет или оно устарело
+    """
+    path = summary_path(image_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Ошибка при чтении {path}: {e}")
+        return None
+    if data.get("source_digest") != description_digest(description):
+        return None
+    return data.get("text") or None
+
+
+def write_summary(image_path, text, description):
+    """Сохраняет краткое описание вместе с отпечатком описания, из которого оно получено."""
+    path = summary_path(image_path)
+    data = {
+        "text": text.strip(),
+        "source_digest": description_digest(description),
+        "timestamp": time.time(),
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp, path)
@@ -0,0 +1,278 @@
+"""
+Модуль для хранения поискового индекса в SQLite (FTS5).
+Альтернатива JSON-чанкам в папке Cache: запись транзакционная и инкрементальная
+(переписываются только изменившиеся кадры), а запросы выполняются на стороне SQLite
+без загрузки всего корпуса в память.
+"""
+
+import json
+import sqlite3
+import hashlib
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+INDEX_DB_FILE = Path("Cache") / "index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    tokens TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    meta TEXT NOT NULL DEFAULT '{}'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    lemmas,
+    tokenize = "unicode61 remove_diacritics 0"
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_vocab USING fts5vocab(docs_fts, 'row');
+"""
+
+
+def fts5_available():
+    """Проверяет, собран ли SQLite с поддержкой FTS5."""
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _digest(text, tokens, meta_json="{}"):
+    h = hashlib.sha1(text.encode("utf-8"))
+    h.update("\x00".join(tokens).encode("utf-8"))
+    h.update(meta_json.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+class SqliteIndexStore:
+    """
+    Хранилище индекса: таблица docs (путь, текст, леммы) и FTS5-таблица
+    docs_fts с колонкой уже лемматизированных токенов (rowid = docs.id).
+    """
+    def __init__(self, db_path=INDEX_DB_FILE):
+        """
+        Args:
+            db_path (Path): Путь к файлу базы данных
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Базы, созданные до появления метаданных кадров
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(docs)")}
+        if "meta" not in columns:
+            self._conn.execute("ALTER TABLE docs ADD COLUMN meta TEXT NOT NULL DEFAULT '{}'")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def sync(self, index_data):
+        """
+        Приводит хранилище в соответствие с индексом одной транзакцией:
+        добавляет новые и изменённые кадры, удаляет исчезнувшие.
+
+        Args:
+            index_data (dict): {путь: (текст, леммы[, метаданные])}
+
+        Returns:
+            dict: Количество добавленных, обновлённых и удалённых записей
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0}
+        with self._lock, self._conn:
+            existing = {
+                path: (doc_id, digest)
+                for doc_id, path, digest in self._conn.execute("SELECT id, path, digest FROM docs")
+            }
+            for path, data in index_data.items():
+                text, tokens = data[0], list(data[1])
+                meta_json = json.dumps(data[2] if len(data) > 2 else {}, ensure_ascii=False, sort_keys=True)
+                digest = _digest(text, tokens, meta_json)
+                old = existing.pop(path, None)
+                if old is not None and old[1] == digest:
+                    continue
+                if old is not None:
+                    self._delete(old[0])
+                    stats["updated"] += 1
+                else:
+                    stats["added"] += 1
+                cur = self._conn.execute(
+                    "INSERT INTO docs (path, text, tokens, digest, meta) VALUES (?, ?, ?, ?, ?)",
+                    (path, text, json.dumps(tokens, ensure_ascii=False), digest, meta_json),
+                )
+                self._conn.execute(
+                    "INSERT INTO docs_fts (rowid, lemmas) VALUES (?, ?)",
+                    (cur.lastrowid, " ".join(tokens)),
+                )
+            for doc_id, _ in existing.values():
+                self._delete(doc_id)
+                stats["removed"] += 1
+        return stats
+
+    def _delete(self, doc_id):
+        self._conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+        self._conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (doc_id,))
+
+    def load(self):
+        """
+        Returns:
+            dict: Весь индекс в формате {путь: (текст, леммы, метаданные)}
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT path, text, tokens, meta FROM docs ORDER BY id").fetchall()
+        return {path: (text, json.loads(tokens), json.loads(meta)) for path, text, tokens, meta in rows}
+
+    def iter_meta(self, size=100):
+        """
+        Отдаёт индекс порциями без текстов и лемм ({путь: ["", [], метаданные]}) —
+        для облегчённого индекса в памяти (фасеты, теги, порядок кадров).
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, path, meta FROM docs WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, size),
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield {path: ["", [], json.loads(meta)] for _, path, meta in rows}
+
+    def get_texts(self, paths):
+        """
+        Returns:
+            dict: {путь: текст} для найденных в базе кадров
+        """
+        paths = list(paths)
+        found = {}
+        with self._lock:
+            for start in range(0, len(paths), 500):
+                part = paths[start:start + 500]
+                marks = ",".join("?" * len(part))
+                found.update(self._conn.execute(
+                    f"SELECT path, text FROM docs WHERE path IN ({marks})", part
+                ).fetchall())
+        return found
+
+    def term_doc_freqs(self):
+        """
+        Returns:
+            dict: {лемма: число кадров} по словарю FTS5 (для автодополнения)
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT term, doc FROM docs_vocab").fetchall())
+
+    def get_text(self, path):
+        """Текст одного кадра или None, если его нет в базе."""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM docs WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def iter_chunks(self, size=100):
+        """
+        Отдаёт индекс порциями в формате JSON-чанков ({путь: [текст, леммы, метаданные]}),
+        не держа весь корпус в памяти.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, path, text, tokens, meta FROM docs WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, size),
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield {
+                path: [text, json.loads(tokens), json.loads(meta)]
+                for _, path, text, tokens, meta in rows
+            }
+
+    def search(self, terms, limit=None, prefix=True):
+        """
+        Полнотекстовый поиск по леммам средствами FTS5 (ранжирование bm25()).
+
+        Args:
+            terms (iterable): Нормализованные термины запроса (объединяются через OR)
+            limit (int): Максимальное количество результатов
+            prefix (bool): Искать термины как префиксы
+
+        Returns:
+            list: Пути кадров по убыванию релевантности
+        """
+        terms = [t for t in terms if t]
+        if not terms:
+            return []
+        suffix = "*" if prefix else ""
+        expr = " OR ".join(_quote(t) + suffix for t in terms)
+        sql = (
+            "SELECT docs.path FROM docs_fts JOIN docs ON docs.id = docs_fts.rowid "
+            "WHERE docs_fts MATCH ? ORDER BY rank"
+        )
+        params = [expr]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, params)]
+
+    def search_scored(self, terms, limit=None, prefix=True):
+        """
+        То же, что search, но с оценками.
+
+        Returns:
+            list: Пары (оценка, путь); оценка — bm25() FTS5 со знаком минус (больше — лучше)
+        """
+        terms = [t for t in terms if t]
+        if not terms:
+            return []
+        suffix = "*" if prefix else ""
+        expr = " OR ".join(_quote(t) + suffix for t in terms)
+        sql = (
+            "SELECT -bm25(docs_fts), docs.path FROM docs_fts JOIN docs ON docs.id = docs_fts.rowid "
+            "WHERE docs_fts MATCH ? ORDER BY rank"
+        )
+        params = [expr]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def migrate_from_json(self, cache_dir):
+        """
+        Переносит индекс из JSON-чанков Cache/index_*.json в базу.
+
+        Returns:
+            int: Количество перенесённых записей
+        """
+        data = {}
+        for file in sorted(Path(cache_dir).glob("index_*.json")):
+            try:
+                with open(file, "r", encoding="utf-8") as f:
+                    data.update(json.load(f))
+            except Exception as e:
+                logger.error(f"Ошибка при миграции {file}: {e}")
+        if data:
+            self.sync(data)
+            logger.info(f"Индекс перенесён из JSON-чанков в SQLite: {len(data)} записей")
+        return len(data)
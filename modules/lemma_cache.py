@@ -0,0 +1,163 @@
+"""
+Модуль для кэширования лемматизации pymorphy2.
+Словарь слово -> лемма хранится на диске (Cache/lemmas.tsv), загружается при старте
+и дописывается по мере появления новых слов, поэтому при перестроении индекса
+через pymorphy2 проходят только ранее не встречавшиеся слова.
+"""
+
+import os
+import threading
+import logging
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LEMMA_CACHE_FILE = Path("Cache") / "lemmas.tsv"
+
+# Сколько новых слов копить в памяти перед дозаписью на диск
+FLUSH_EVERY = 1000
+
+# Сколько слов держать в памяти; давно не встречавшиеся вытесняются
+# (на диске они остаются и подхватываются при следующем запуске)
+DEFAULT_MAX_ENTRIES = 200000
+
+
+class LemmaCache:
+    """
+    Мемоизированный лемматизатор.
+    MorphAnalyzer создаётся лениво — при полностью прогретом кэше он не нужен вовсе.
+    """
+    def __init__(self, path=LEMMA_CACHE_FILE, autoflush=True, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            path (Path): Путь к файлу словаря на диске
+            autoflush (bool): Дописывать новые слова на диск автоматически
+            max_entries (int): Предел словаря в памяти (0 — без ограничения)
+        """
+        self.path = Path(path)
+        self.autoflush = autoflush
+        self.max_entries = max_entries
+        self.lemmas = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        self._morph = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    word, sep, lemma = line.rstrip("\n").partition("\t")
+                    if sep:
+                        self.lemmas[word] = lemma
+                        self.lemmas.move_to_end(word)
+                        self._evict_locked()
+            logger.info(f"Загружен кэш лемм: {len(self.lemmas)} слов")
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке кэша лемм {self.path}: {e}")
+
+    def _analyzer(self):
+        if self._morph is None:
+            import pymorphy2
+            self._morph = pymorphy2.MorphAnalyzer()
+        return self._morph
+
+    def lemmatize(self, word):
+        """
+        Возвращает нормальную форму слова.
+
+        Args:
+            word (str): Слово в нижнем регистре
+
+        Returns:
+            str: Лемма
+        """
+        with self._lock:
+            lemma = self.lemmas.get(word)
+            if lemma is not None:
+                self.lemmas.move_to_end(word)
+                self.hits += 1
+                return lemma
+        parses = self._analyzer().parse(word)
+        lemma = parses[0].normal_form if parses else word.lower()
+        with self._lock:
+            self.misses += 1
+            if word not in self.lemmas:
+                self.lemmas[word] = lemma
+                self._evict_locked()
+                self._pending.append((word, lemma))
+                if self.autoflush and len(self._pending) >= FLUSH_EVERY:
+                    self._flush_locked()
+        return lemma
+
+    def new_entries(self):
+        """Слова, лемматизированные с момента последней записи на диск."""
+        with self._lock:
+            return list(self._pending)
+
+    def clear_pending(self):
+        """Забывает о несохранённых словах (они уже переданы в другой процесс)."""
+        with self._lock:
+            self._pending.clear()
+
+    def items(self):
+        """Снимок словаря в виде списка пар (слово, лемма)."""
+        with self._lock:
+            return list(self.lemmas.items())
+
+    def __len__(self):
+        return len(self.lemmas)
+
+    def merge(self, entries):
+        """
+        Добавляет пары (слово, лемма), полученные извне (например, из процессов-воркеров).
+        """
+        with self._lock:
+            for word, lemma in entries:
+                if word not in self.lemmas:
+                    self.lemmas[word] = lemma
+                    self._evict_locked()
+                    self._pending.append((word, lemma))
+
+    def _evict_locked(self):
+        if self.max_entries:
+            while len(self.lemmas) > self.max_entries:
+                self.lemmas.popitem(last=False)
+
+    def flush(self):
+        """Дописывает новые слова в файл словаря."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        try:
+            os.makedirs(self.path.parent, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(f"{w}\t{l}\n" for w, l in self._pending)
+            self._pending.clear()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении кэша лемм {self.path}: {e}")
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: Попадания, промахи, доля попаданий и размер словаря
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self.lemmas),
+        }
@@ -1,14 +1,42 @@
 import os
+import re
+import zlib
+import hashlib
 import json
 import requests
+import queue
 import threading
 import time
 from pathlib import Path
 import logging
 from modules.index_utils import get_current_index
+from modules.rank_cache import RankingCache, chunk_key
 
 logger = logging.getLogger(__name__)
 
+# Адрес API; в настройках можно указать локальную заглушку (modules/mistral_stub.py)
+MISTRAL_API_BASE = "https://api.mistral.ai/v1"
+EMBED_MODEL = "mistral-embed"
+
+# Шаблон ранжирования с короткими номерами вместо путей: модель получает
+# пронумерованные описания и отвечает JSON-массивом номеров
+DEFAULT_ID_PROMPT = (
+    "Ответь на вопрос: {query}. Ниже пронумерованные описания кадров:\n{images}\n"
+    "Верни только JSON-массив номеров описаний, которые соответствуют запросу, например [3, 17]. "
+    "Если подходящих нет, верни []."
+)
+_ID_ARRAY_RE = re.compile(r"\[[\d\s,]*\]")
+
+# Счётчики запросов ранжирования (для сравнения форматов промпта)
+_stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "parse_failures": 0}
+_stats_lock = threading.Lock()
+
+# Модель ранжирования (входит в версию шаблона для кэша)
+RANK_MODEL = "mistral-large-latest"
+
+_rank_cache = None
+_rank_cache_lock = threading.Lock()
+
 # Загрузка настроек
 def load_settings():
     SETTINGS_FILE = Path(__file__).resolve().parent.parent / "settings.json"
@@ -17,25 +45,100 @@ def load_settings():
     with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
         return json.load(f)
 
+def get_api_base(settings=None):
+    settings = settings if settings is not None else load_settings()
+    return (settings.get("mistral_api_base") or MISTRAL_API_BASE).rstrip("/")
+
+def get_ranking_stats():
+    """Счётчики запросов ранжирования: запросы, токены промптов и ответов, ошибки разбора ответа."""
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_ranking_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+def _count(**counts):
+    with _stats_lock:
+        for name, value in counts.items():
+            _stats[name] += value
+
+def parse_id_reply(content, count):
+    """
+    Номера из ответа модели в формате JSON-массива.
+
+    Args:
+        content (str): Ответ модели
+        count (int): Сколько описаний было в промпте (номера 1..count)
+
+    Returns:
+        list | None: Номера по порядку ответа или None, если массив не найден
+    """
+    match = _ID_ARRAY_RE.search(content)
+    if not match:
+        return None
+    try:
+        ids = json.loads(match.group(0))
+    except ValueError:
+        return None
+    return [i for i in dict.fromkeys(ids) if isinstance(i, int) and 1 <= i <= count]
+
+def get_rank_cache(settings=None):
+    """Общий кэш ответов ранжирования или None, если он выключен (llm_cache_enabled)."""
+    global _rank_cache
+    settings = settings if settings is not None else load_settings()
+    if not settings.get("llm_cache_enabled", True):
+        return None
+    with _rank_cache_lock:
+        if _rank_cache is None:
+            _rank_cache = RankingCache(
+                ttl=settings.get("llm_cache_ttl_days", 7) * 86400,
+                max_entries=settings.get("llm_cache_max_entries", 50000),
+            )
+        return _rank_cache
+
+def template_version(prompt_template, use_ids):
+    """Отпечаток всего, что влияет на ответ модели, кроме запроса и чанка."""
+    return hashlib.sha1(f"{RANK_MODEL}\x00{int(use_ids)}\x00{prompt_template}".encode("utf-8")).hexdigest()[:12]
+
 # Извлечение имён файлов из ответа
 def extract_filenames_from_response(response_text):
     lines = response_text.strip().splitlines()
     return [line.strip() for line in lines if line.strip().endswith(".webp")]
 
 # Один запрос к Mistral по заданному ключу и подиндексу с retry
-def send_mistral_request(api_key, query, index_data, prompt_template, timeout=30, max_retries=2):
-    frames = [f"{path}: {data[0]}" for path, data in index_data.items() if isinstance(data, list) and data]
-    if not frames:
+def send_mistral_request(api_key, query, index_data, prompt_template, timeout=30, max_retries=2, api_base=None):
+    return request_ranking(api_key, query, index_data, prompt_template, timeout, max_retries, api_base) or []
+
+def request_ranking(api_key, query, index_data, prompt_template, timeout=30, max_retries=2, api_base=None,
+                    use_ids=False):
+    """
+    То же, что send_mistral_request, но отличает сбой от пустого ответа.
+
+    Args:
+        use_ids (bool): Передавать описания под номерами 1..n вместо путей и ждать
+            JSON-массив номеров (шаблон должен быть рассчитан на такой ответ)
+
+    Returns:
+        list | None: Имена подходящих файлов или None, если запрос не удался
+    """
+    items = [(path, data[0]) for path, data in index_data.items() if isinstance(data, list) and data]
+    if not items:
         return []
+    if use_ids:
+        frames = [f"{number}: {text}" for number, (_, text) in enumerate(items, 1)]
+    else:
+        frames = [f"{path}: {text}" for path, text in items]
 
     prompt = prompt_template.format(query=query, images="\n".join(frames))
-    api_url = "https://api.mistral.ai/v1/chat/completions"
+    api_url = f"{api_base or get_api_base()}/chat/completions"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
     data_payload = {
-        "model": "mistral-large-latest",
+        "model": RANK_MODEL,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.2
     }
@@ -44,16 +147,126 @@ def send_mistral_request(api_key, query, index_data, prompt_template, timeout=30
         try:
             logger.info("[Mistral] Request with key: %s | %d descriptions (attempt %d)", api_key[:4] + "****", len(frames), attempt + 1)
             response = requests.post(api_url, headers=headers, json=data_payload, timeout=timeout)
+            if response.status_code == 429:
+                # Окно лимита ключа ещё не прошло — ждём, сколько просит API
+                time.sleep(_retry_after(response, attempt))
+                continue
             if response.status_code != 200:
                 logger.warning("Mistral API Error %d: %s", response.status_code, response.text)
                 continue
-            content = response.json()["choices"][0]["message"]["content"]
-            return extract_filenames_from_response(content)
+            reply = response.json()
+            content = reply["choices"][0]["message"]["content"]
+            usage = reply.get("usage") or {}
+            _count(
+                requests=1,
+                prompt_tokens=usage.get("prompt_tokens") or estimate_tokens(prompt),
+                completion_tokens=usage.get("completion_tokens") or estimate_tokens(content),
+            )
+            if not use_ids:
+                return extract_filenames_from_response(content)
+            ids = parse_id_reply(content, len(items))
+            if ids is None:
+                # Модель ответила не массивом: ищем в ответе пути, если она вернула их
+                _count(parse_failures=1)
+                logger.warning("[Mistral] Ответ без JSON-массива номеров: %r", content[:200])
+                known = {path for path, _ in items}
+                return [name for name in extract_filenames_from_response(content) if name in known]
+            return [items[i - 1][0] for i in ids]
         except requests.exceptions.Timeout:
             logger.warning("Mistral API timeout with key: %s (attempt %d)", api_key[:4] + "****", attempt + 1)
         except Exception as e:
             logger.error("Mistral error with key %s: %s (attempt %d)", api_key[:4] + "****", str(e), attempt + 1)
-    return []
+    return None
+
+def _retry_after(response, attempt):
+    try:
+        return min(30.0, float(response.headers.get("Retry-After", "")))
+    except ValueError:
+        return 1.0 + attempt
+
+# Оценка числа токенов без токенизатора: для русского текста у Mistral
+# выходит около токена на 3 символа (оценка с запасом)
+CHARS_PER_TOKEN = 3
+# Запас на текст шаблона промпта и ответ модели
+PROMPT_OVERHEAD_TOKENS = 500
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def pack_chunks(list_of_indexes, token_budget, use_ids=False, stable=False):
+    """
+    Перепаковывает записи индекса в чанки по оценке токенов вместо фиксированных
+    100 записей: короткие описания идут большими пачками, длинные — меньшими.
+    Запись, которая одна превышает бюджет, отправляется отдельным чанком.
+
+    Args:
+        list_of_indexes (iterable): Чанки {путь: [текст, ...]}
+        token_budget (int): Предел оценки токенов на запрос
+        use_ids (bool): Описания пойдут в промпт под номерами, а не под путями
+        stable (bool): Границы по содержимому: после заполнения бюджета на 3/4 чанк
+            закрывается на записи, чей путь отмечен хешем. Добавление нескольких кадров
+            тогда меняет только соседние чанки, а остальные попадают в кэш ранжирования
+
+    Returns:
+        list: Чанки {путь: [текст, ...]}
+    """
+    budget = max(1, token_budget - PROMPT_OVERHEAD_TOKENS)
+    soft_budget = budget * 3 // 4
+    packed = []
+    chunk, used = {}, 0
+    for index_data in list_of_indexes:
+        for path, data in index_data.items():
+            if not (isinstance(data, list) and data):
+                continue
+            cost = estimate_tokens(f"{len(chunk) + 1}: {data[0]}" if use_ids else f"{path}: {data[0]}")
+            if chunk and used + cost > budget:
+                packed.append(chunk)
+                chunk, used = {}, 0
+            chunk[path] = data
+            used += cost
+            if stable and used >= soft_budget and zlib.crc32(path.encode("utf-8")) % 4 == 0:
+                packed.append(chunk)
+                chunk, used = {}, 0
+    if chunk:
+        packed.append(chunk)
+    return packed
+
+# Векторы текстов через эндпоинт embeddings (один запрос на пачку текстов) с retry
+def request_embeddings(api_key, texts, model=EMBED_MODEL, timeout=60, max_retries=2, api_base=None):
+    """
+    Returns:
+        list | None: Векторы в порядке texts или None, если запрос не удался
+    """
+    if not texts:
+        return []
+    api_url = f"{api_base or get_api_base()}/embeddings"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    data_payload = {"model": model, "input": list(texts)}
+
+    for attempt in range(max_retries + 1):
+        try:
+            logger.info("[Mistral] Embeddings with key: %s | %d texts (attempt %d)", api_key[:4] + "****", len(texts), attempt + 1)
+            response = requests.post(api_url, headers=headers, json=data_payload, timeout=timeout)
+            if response.status_code == 429:
+                # Превышен лимит запросов ключа — ждём и повторяем
+                time.sleep(1.0 + attempt)
+                continue
+            if response.status_code != 200:
+                logger.warning("Mistral embeddings error %d: %s", response.status_code, response.text)
+                continue
+            items = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+            if len(items) != len(texts):
+                logger.warning("Mistral embeddings: получено %d векторов вместо %d", len(items), len(texts))
+                return None
+            return [item["embedding"] for item in items]
+        except requests.exceptions.Timeout:
+            logger.warning("Mistral embeddings timeout with key: %s (attempt %d)", api_key[:4] + "****", attempt + 1)
+        except Exception as e:
+            logger.error("Mistral embeddings error with key %s: %s (attempt %d)", api_key[:4] + "****", str(e), attempt + 1)
+    return None
 
 # Обновлённая функция — поддерживает один ключ (для обратной совместимости)
 def rank_frames_with_mistral(query, index_data, top_k=5):
@@ -70,39 +283,118 @@ def rank_frames_with_mistral(query, index_data, top_k=5):
 
     return send_mistral_request(api_keys[0], query, index_data, prompt_template)
 
-# Многопоточная версия с параллельной обработкой чанков (готово к вызову)
-def parallel_rank_frames(query, list_of_indexes):
+# Многопоточная версия: общая очередь чанков, по потоку на ключ
+def parallel_rank_frames(query, list_of_indexes, on_progress=None, cancel_event=None):
+    """
+    Ранжирует все чанки индекса: чанки перепаковываются по бюджету токенов
+    (smart_chunk_tokens) и раздаются через общую очередь потокам — по одному
+    на ключ. Каждый поток берёт следующий чанк, как только позволяет окно
+    лимита его ключа (mistral_key_interval), поэтому чанков может быть сколько
+    угодно больше, чем ключей. Неудавшийся чанк возвращается в очередь и
+    достаётся другому ключу (до max_chunk_attempts попыток).
+
+    Args:
+        query (str): Поисковый запрос
+        list_of_indexes (iterable): Чанки {путь: [текст, ...]}
+        on_progress (callable): Вызывается после каждого чанка с аргументами
+            (готово чанков, всего чанков, найденные в этом чанке пути)
+        cancel_event (threading.Event): Если установлен, новые запросы не отправляются,
+            а функция возвращает то, что успело прийти
+
+    Returns:
+        list: Имена подходящих файлов из всех обработанных чанков
+    """
     settings = load_settings()
     api_keys = settings.get("api_keys", [])
-    prompt_template = settings.get("prompt_templates", {}).get("smart_search", "")
+    use_ids = settings.get("smart_prompt_ids", True)
+    templates = settings.get("prompt_templates", {})
+    if use_ids:
+        prompt_template = templates.get("smart_search_ids") or DEFAULT_ID_PROMPT
+    else:
+        prompt_template = templates.get("smart_search", "")
 
     if not api_keys:
         logger.error("Нет API-ключей для параллельной обработки")
         return []
 
+    cache = get_rank_cache(settings)
+    chunks = pack_chunks(list_of_indexes, settings.get("smart_chunk_tokens", 12000), use_ids,
+                         stable=cache is not None)
+    if not chunks:
+        return []
+    interval = settings.get("mistral_key_interval", 1.1)
+    max_attempts = settings.get("max_chunk_attempts", 3)
+    api_base = get_api_base(settings)
+
+    # Чанки, ответ по которым уже есть в кэше, к нейросети не отправляются
+    version = template_version(prompt_template, use_ids)
+    keys = [chunk_key(query, version, chunk) for chunk in chunks] if cache is not None else []
+    cached = cache.get_many(keys) if cache is not None else {}
+
+    tasks = queue.Queue()
     results = []
+    for number, chunk in enumerate(chunks):
+        if keys and keys[number] in cached:
+            results.extend(cached[keys[number]])
+        else:
+            tasks.put((number, chunk, 1))
+    state = {"done": len(chunks) - tasks.qsize(), "failed": 0}
     lock = threading.Lock()
-    threads = []
-
-    for i, index_data in enumerate(list_of_indexes):
-        if i >= len(api_keys):
-            logger.warning("Недостаточно ключей для всех чанков")
-            break
-        key = api_keys[i]
-        def worker(index=index_data, api_key=key):
+    started = time.perf_counter()
+    if on_progress is not None and state["done"]:
+        on_progress(state["done"], len(chunks), list(results))
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    def worker(api_key):
+        next_allowed = 0.0
+        while not cancelled():
             try:
-                partial = send_mistral_request(api_key, query, index, prompt_template)
-                with lock:
-                    results.extend(partial)
+                number, chunk, attempt = tasks.get_nowait()
+            except queue.Empty:
+                return
+            wait = next_allowed - time.monotonic()
+            if wait > 0:
+                if cancel_event is not None:
+                    if cancel_event.wait(wait):
+                        return
+                else:
+                    time.sleep(wait)
+            next_allowed = time.monotonic() + interval
+            try:
+                partial = request_ranking(api_key, query, chunk, prompt_template, api_base=api_base,
+                                          use_ids=use_ids)
             except Exception as e:
                 logger.error("Ошибка в потоке Mistral: %s", str(e))
+                partial = None
+            if partial is None and attempt < max_attempts:
+                tasks.put((number, chunk, attempt + 1))
+                continue
+            if partial is not None and cache is not None:
+                cache.put(keys[number], partial)
+            with lock:
+                if partial is None:
+                    state["failed"] += 1
+                else:
+                    results.extend(partial)
+                state["done"] += 1
+                done = state["done"]
+            if on_progress is not None:
+                try:
+                    on_progress(done, len(chunks), partial or [])
+                except Exception as e:
+                    logger.error("Ошибка в обработчике прогресса: %s", str(e))
 
-        t = threading.Thread(target=worker)
+    threads = [threading.Thread(target=worker, args=(key,), daemon=True) for key in api_keys[:tasks.qsize()]]
+    for t in threads:
         t.start()
-        threads.append(t)
-        time.sleep(1.1)
-
     for t in threads:
         t.join()
 
-    return results
\ No newline at end of file
+    logger.info(
+        "[Mistral] Ранжирование%s: %d чанков (из кэша %d, готово %d), %d ключей, не удалось %d, %.1f с",
+        " отменено" if cancelled() else "", len(chunks), len(cached), state["done"], len(threads),
+        state["failed"], time.perf_counter() - started,
+    )
+    return results
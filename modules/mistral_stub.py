@@ -0,0 +1,213 @@
+"""
+Локальная заглушка Mistral API для проверки без сети и без расхода ключей.
+Отвечает на те же эндпоинты, что и API:
+  POST /v1/embeddings       — детерминированные векторы (хеширование основ слов),
+                              близкие для текстов с общими словами;
+  POST /v1/chat/completions — отбор кадров из промпта по общим с вопросом словам,
+                              а для промпта без списка кадров — «сжатие» текста с тегами;
+                              с изображениями — «да»/«нет» по каждому (по словам запроса,
+                              найденным в байтах файла: для проверок на текстовых файлах-кадрах);
+  GET  /stats               — счётчики запросов и полученных текстов.
+
+Запуск: python -m modules.mistral_stub [порт] [задержка ответа, с]
+и в settings.json: "mistral_api_base": "http://127.0.0.1:8765/v1"
+"""
+
+import re
+import sys
+import json
+import time
+import zlib
+import math
+import base64
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+STUB_EMBED_DIM = 1024
+
+_WORD_RE = re.compile(r"\w+")
+_FRAME_LINE_RE = re.compile(r"^\s*(\S+\.webp)\s*:\s*(.*)$")
+_ID_LINE_RE = re.compile(r"^\s*(\d+)\s*:\s*(.*)$")
+_QUOTED_RE = re.compile(r"запрос\w*\s+«([^»]*)»")
+
+
+def _stems(text):
+    # Грубая замена лемматизации: первые 5 букв слова
+    return {word[:5] for word in _WORD_RE.findall(text.lower()) if len(word) > 2}
+
+
+def stub_embedding(text, dim=STUB_EMBED_DIM):
+    """Нормированный вектор текста: хеширование основ слов по измерениям."""
+    vector = [0.0] * dim
+    for stem in _stems(text):
+        h = zlib.crc32(stem.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _message_text(message):
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def stub_completion(prompt):
+    """
+    Строки промпта вида «путь: описание» или «номер: описание» делятся на кадры
+    и вопрос; возвращаются кадры с общими с вопросом словами — списком путей
+    или JSON-массивом номеров, в зависимости от формата промпта.
+    """
+    frames, question = [], []
+    numbered = False
+    for line in prompt.splitlines():
+        match = _FRAME_LINE_RE.match(line) or _ID_LINE_RE.match(line)
+        if match:
+            numbered = match.re is _ID_LINE_RE
+            frames.append((match.group(1), _stems(match.group(2))))
+        else:
+            question.append(line)
+    if not frames:
+        # Запрос на сжатие описания: первые слова текста и теги из самых длинных слов
+        words = _WORD_RE.findall(prompt.split("\n\n", 1)[-1])
+        tags = sorted(set(w.lower() for w in words if len(w) > 5), key=len, reverse=True)[:5]
+        return " ".join(words[:25]) + "\nТеги: " + ", ".join(tags)
+    wanted = _stems(" ".join(question))
+    found = [key for key, stems in frames if stems & wanted]
+    if numbered:
+        return json.dumps([int(key) for key in found])
+    return "\n".join(found)
+
+
+def _message_images(message):
+    content = message.get("content", "")
+    if not isinstance(content, list):
+        return []
+    return [part["image_url"]["url"] for part in content
+            if isinstance(part, dict) and part.get("type") == "image_url"]
+
+
+def stub_verdicts(prompt, images):
+    """
+    Ответ на проверку кадров: кадр подходит, если в байтах файла есть слова
+    запроса (запрос — текст в «кавычках» после слова «запросу»). Один кадр — «да»/«нет»,
+    несколько — JSON-объект {"номер": "да"/"нет"}.
+    """
+    quoted = _QUOTED_RE.search(prompt)
+    wanted = _stems(quoted.group(1) if quoted else prompt)
+    verdicts = []
+    for url in images:
+        data = base64.b64decode(url.split(",", 1)[-1] or "")
+        verdicts.append("да" if _stems(data.decode("utf-8", "ignore")) & wanted else "нет")
+    if len(verdicts) == 1:
+        return verdicts[0]
+    return json.dumps({str(n): v for n, v in enumerate(verdicts, 1)}, ensure_ascii=False)
+
+
+class StubServer:
+    """HTTP-сервер заглушки в фоновом потоке (удобно для проверок из кода)."""
+    def __init__(self, port=DEFAULT_PORT, host="127.0.0.1", latency=0.0):
+        """
+        Args:
+            port (int): Порт (0 — любой свободный)
+            host (str): Адрес
+            latency (float): Задержка каждого ответа chat/completions в секундах —
+                чтобы сравнивать число запросов и время на пути, близком к настоящему API
+        """
+        self.stats = {"requests": 0, "embeddings": 0, "texts": 0, "completions": 0, "images": 0}
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def api_base(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug("stub: " + format, *args)
+
+            def _reply(self, code, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    with stub._lock:
+                        self._reply(200, dict(stub.stats))
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._reply(400, {"error": "invalid json"})
+                    return
+                stub._count(requests=1)
+                if self.path.endswith("/embeddings"):
+                    texts = request.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    stub._count(embeddings=1, texts=len(texts))
+                    data = [{"object": "embedding", "index": i, "embedding": stub_embedding(t)}
+                            for i, t in enumerate(texts)]
+                    self._reply(200, {"object": "list", "model": request.get("model"), "data": data})
+                elif self.path.endswith("/chat/completions"):
+                    messages = request.get("messages", [])
+                    prompt = "\n".join(_message_text(m) for m in messages)
+                    images = [url for m in messages for url in _message_images(m)]
+                    stub._count(completions=1, images=len(images))
+                    if stub.latency:
+                        time.sleep(stub.latency)
+                    content = stub_verdicts(prompt, images) if images else stub_completion(prompt)
+                    usage = {"prompt_tokens": len(prompt) // 3 + 1, "completion_tokens": len(content) // 3 + 1}
+                    self._reply(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                                      "usage": usage})
+                else:
+                    self._reply(404, {"error": "not found"})
+
+        return Handler
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="mistral-stub")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    server = StubServer(port, latency=latency)
+    print(f"Заглушка Mistral API: {server.api_base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -10,6 +10,7 @@ import requests
 import base64
 from pathlib import Path
 from modules.settings_manager import load_settings
+from modules.mistral_client import get_api_base
 
 class MistralAPI:
     """
@@ -25,7 +26,7 @@ class MistralAPI:
         self.key_index = (self.key_index + 1) % len(self.api_keys)
         return key
 
-    def process_text(self, text, language="ru"):
+    def process_text(self, text, language="ru", max_tokens=500):
         """
         Обрабатывает текст с помощью Mistral API
         """
@@ -51,12 +52,12 @@ class MistralAPI:
             ],
             "temperature": 0.1,
             "top_p": 0.9,
-            "max_tokens": 500
+            "max_tokens": max_tokens
         }
         
         try:
             response = requests.post(
-                "https://api.mistral.ai/v1/chat/completions",
+                f"{get_api_base()}/chat/completions",
                 headers=headers,
                 json=payload,
                 timeout=30
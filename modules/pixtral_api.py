@@ -2,11 +2,103 @@
 Модуль для работы с Pixtral API (обработка изображений)
 """
 
+import io
 import os
+import re
 import json
 import base64
+import mimetypes
+import threading
 import requests
 from modules.settings_manager import load_settings
+from modules.mistral_client import get_api_base
+from modules.verdict_cache import VerdictCache
+
+PIXTRAL_MODEL = "pixtral-12b-2409"
+
+# Проверка нескольких кадров одним запросом: кадров в запросе по умолчанию
+# и наибольшая сторона уменьшенного кадра (пикселей)
+DEFAULT_VERIFY_BATCH = 4
+DEFAULT_VERIFY_IMAGE_SIZE = 512
+
+BATCH_YES_NO_PROMPT = (
+    "Ты — мультимодальная система. Ниже {count} пронумерованных стопкадров. "
+    "Для каждого реши, соответствует ли он поисковому запросу «{query}». "
+    "Ответь только JSON-объектом вида {example} — номер кадра и «да» или «нет», "
+    "для каждого из {count} кадров, без пояснений."
+)
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.S)
+
+_stats = {"single_requests": 0, "batch_requests": 0, "batch_images": 0, "fallback_images": 0}
+_stats_lock = threading.Lock()
+
+_verdict_cache = None
+_verdict_cache_lock = threading.Lock()
+
+
+def _count(**counts):
+    with _stats_lock:
+        for name, value in counts.items():
+            _stats[name] += value
+
+
+def get_verify_stats():
+    """Счётчики проверки кадров: одиночные и пакетные запросы, кадры в пакетах, повторы по одному."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_verify_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def parse_batch_reply(text, count):
+    """
+    Разбирает ответ пакетной проверки: JSON-объект {"номер": "да"/"нет"}.
+
+    Returns:
+        dict: {номер кадра (с 1): True/False} — только для разобранных номеров
+    """
+    match = _JSON_OBJECT_RE.search(text or "")
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    verdicts = {}
+    for key, value in data.items():
+        try:
+            number = int(str(key).strip())
+        except ValueError:
+            continue
+        if not 1 <= number <= count:
+            continue
+        if isinstance(value, bool):
+            verdicts[number] = value
+        elif isinstance(value, str) and value.strip().lower()[:1] in ("д", "y"):
+            verdicts[number] = True
+        elif isinstance(value, str) and value.strip().lower()[:1] in ("н", "n"):
+            verdicts[number] = False
+    return verdicts
+
+
+def get_verdict_cache(settings=None):
+    """Общий кэш вердиктов проверки кадров или None, если он выключен (verdict_cache_enabled)."""
+    global _verdict_cache
+    settings = settings if settings is not None else load_settings()
+    if not settings.get("verdict_cache_enabled", True):
+        return None
+    with _verdict_cache_lock:
+        if _verdict_cache is None:
+            _verdict_cache = VerdictCache(
+                ttl=settings.get("verdict_cache_ttl_days", 30) * 86400,
+                max_entries=settings.get("verdict_cache_max_entries", 200000),
+            )
+        return _verdict_cache
 
 
 class PixtralAPI:
@@ -44,18 +136,129 @@ class PixtralAPI:
         return key
 
 
-    def ask_yes_no(self, image_path: str, query: str) -> bool:
+    def ask_yes_no(self, image_path: str, query: str):
+        """
+        Проверяет, соответствует ли кадр запросу.
+
+        Returns:
+            bool | None: Ответ модели или None при ошибке API (такой ответ не кэшируется)
+        """
         prompt = (
             "Ты — мультимодальная система. Посмотри на стопкадр и "
             f"реши, соответствует ли он поисковому запросу «{query}». "
             "Ответь только «да» или только «нет»."
         )
+        _count(single_requests=1)
         response = self.process_image(image_path, prompt, language="ru")
         if not response:
-            return False
+            return None
         text = response.strip().lower()
         return text.startswith("д")
     
+    def ask_yes_no_batch(self, image_paths, query, max_side=DEFAULT_VERIFY_IMAGE_SIZE):
+        """
+        Проверяет несколько кадров одним запросом: уменьшенные кадры идут
+        в одном сообщении под номерами, модель отвечает JSON-объектом
+        {"номер": "да"/"нет"}. Кадры, по которым ответ не удалось разобрать,
+        проверяются по одному через ask_yes_no.
+
+        Args:
+            image_paths (list): Пути к кадрам
+            query (str): Поисковый запрос
+            max_side (int): Наибольшая сторона уменьшенного кадра (0 — не уменьшать)
+
+        Returns:
+            list: Для каждого кадра True/False или None при ошибке API
+                (и для кадров, которые не удалось прочитать)
+        """
+        if len(image_paths) == 1:
+            return [self.ask_yes_no(image_paths[0], query)]
+        results = [None] * len(image_paths)
+        # Нечитаемые кадры в запрос не попадают, остальные нумеруются подряд
+        sent = []
+        for position, path in enumerate(image_paths):
+            url = self._image_data_url(path, max_side)
+            if url is not None:
+                sent.append((position, path, url))
+        if not sent:
+            return results
+        example = json.dumps({str(n): "да" if n % 2 else "нет" for n in (1, 2)}, ensure_ascii=False)
+        content = [{
+            "type": "text",
+            "text": BATCH_YES_NO_PROMPT.format(count=len(sent), query=query, example=example),
+        }]
+        for number, (_, _, url) in enumerate(sent, 1):
+            content.append({"type": "text", "text": f"Кадр {number}:"})
+            content.append({"type": "image_url", "image_url": {"url": url}})
+        _count(batch_requests=1, batch_images=len(sent))
+        reply = self._chat([{"role": "user", "content": content}], max_tokens=12 * len(sent) + 20)
+        if reply is None:
+            return results
+        verdicts = parse_batch_reply(reply, len(sent))
+        for number, (position, path, _) in enumerate(sent, 1):
+            if number in verdicts:
+                results[position] = verdicts[number]
+            else:
+                _count(fallback_images=1)
+                results[position] = self.ask_yes_no(path, query)
+        return results
+
+    def _chat(self, messages, max_tokens=1000, temperature=0.0):
+        """
+        Отправляет сообщения модели Pixtral.
+
+        Returns:
+            str: Текст ответа или None в случае ошибки
+        """
+        api_key = self._get_next_key()
+        if not api_key:
+            print("Ошибка: API ключи не настроены")
+            return None
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        data = {
+            "model": PIXTRAL_MODEL,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        try:
+            response = requests.post(f"{get_api_base(load_settings())}/chat/completions", headers=headers, json=data, timeout=120)
+            if response.status_code == 200:
+                return response.json()["choices"][0]["message"]["content"].strip()
+            print(f"Ошибка API Pixtral: {response.status_code}, {response.text}")
+        except Exception as e:
+            print(f"Ошибка при запросе к Pixtral API: {e}")
+        return None
+
+    def _image_data_url(self, image_path, max_side):
+        """
+        Кадр в виде data URL. Если установлен Pillow, кадр уменьшается до max_side
+        по наибольшей стороне и пережимается в JPEG, иначе передаётся как есть.
+        """
+        if max_side:
+            try:
+                from PIL import Image
+            except ImportError:
+                Image = None
+            if Image is not None:
+                try:
+                    with Image.open(image_path) as img:
+                        img = img.convert("RGB")
+                        img.thumbnail((max_side, max_side))
+                        buffer = io.BytesIO()
+                        img.save(buffer, "JPEG", quality=85)
+                    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
+                except Exception as e:
+                    print(f"Ошибка при уменьшении изображения {image_path}: {e}")
+        image_base64 = self._encode_image(image_path)
+        if not image_base64:
+            return None
+        mime = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+        return f"data:{mime};base64,{image_base64}"
+
     def process_image(self, image_path, prompt, language="ru"):
         """
         Обрабатывает изображение с помощью модели Pixtral
@@ -80,7 +283,7 @@ class PixtralAPI:
             
         try:
             # Pixtral API использует тот же эндпоинт, что и другие модели Mistral
-            url = "https://api.mistral.ai/v1/chat/completions"
+            url = f"{get_api_base(load_settings())}/chat/completions"
             
 
             with open(os.path.join(os.path.dirname(__file__), "prompt_categories.json"), encoding="utf-8") as f:
@@ -127,7 +330,7 @@ class PixtralAPI:
             ]
             
             data = {
-                "model": "pixtral-12b-2409",  # Используем Pixtral модель для изображений
+                "model": PIXTRAL_MODEL,  # Используем Pixtral модель для изображений
                 "messages": [
                     {
                         "role": "system",
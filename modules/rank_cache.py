@@ -0,0 +1,52 @@
+"""
+Модуль постоянного кэша ответов LLM-ранжирования по чанкам.
+Ключ — (нормализованный запрос, версия шаблона промпта, отпечаток содержимого
+чанка), поэтому повтор запроса и запрос после добавления нескольких кадров
+обращаются к нейросети только за чанками, содержимое которых изменилось.
+Хранится в SQLite (WAL); записи вытесняются по возрасту (TTL) и по количеству.
+"""
+
+import json
+import hashlib
+from pathlib import Path
+
+from modules.sqlite_cache import SqliteCache
+
+RANK_CACHE_FILE = Path("Cache") / "rank_cache.sqlite3"
+
+
+def chunk_key(query, template_version, index_data):
+    """
+    Ключ кэша для чанка: запрос, версия шаблона и пути с текстами всех записей.
+
+    Args:
+        query (str): Запрос (нормализуется: регистр и пробелы)
+        template_version (str): Отпечаток шаблона и формата промпта
+        index_data (dict): Чанк {путь: [текст, ...]}
+    """
+    h = hashlib.sha1(" ".join(query.lower().split()).encode("utf-8"))
+    h.update(b"\x00" + template_version.encode("utf-8"))
+    for path in sorted(index_data):
+        data = index_data[path]
+        text = data[0] if isinstance(data, list) and data else ""
+        h.update(b"\x00" + path.encode("utf-8") + b"\x01" + text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class RankingCache(SqliteCache):
+    """
+    Кэш {ключ чанка: найденные пути}. Потокобезопасен: потоки ранжирования
+    пишут в него по мере получения ответов.
+    """
+    TABLE = "rankings"
+    VALUE_COLUMN = "paths"
+    NAME = "Кэш LLM-ранжирования"
+
+    def __init__(self, db_path=RANK_CACHE_FILE, ttl=7 * 86400, max_entries=50000):
+        super().__init__(db_path, ttl, max_entries)
+
+    def encode(self, paths):
+        return json.dumps(list(paths), ensure_ascii=False)
+
+    def decode(self, stored):
+        return json.loads(stored)
@@ -0,0 +1,964 @@
+"""
+Модуль с in-memory структурами поискового индекса: инвертированный индекс
+для BM25-ранжирования и ленивая выдача результатов через top-k кучу
+"""
+
+import os
+import re
+import sys
+import heapq
+import math
+import bisect
+import threading
+from array import array
+from collections.abc import Mapping, Sequence
+
+import rapidfuzz
+
+# Веса уровней совпадения термина запроса с леммой документа
+DEFAULT_MATCH_WEIGHTS = {
+    "exact": 3.0,   # точное совпадение леммы
+    "prefix": 2.0,  # совпадение по началу слова
+    "fuzzy": 1.0,   # опечатки (rapidfuzz)
+}
+
+_FRAME_NUMBER_RE = re.compile(r"(\d+)(?=\.\w+$)")
+
+# Фасеты с дискретными значениями (постинги по значению) и числовые поля (фильтр по диапазону)
+FACETS = ("source", "folder")
+RANGE_FIELDS = ("position", "processed")
+
+# Текстовые поля с отдельными постингами (помимо общего текста описания):
+# теги из строки "Теги: ..." ответа Pixtral и имя исходного видео
+FIELDS = ("tags", "source")
+DEFAULT_FIELD_BOOSTS = {"tags": 1.5, "source": 1.0}
+
+# Стандартные параметры BM25
+DEFAULT_BM25_K1 = 1.2
+DEFAULT_BM25_B = 0.75
+
+
+class SearchIndex(Mapping):
+    """
+    Индекс кадров: путь -> (текст, список лемм).
+    Дополнительно хранит постинги, длины документов и документные частоты,
+    необходимые для BM25. Ведёт себя как обычный словарь, поэтому совместим
+    со старым кодом, который работает с get_current_index().
+
+    Представление компактное: леммы интернированы в словарь с целочисленными
+    идентификаторами, документы пронумерованы, токены и постинги хранятся
+    в array вместо списков объектов. Если передан text_loader, полный текст
+    описания в памяти не держится и читается с диска по требованию.
+
+    Для фильтров хранятся фасеты: исходное видео и папка (отсортированные
+    массивы doc id на каждое значение), позиция кадра в видео и дата
+    обработки (числовые массивы, для диапазонов — отсортированный порядок).
+
+    Поля tags и source имеют собственные постинги и длины (леммы берутся из
+    meta["fields"]), что позволяет повышать вес совпадений в тегах и искать
+    по конкретному полю. Исходные строки тегов (meta["tags"]) учитываются
+    в таблице частот тегов, которая обновляется при каждом add/remove.
+    """
+    def __init__(self, entries=None, text_loader=None, generation=0):
+        """
+        Args:
+            entries (dict): Исходные данные в формате {путь: (текст, леммы[, метаданные])}
+            text_loader (callable): Функция путь -> текст для ленивой загрузки описаний
+            generation (int): Номер поколения индекса (растёт при каждом перестроении)
+        """
+        self.generation = generation
+        self._terms = []        # term id -> лемма
+        self._term_ids = {}     # лемма -> term id
+        self._paths = []        # doc id -> путь (None для удалённых)
+        self._doc_ids = {}      # путь -> doc id
+        self._tokens = []       # doc id -> array term id в порядке следования
+        self._doc_len = array("I")
+        self._post_docs = []    # term id -> array doc id (по возрастанию)
+        self._post_tfs = []     # term id -> array tf (параллельно _post_docs)
+        self._text_loader = text_loader
+        self._texts = None if text_loader else []
+        self.total_len = 0
+        self._vocab = None
+        self._order = None
+        self._facet_values = {f: [] for f in FACETS}   # value id -> значение
+        self._facet_ids = {f: {} for f in FACETS}      # значение -> value id
+        self._facet_docs = {f: [] for f in FACETS}     # value id -> array doc id
+        self._doc_facets = {f: array("i") for f in FACETS}  # doc id -> value id
+        self._ranges = {f: array("d") for f in RANGE_FIELDS}  # doc id -> значение (-1 — нет)
+        self._range_order = {}
+        self._field_post = {f: {} for f in FIELDS}          # term id -> (array doc id, array tf)
+        self._field_tokens = {f: [] for f in FIELDS}        # doc id -> array term id
+        self._field_len = {f: array("I") for f in FIELDS}
+        self._field_total = {f: 0 for f in FIELDS}
+        self._tags = []             # tag id -> тег
+        self._tag_ids = {}          # тег -> tag id
+        self._tag_counts = array("I")  # tag id -> число документов
+        self._doc_tags = []         # doc id -> array tag id
+        self._tag_table = None
+        self._global = None     # статистика всего корпуса, если это шард
+        # True — постинги текста хранятся вне индекса (SQLite FTS5), в памяти
+        # только пути, фасеты, теги и поля
+        self.postings_external = False
+        if entries:
+            self.update(entries)
+
+    # --- Mapping ---
+
+    def __getitem__(self, path):
+        doc_id = self._doc_ids[path]
+        return self.text(path), self.tokens(doc_id)
+
+    def __iter__(self):
+        return iter(self._doc_ids)
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def __contains__(self, path):
+        return path in self._doc_ids
+
+    def text(self, path):
+        """Полный текст описания кадра (с диска, если включена ленивая загрузка)."""
+        if self._texts is None:
+            return self._text_loader(path)
+        return self._texts[self._doc_ids[path]]
+
+    def texts(self, paths, **options):
+        """
+        Тексты нескольких кадров. options передаются text_loader — например,
+        настройки, прочитанные один раз на всю пачку, а не для каждого кадра.
+        """
+        if self._texts is None:
+            return [self._text_loader(path, **options) for path in paths]
+        return [self._texts[self._doc_ids[path]] for path in paths]
+
+    def tokens(self, doc_id):
+        """Леммы документа в порядке следования."""
+        terms = self._terms
+        return [terms[t] for t in self._tokens[doc_id]]
+
+    def tags(self, doc_id):
+        """Теги документа в исходном виде."""
+        tags = self._tags
+        return [tags[t] for t in self._doc_tags[doc_id]]
+
+    def doc_id(self, path):
+        return self._doc_ids.get(path)
+
+    def path(self, doc_id):
+        return self._paths[doc_id]
+
+    def ordered_doc_ids(self):
+        """
+        Идентификаторы документов в порядке: исходное видео, позиция кадра, имя файла.
+        Вычисляется один раз и кэшируется до следующего изменения индекса.
+        """
+        if self._order is None:
+            ids = sorted(self._doc_ids.values(), key=self._order_key)
+            self._order = array("I", ids)
+            self._rank = array("I", bytes(4 * len(self._paths)))
+            for rank, doc_id in enumerate(ids):
+                self._rank[doc_id] = rank
+        return self._order
+
+    def _order_key(self, doc_id):
+        path = self._paths[doc_id]
+        source = self._facet_values["source"][self._doc_facets["source"][doc_id]]
+        return source or os.path.dirname(path), self._ranges["position"][doc_id], frame_order_key(path)
+
+    def in_order(self, doc_ids):
+        """Сортирует набор doc id в стабильном порядке ordered_doc_ids."""
+        self.ordered_doc_ids()
+        rank = self._rank
+        return sorted(doc_ids, key=rank.__getitem__)
+
+    # --- Изменение ---
+
+    def _term_id(self, lemma):
+        term_id = self._term_ids.get(lemma)
+        if term_id is None:
+            term_id = len(self._terms)
+            lemma = sys.intern(lemma)
+            self._terms.append(lemma)
+            self._term_ids[lemma] = term_id
+            self._post_docs.append(array("I"))
+            self._post_tfs.append(array("H"))
+        return term_id
+
+    def _facet_value_id(self, facet, value):
+        value_id = self._facet_ids[facet].get(value)
+        if value_id is None:
+            value_id = len(self._facet_values[facet])
+            self._facet_values[facet].append(value)
+            self._facet_ids[facet][value] = value_id
+            self._facet_docs[facet].append(array("I"))
+        return value_id
+
+    def _tag_id(self, tag):
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self._tags)
+            self._tags.append(tag)
+            self._tag_ids[tag] = tag_id
+            self._tag_counts.append(0)
+        return tag_id
+
+    def add(self, path, text, tokens, meta=None):
+        """
+        Добавляет (или заменяет) документ в индексе.
+
+        Args:
+            path (str): Относительный путь к кадру
+            text (str): Полный текст описания
+            tokens (list): Нормализованные леммы в порядке следования (с повторами)
+            meta (dict): Метаданные кадра: source, position, processed,
+                tags (список тегов) и fields ({поле: леммы поля})
+        """
+        if path in self._doc_ids:
+            self.remove(path)
+        self._order = None
+        self._range_order = {}
+        meta = meta or {}
+        doc_id = len(self._paths)
+        term_ids = array("I", (self._term_id(lemma) for lemma in tokens))
+        self._paths.append(path)
+        self._doc_ids[path] = doc_id
+        self._tokens.append(term_ids)
+        self._doc_len.append(len(term_ids))
+        if self._texts is not None:
+            self._texts.append(text)
+        self.total_len += len(term_ids)
+
+        counts = {}
+        for term_id in term_ids:
+            counts[term_id] = counts.get(term_id, 0) + 1
+        for term_id, tf in counts.items():
+            if not self._post_docs[term_id]:
+                self._vocab = None
+            self._post_docs[term_id].append(doc_id)
+            self._post_tfs[term_id].append(min(tf, 0xFFFF))
+
+        fields = meta.get("fields") or {}
+        for field in FIELDS:
+            field_ids = array("I", (self._term_id(lemma) for lemma in fields.get(field, ())))
+            self._field_tokens[field].append(field_ids)
+            self._field_len[field].append(len(field_ids))
+            self._field_total[field] += len(field_ids)
+            counts = {}
+            for term_id in field_ids:
+                counts[term_id] = counts.get(term_id, 0) + 1
+            postings = self._field_post[field]
+            for term_id, tf in counts.items():
+                if term_id not in postings:
+                    postings[term_id] = (array("I"), array("H"))
+                postings[term_id][0].append(doc_id)
+                postings[term_id][1].append(min(tf, 0xFFFF))
+
+        tag_ids = array("I")
+        for tag in dict.fromkeys(meta.get("tags") or ()):
+            tag_id = self._tag_id(tag)
+            tag_ids.append(tag_id)
+            self._tag_counts[tag_id] += 1
+        self._doc_tags.append(tag_ids)
+        self._tag_table = None
+
+        facet_values = {"source": meta.get("source") or "", "folder": os.path.dirname(path)}
+        for facet in FACETS:
+            value_id = self._facet_value_id(facet, facet_values[facet])
+            self._doc_facets[facet].append(value_id)
+            self._facet_docs[facet][value_id].append(doc_id)
+        for field in RANGE_FIELDS:
+            value = meta.get(field)
+            self._ranges[field].append(float(value) if isinstance(value, (int, float)) else -1.0)
+
+    def remove(self, path):
+        """Удаляет документ из индекса, если он есть."""
+        doc_id = self._doc_ids.pop(path, None)
+        if doc_id is None:
+            return
+        self._order = None
+        self._range_order = {}
+        self.total_len -= self._doc_len[doc_id]
+        for term_id in set(self._tokens[doc_id]):
+            docs = self._post_docs[term_id]
+            pos = bisect.bisect_left(docs, doc_id)
+            if pos < len(docs) and docs[pos] == doc_id:
+                del docs[pos]
+                del self._post_tfs[term_id][pos]
+                if not docs:
+                    self._vocab = None
+        for field in FIELDS:
+            postings = self._field_post[field]
+            for term_id in set(self._field_tokens[field][doc_id]):
+                docs, tfs = postings[term_id]
+                pos = bisect.bisect_left(docs, doc_id)
+                if pos < len(docs) and docs[pos] == doc_id:
+                    del docs[pos]
+                    del tfs[pos]
+                if not docs:
+                    del postings[term_id]
+            self._field_total[field] -= self._field_len[field][doc_id]
+            self._field_len[field][doc_id] = 0
+            self._field_tokens[field][doc_id] = None
+        for tag_id in self._doc_tags[doc_id]:
+            self._tag_counts[tag_id] -= 1
+        self._doc_tags[doc_id] = array("I")
+        self._tag_table = None
+        for facet in FACETS:
+            docs = self._facet_docs[facet][self._doc_facets[facet][doc_id]]
+            pos = bisect.bisect_left(docs, doc_id)
+            if pos < len(docs) and docs[pos] == doc_id:
+                del docs[pos]
+        self._paths[doc_id] = None
+        self._tokens[doc_id] = None
+        self._doc_len[doc_id] = 0
+        if self._texts is not None:
+            self._texts[doc_id] = None
+
+    def update(self, entries):
+        """Добавляет документы из словаря {путь: (текст, леммы)}."""
+        for path, data in entries.items():
+            meta = data[2] if len(data) > 2 else None
+            self.add(path, data[0], data[1], meta)
+
+    def clear(self):
+        self.__init__(text_loader=self._text_loader, generation=self.generation)
+
+    def iter_entries(self, size=100):
+        """
+        Отдаёт документы порциями в формате {путь: ("", леммы, метаданные)}
+        (без текста) — например, для раздачи по шардам.
+        """
+        terms = self._terms
+        chunk = {}
+        for path, doc_id in self._doc_ids.items():
+            meta = {field: self._ranges[field][doc_id] for field in RANGE_FIELDS if self._ranges[field][doc_id] >= 0}
+            meta["source"] = self._facet_values["source"][self._doc_facets["source"][doc_id]]
+            meta["tags"] = self.tags(doc_id)
+            meta["fields"] = {f: [terms[t] for t in self._field_tokens[f][doc_id]] for f in FIELDS}
+            chunk[path] = ("", self.tokens(doc_id), meta)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = {}
+        if chunk:
+            yield chunk
+
+    # --- Статистика ---
+
+    def global_stats(self):
+        """
+        Статистика корпуса для BM25: число документов, суммарные длины
+        и документные частоты лемм. Передаётся шардам через set_global_stats.
+        """
+        return {
+            "n_docs": len(self._doc_ids),
+            "total_len": self.total_len,
+            "field_total": dict(self._field_total),
+            "doc_freqs": {lemma: len(self._post_docs[self._term_ids[lemma]]) for lemma in self.vocabulary()},
+        }
+
+    def set_global_stats(self, stats):
+        """
+        Заставляет шард считать idf и средние длины по всему корпусу,
+        чтобы оценки разных шардов были сравнимы и совпадали с оценками
+        неразделённого индекса. None — вернуться к собственной статистике.
+        """
+        self._global = stats
+
+    def _corpus_size(self):
+        return self._global["n_docs"] if self._global else len(self._doc_ids)
+
+    @property
+    def avg_doc_len(self):
+        n_docs = self._corpus_size()
+        if not n_docs:
+            return 0.0
+        total = self._global["total_len"] if self._global else self.total_len
+        return total / n_docs
+
+    def doc_freq(self, lemma):
+        """Количество документов, содержащих лемму."""
+        term_id = self._term_ids.get(lemma)
+        if term_id is None:
+            return 0
+        return len(self._post_docs[term_id])
+
+    def idf(self, lemma):
+        """Обратная документная частота в варианте BM25 (всегда > 0)."""
+        n = self._corpus_size()
+        df = self._global["doc_freqs"].get(lemma, 0) if self._global else self.doc_freq(lemma)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def vocabulary(self):
+        """Список всех лемм индекса (кэшируется до следующего изменения)."""
+        if self._vocab is None:
+            self._vocab = [lemma for lemma, docs in zip(self._terms, self._post_docs) if docs]
+        return self._vocab
+
+    def postings(self, lemma):
+        """
+        Returns:
+            list: Пары (путь, tf) документов, содержащих лемму
+        """
+        term_id = self._term_ids.get(lemma)
+        if term_id is None:
+            return []
+        paths = self._paths
+        return [(paths[d], tf) for d, tf in zip(self._post_docs[term_id], self._post_tfs[term_id])]
+
+    def tag_frequencies(self, prefix="", limit=None):
+        """
+        Таблица частот тегов для облака тегов и автодополнения.
+        Отсортированная таблица строится один раз и кэшируется до следующего изменения.
+
+        Args:
+            prefix (str): Оставить только теги, начинающиеся с этой строки
+            limit (int): Максимальное количество тегов
+
+        Returns:
+            list: Пары (тег, число кадров) по убыванию частоты
+        """
+        if self._tag_table is None:
+            table = [(tag, n) for tag, n in zip(self._tags, self._tag_counts) if n]
+            table.sort(key=lambda item: (-item[1], item[0]))
+            self._tag_table = table
+        table = self._tag_table
+        if prefix:
+            prefix = prefix.lower()
+            table = [item for item in table if item[0].startswith(prefix)]
+        return table[:limit] if limit else list(table)
+
+    def field_doc_freq(self, field, lemma):
+        """Количество документов, у которых лемма есть в данном поле."""
+        term_id = self._term_ids.get(lemma)
+        entry = self._field_post[field].get(term_id)
+        return len(entry[0]) if entry else 0
+
+    def field_doc_ids(self, field, term, prefix=True):
+        """
+        Документы, в поле которых есть лемма, равная термину (или начинающаяся с него).
+
+        Args:
+            field (str): Поле из FIELDS
+            term (str): Нормализованный термин
+            prefix (bool): Учитывать совпадение по началу слова
+
+        Returns:
+            set: doc id подходящих документов
+        """
+        postings = self._field_post[field]
+        doc_ids = set()
+        for term_id, (docs, _) in postings.items():
+            lemma = self._terms[term_id]
+            if lemma == term or (prefix and lemma.startswith(term)):
+                doc_ids.update(docs)
+        return doc_ids
+
+    # --- Фасеты ---
+
+    def facet_values(self, facet):
+        """Значения фасета, встречающиеся хотя бы в одном документе."""
+        return [v for v, docs in zip(self._facet_values[facet], self._facet_docs[facet]) if docs]
+
+    def facet_doc_ids(self, facet, value):
+        """Отсортированный массив doc id документов с данным значением фасета."""
+        value_id = self._facet_ids[facet].get(value)
+        if value_id is None:
+            return array("I")
+        return self._facet_docs[facet][value_id]
+
+    def range_doc_ids(self, field, low=None, high=None):
+        """
+        Документы, у которых числовое поле попадает в [low, high].
+        Документы без значения поля в диапазон не попадают.
+        """
+        order = self._range_order.get(field)
+        if order is None:
+            values = self._ranges[field]
+            ids = sorted((d for d in self._doc_ids.values() if values[d] >= 0), key=values.__getitem__)
+            order = (array("I", ids), array("d", (values[d] for d in ids)))
+            self._range_order[field] = order
+        ids, values = order
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        stop = len(ids) if high is None else bisect.bisect_right(values, high)
+        return ids[start:stop]
+
+    def filter_doc_ids(self, filters, extra_facets=None, skip=None):
+        """
+        Пересечение фильтров по фасетам (начиная с самого короткого списка).
+
+        Args:
+            filters (dict): {"source": [...], "folder": [...], "category": [...],
+                "position": (от, до), "processed": (от, до)}
+            extra_facets (dict): Внешние фасеты {фасет: {значение: doc ids}}, например категории избранного
+            skip (str): Фасет, который не учитывать (для подсчёта значений этого фасета)
+
+        Returns:
+            set | None: Допустимые doc id или None, если фильтров нет
+        """
+        extra_facets = extra_facets or {}
+        groups = []
+        for facet, wanted in (filters or {}).items():
+            if facet == skip or wanted in (None, "", [], ()):
+                continue
+            if facet in RANGE_FIELDS:
+                low, high = wanted
+                groups.append(self.range_doc_ids(facet, low, high))
+                continue
+            values = [wanted] if isinstance(wanted, str) else wanted
+            if facet in FACETS:
+                lists = [self.facet_doc_ids(facet, v) for v in values]
+            else:
+                mapping = extra_facets.get(facet, {})
+                lists = [mapping.get(v, ()) for v in values]
+            if len(lists) == 1:
+                groups.append(lists[0])
+            else:
+                groups.append(set().union(*lists))
+        if not groups:
+            return None
+        groups.sort(key=len)
+        allowed = set(groups[0])
+        for group in groups[1:]:
+            if not allowed:
+                break
+            allowed.intersection_update(group)
+        return allowed
+
+    def facet_counts(self, doc_ids, extra_facets=None, facets=None):
+        """
+        Счётчики значений фасетов по набору документов (для панели фильтров).
+
+        Args:
+            doc_ids (iterable): doc id результатов (None — весь индекс)
+            extra_facets (dict): Внешние фасеты {фасет: {значение: doc ids}}
+            facets (iterable): Какие фасеты считать (None — все)
+
+        Returns:
+            dict: {фасет: {значение: количество}}, для числовых полей — {"min": .., "max": ..}
+        """
+        if doc_ids is None:
+            doc_ids = self._doc_ids.values()
+        doc_ids = doc_ids if isinstance(doc_ids, (set, frozenset)) else set(doc_ids)
+        wanted = None if facets is None else set(facets)
+        counts = {}
+        for facet in FACETS:
+            if wanted is not None and facet not in wanted:
+                continue
+            per_value = {}
+            values = self._facet_values[facet]
+            doc_facets = self._doc_facets[facet]
+            for d in doc_ids:
+                value = values[doc_facets[d]]
+                per_value[value] = per_value.get(value, 0) + 1
+            counts[facet] = per_value
+        for facet, mapping in (extra_facets or {}).items():
+            if wanted is not None and facet not in wanted:
+                continue
+            per_value = {}
+            for value, docs in mapping.items():
+                n = sum(1 for d in docs if d in doc_ids)
+                if n:
+                    per_value[value] = n
+            counts[facet] = per_value
+        for field in RANGE_FIELDS:
+            if wanted is not None and field not in wanted:
+                continue
+            present = [self._ranges[field][d] for d in doc_ids if self._ranges[field][d] >= 0]
+            counts[field] = {"min": min(present), "max": max(present)} if present else {}
+        return counts
+
+    # --- Поиск ---
+
+    def match_terms(self, term, fuzz_threshold=90):
+        """
+        Находит леммы словаря, совпадающие с термином запроса.
+
+        Args:
+            term (str): Нормализованный термин запроса
+            fuzz_threshold (int): Порог схожести для нечёткого совпадения
+
+        Returns:
+            list: Пары (лемма, уровень), уровень — "exact", "prefix" или "fuzzy"
+        """
+        matches = [(term, "exact")] if self.doc_freq(term) else []
+        return matches + match_vocabulary(term, self.vocabulary(), fuzz_threshold)
+
+    def all_doc_ids(self):
+        return set(self._doc_ids.values())
+
+    def term_doc_ids(self, lemma):
+        """Отсортированный массив doc id документов с леммой (постинг без tf)."""
+        term_id = self._term_ids.get(lemma)
+        if term_id is None:
+            return array("I")
+        return self._post_docs[term_id]
+
+    def filter_by_term(self, doc_ids, lemma):
+        """
+        Оставляет из небольшого набора документов те, где есть лемма.
+        Проверка бинарным поиском по постингу, без построения множества
+        из всего (возможно, очень длинного) списка.
+        """
+        docs = self.term_doc_ids(lemma)
+        out = set()
+        for doc_id in doc_ids:
+            pos = bisect.bisect_left(docs, doc_id)
+            if pos < len(docs) and docs[pos] == doc_id:
+                out.add(doc_id)
+        return out
+
+    def prefix_doc_ids(self, prefix):
+        """Документы с любой леммой, начинающейся с prefix."""
+        doc_ids = set()
+        for lemma in self.vocabulary():
+            if lemma.startswith(prefix):
+                doc_ids.update(self._post_docs[self._term_ids[lemma]])
+        return doc_ids
+
+    def phrase_doc_ids(self, lemmas, doc_ids):
+        """
+        Документы, в которых леммы идут подряд в заданном порядке.
+        Позиции берутся из сохранённой последовательности токенов документа.
+
+        Args:
+            lemmas (list): Леммы фразы
+            doc_ids (iterable): Кандидаты (обычно пересечение постингов всех лемм)
+
+        Returns:
+            set: doc id документов, содержащих фразу
+        """
+        ids = [self._term_ids.get(lemma) for lemma in lemmas]
+        if not ids or None in ids:
+            return set()
+        first, rest, n = ids[0], ids[1:], len(ids)
+        out = set()
+        for doc_id in doc_ids:
+            tokens = self._tokens[doc_id]
+            if tokens is None:
+                continue
+            for pos in range(len(tokens) - n + 1):
+                if tokens[pos] == first and all(tokens[pos + 1 + j] == t for j, t in enumerate(rest)):
+                    out.add(doc_id)
+                    break
+        return out
+
+    def containing(self, terms):
+        """
+        Пути документов, в которых есть лемма, содержащая любой из терминов как подстроку.
+        Поиск идёт по словарю, а не по всем документам.
+        """
+        doc_ids = set()
+        for lemma in self.vocabulary():
+            if any(t in lemma for t in terms):
+                doc_ids.update(self._post_docs[self._term_ids[lemma]])
+        return [self._paths[d] for d in sorted(doc_ids)]
+
+    def score(self, terms, weights=None, fuzz_threshold=90, k1=DEFAULT_BM25_K1, b=DEFAULT_BM25_B,
+              field_boosts=None):
+        """То же, что score_ids, но с путями вместо doc id."""
+        paths = self._paths
+        scores = self.score_ids(terms, weights, fuzz_threshold, k1, b, field_boosts)
+        return {paths[doc_id]: s for doc_id, s in scores.items()}
+
+    def score_ids(self, terms, weights=None, fuzz_threshold=90, k1=DEFAULT_BM25_K1, b=DEFAULT_BM25_B,
+                  field_boosts=None, matches=None):
+        """
+        Считает BM25-оценки документов для набора терминов запроса.
+        Вклад каждого совпадения умножается на вес его уровня (точное/префикс/нечёткое);
+        для одного термина запроса в документе учитывается лучшее совпадение.
+        Совпадения в полях tags и source дают дополнительный BM25-вклад
+        (с нормализацией по длине поля), умноженный на вес поля.
+
+        Args:
+            terms (iterable): Нормализованные термины запроса
+            weights (dict): Веса уровней совпадения
+            fuzz_threshold (int): Порог нечёткого совпадения
+            k1 (float): Параметр насыщения tf
+            b (float): Параметр нормализации по длине документа
+            field_boosts (dict): Веса полей {"tags": .., "source": ..}; None — DEFAULT_FIELD_BOOSTS
+            matches (dict): Готовые совпадения {термин: [(лемма, уровень)]} — если
+                словарь уже сопоставлен в другом месте (шарды); иначе match_terms
+
+        Returns:
+            dict: {doc id: оценка} только для документов с ненулевой оценкой
+        """
+        weights = weights or DEFAULT_MATCH_WEIGHTS
+        if field_boosts is None:
+            field_boosts = DEFAULT_FIELD_BOOSTS
+        boosts = {f: field_boosts[f] for f in FIELDS if field_boosts.get(f, 0) > 0}
+        avgdl = self.avg_doc_len or 1.0
+        n_docs = self._corpus_size() or 1
+        field_total = self._global["field_total"] if self._global else self._field_total
+        field_avg = {f: (field_total[f] / n_docs) or 1.0 for f in boosts}
+        doc_len = self._doc_len
+        scores = {}
+        for term in terms:
+            best = {}
+            field_best = {f: {} for f in boosts}
+            if matches is not None:
+                term_matches = matches.get(term, ())
+            else:
+                term_matches = self.match_terms(term, fuzz_threshold)
+            for lemma, tier in term_matches:
+                weight = weights.get(tier, 0.0)
+                term_id = self._term_ids.get(lemma)
+                if weight <= 0 or term_id is None:
+                    continue
+                idf = self.idf(lemma)
+                for doc_id, tf in zip(self._post_docs[term_id], self._post_tfs[term_id]):
+                    norm = k1 * (1.0 - b + b * doc_len[doc_id] / avgdl)
+                    s = weight * idf * tf * (k1 + 1.0) / (tf + norm)
+                    if s > best.get(doc_id, 0.0):
+                        best[doc_id] = s
+                for field, boost in boosts.items():
+                    entry = self._field_post[field].get(term_id)
+                    if entry is None:
+                        continue
+                    lengths = self._field_len[field]
+                    fbest = field_best[field]
+                    for doc_id, tf in zip(*entry):
+                        norm = k1 * (1.0 - b + b * lengths[doc_id] / field_avg[field])
+                        s = boost * weight * idf * tf * (k1 + 1.0) / (tf + norm)
+                        if s > fbest.get(doc_id, 0.0):
+                            fbest[doc_id] = s
+            for matched in (best, *field_best.values()):
+                for doc_id, s in matched.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + s
+        return scores
+
+
+def match_vocabulary(term, vocabulary, fuzz_threshold=90):
+    """
+    Совпадения термина с леммами словаря по началу слова и с опечатками
+    (точное совпадение проверяет вызывающий код).
+
+    Returns:
+        list: Пары (лемма, "prefix" | "fuzzy")
+    """
+    matches = []
+    for lemma in vocabulary:
+        if lemma == term:
+            continue
+        if lemma.startswith(term) or term.startswith(lemma):
+            matches.append((lemma, "prefix"))
+        elif rapidfuzz.fuzz.ratio(term, lemma) >= fuzz_threshold:
+            matches.append((lemma, "fuzzy"))
+    return matches
+
+
+def frame_order_key(path):
+    """
+    Ключ стабильной сортировки кадров: папка исходного видео, затем номер кадра
+    из имени файла (preview_<кадр>.webp), затем само имя.
+    """
+    folder, name = os.path.split(path)
+    match = _FRAME_NUMBER_RE.search(name)
+    return folder, int(match.group(1)) if match else -1, name
+
+
+class ResultCursor(Sequence):
+    """
+    Курсор по результатам поиска с постраничным доступом.
+    Интерфейс получает через page() только те кадры, которые показывает,
+    а повторное листание не пересчитывает запрос.
+    """
+    # True, если total — оценка, а не точное значение
+    estimated = False
+
+    @property
+    def total(self):
+        return len(self)
+
+    def page(self, number, size):
+        """Возвращает страницу результатов (нумерация с 0)."""
+        return self[number * size:(number + 1) * size]
+
+    def approx_bytes(self):
+        """Примерный объём памяти, занимаемый результатами (для кэша поиска)."""
+        return 64 + 96 * len(self)
+
+
+class ListCursor(ResultCursor):
+    """Курсор поверх готового списка (результаты умного поиска)."""
+    def __init__(self, items=()):
+        self._items = list(items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, item):
+        return self._items[item]
+
+
+class GrowingCursor(ListCursor):
+    """
+    Курсор, который пополняется, пока идёт поиск (потоковая выдача умного поиска).
+    Интерфейс может показывать страницы сразу; повторы путей отбрасываются.
+    """
+    def __init__(self, items=()):
+        super().__init__()
+        self._seen = set()
+        self._lock = threading.Lock()
+        self.done = False
+        self.extend(items)
+
+    def extend(self, items):
+        """
+        Returns:
+            int: Сколько новых путей добавлено
+        """
+        with self._lock:
+            fresh = [p for p in dict.fromkeys(items) if p not in self._seen]
+            self._seen.update(fresh)
+            self._items.extend(fresh)
+        return len(fresh)
+
+    def finish(self, order=None):
+        """
+        Отмечает курсор завершённым.
+
+        Args:
+            order (list): Итоговый порядок путей (например, ранжированный список,
+                который вернул поиск); пути не из списка остаются после них
+                в порядке поступления
+        """
+        if order is not None:
+            with self._lock:
+                ranked = [p for p in dict.fromkeys(order) if p in self._seen]
+                placed = set(ranked)
+                self._items = ranked + [p for p in self._items if p not in placed]
+        self.done = True
+
+
+class IndexOrderCursor(ResultCursor):
+    """
+    Все кадры индекса в стабильном порядке (видео, затем таймкод).
+    Список путей не материализуется: порядок документов считается один раз
+    на поколение индекса, а страница собирается по нему при обращении.
+    """
+    def __init__(self, index):
+        self._index = index
+        self._total = len(index)
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, item):
+        order = self._index.ordered_doc_ids()
+        if isinstance(item, slice):
+            return [self._index.path(d) for d in order[item]]
+        return self._index.path(order[item])
+
+    def approx_bytes(self):
+        return 64
+
+
+class DocIdCursor(ResultCursor):
+    """Подмножество кадров индекса (результат фильтрации) в стабильном порядке."""
+    def __init__(self, index, doc_ids):
+        self._index = index
+        self._ids = array("I", index.in_order(doc_ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._index.path(d) for d in self._ids[item]]
+        return self._index.path(self._ids[item])
+
+    def approx_bytes(self):
+        return 64 + 4 * len(self._ids)
+
+
+class RankedResults(ResultCursor):
+    """
+    Результаты поиска, упорядоченные по убыванию оценки.
+    Полная сортировка не выполняется: результаты извлекаются из кучи
+    по мере обращения к очередной странице, поэтому показ первых 25
+    из 100 000 совпадений стоит O(n + k log n).
+    """
+    def __init__(self, scored):
+        """
+        Args:
+            scored (iterable): Пары (оценка, путь)
+        """
+        self._heap = [(-score, path) for score, path in scored]
+        heapq.heapify(self._heap)
+        self._ranked = []
+        self._total = len(self._heap)
+        # Результаты могут разделяться между потоками через кэш поиска
+        self._lock = threading.Lock()
+
+    def _fill(self, count):
+        if len(self._ranked) >= count:
+            return
+        with self._lock:
+            while len(self._ranked) < count and self._heap:
+                self._ranked.append(heapq.heappop(self._heap)[1])
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, _ = item.indices(self._total)
+            self._fill(max(start, stop))
+            return self._ranked[item]
+        if item < 0:
+            item += self._total
+        if not 0 <= item < self._total:
+            raise IndexError("RankedResults index out of range")
+        self._fill(item + 1)
+        return self._ranked[item]
+
+    def __iter__(self):
+        for i in range(self._total):
+            self._fill(i + 1)
+            yield self._ranked[i]
+
+    def top(self, k):
+        """Возвращает k лучших результатов."""
+        return self[:k]
+
+
+class TopKResults(ResultCursor):
+    """
+    Заранее посчитанные лучшие результаты (общий top-k шардов) с точным
+    общим числом совпадений. Страницы за пределами top-k берутся из полного
+    ранжирования, которое строится один раз при первом обращении к ним.
+    """
+    def __init__(self, top, total, rank_all):
+        """
+        Args:
+            top (list): Пары (оценка, путь) по убыванию оценки
+            total (int): Общее число совпадений
+            rank_all (callable): Возвращает курсор со всеми совпадениями в том же порядке
+        """
+        self._top = [path for _, path in top]
+        self._total = max(total, len(self._top))
+        self._rank_all = rank_all
+        self._full = None
+        self._lock = threading.Lock()
+
+    def _all(self):
+        with self._lock:
+            if self._full is None:
+                self._full = self._rank_all()
+            return self._full
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            _, stop, _ = item.indices(self._total)
+            if stop <= len(self._top):
+                return self._top[item]
+            return self._all()[item]
+        if item < 0:
+            item += self._total
+        if 0 <= item < len(self._top):
+            return self._top[item]
+        return self._all()[item]
@@ -11,17 +11,42 @@ import re
 import json
 import time
 import threading
+import functools
+import itertools
+import queue
+import shutil
 import gc
+import copy
 import logging
 from pathlib import Path
+from collections import OrderedDict
 import chardet
-import pymorphy2
 import rapidfuzz
-morph = pymorphy2.MorphAnalyzer()
 
 from modules.settings_manager import load_settings
-from modules.mistral_client import parallel_rank_frames
+from modules.mistral_client import parallel_rank_frames, request_embeddings, EMBED_MODEL
 from modules.index_utils import get_current_index
+from modules.lemma_cache import LemmaCache
+from modules.frame_summaries import read_summary, SUMMARY_SUFFIX
+from modules.verdict_cache import frame_digest, verdict_key
+from modules.autocomplete import PrefixCompleter
+from modules.shard_pool import ShardPool, DEFAULT_SHARD_TOP_K
+from modules.index_store import SqliteIndexStore, fts5_available
+from modules.search_index import (
+    SearchIndex,
+    RankedResults,
+    ListCursor,
+    GrowingCursor,
+    TopKResults,
+    IndexOrderCursor,
+    DocIdCursor,
+    FACETS,
+    RANGE_FIELDS,
+    DEFAULT_MATCH_WEIGHTS,
+    DEFAULT_FIELD_BOOSTS,
+    DEFAULT_BM25_K1,
+    DEFAULT_BM25_B,
+)
 
 # Директория для новых чанков
 CACHE_DIR = Path("Cache")
@@ -29,6 +54,12 @@ CACHE_DIR.mkdir(exist_ok=True)
 
 BLOCKS_PER_FILE = 100
 
+# Манифест указывает на папку с чанками текущего поколения индекса
+MANIFEST_FILE = CACHE_DIR / "index_manifest.json"
+
+# Общий кэш лемм (слово -> лемма), переживает перезапуски
+_lemmas = LemmaCache(CACHE_DIR / "lemmas.tsv")
+
 # Патч для совместимости inspect.getargspec
 def fake_getargspec(func):
     spec = inspect.getfullargspec(func)
@@ -50,8 +81,20 @@ logging.basicConfig(
 )
 
 # Глобальные
-_index = {}
+_index = SearchIndex(text_loader=lambda rel, **options: load_frame_text(rel, **options))
 _last_files = set()
+_last_build_timings = {}
+_store = None
+_store_lock = threading.Lock()
+_generation_lock = threading.Lock()
+_shard_pool = None
+_shard_lock = threading.Lock()
+_semantic = None
+_semantic_lock = threading.Lock()
+_ann = None
+_embeddings = None
+_embeddings_lock = threading.Lock()
+_embedding_key_counter = itertools.count()
 _search_thread = None
 _stop_event = threading.Event()
 
@@ -65,14 +108,18 @@ SYNONYMS = {
 }
 
 def normalize_word(word):
-    parses = morph.parse(word)
-    if not parses:
-        return word.lower()
-    return parses[0].normal_form
+    return _lemmas.lemmatize(word)
 
-def normalize_text(text):
+def get_lemma_cache_stats():
+    return _lemmas.stats()
+
+def normalize_tokens(text):
+    """Леммы текста в порядке следования, с повторами (нужны для tf в BM25)."""
     words = re.findall(r"\b\w{2,}\b", text.lower())
-    normed = set(normalize_word(w) for w in words)
+    return [normalize_word(w) for w in words]
+
+def normalize_text(text):
+    normed = set(normalize_tokens(text))
     print(f"DEBUG: исходный текст: {text}\nDEBUG: нормализованные слова: {normed}\n")
     return normed
 
@@ -83,27 +130,195 @@ def expand_synonyms(terms):
             expanded.add(syn)
     return expanded
 
-def save_index_chunks(index_data):
+def get_index_store(settings=None):
+    """
+    Возвращает SQLite-хранилище индекса, если в настройках выбран index_backend = "sqlite"
+    и SQLite поддерживает FTS5. Иначе None — используются JSON-чанки.
+    При первом открытии пустой базы в неё переносятся существующие чанки из Cache/.
+    """
+    global _store
+    settings = settings if settings is not None else load_settings()
+    if settings.get("index_backend", "json") != "sqlite":
+        return None
+    with _store_lock:
+        if _store is None:
+            if not fts5_available():
+                logger.warning("SQLite без поддержки FTS5, используем JSON-чанки")
+                return None
+            _store = SqliteIndexStore(CACHE_DIR / "index.sqlite3")
+            chunk_dir = _current_chunk_dir()
+            if _store.count() == 0 and list(chunk_dir.glob("index_*.json")):
+                _store.migrate_from_json(chunk_dir)
+        return _store
+
+def get_shard_pool():
+    """
+    Пул процессов-шардов для ранжирования, если в настройках search_shards > 1.
+    Иначе None — запросы ранжируются в текущем процессе.
+    """
+    global _shard_pool
+    settings = load_settings()
+    shards = int(settings.get("search_shards", 0) or 0)
+    with _shard_lock:
+        if _shard_pool is not None and _shard_pool.shards != shards:
+            _shard_pool.stop()
+            _shard_pool = None
+        if _shard_pool is None and shards > 1:
+            _shard_pool = ShardPool(shards, settings.get("search_shard_top_k", DEFAULT_SHARD_TOP_K))
+        return _shard_pool
+
+def _read_manifest():
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f"Ошибка при чтении {MANIFEST_FILE}: {e}")
+        return {}
+
+def _write_manifest(manifest):
+    # Запись во временный файл + os.replace: читатель видит либо старый, либо новый манифест
+    tmp = MANIFEST_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+def _current_chunk_dir():
+    """Папка с чанками текущего поколения (или Cache/ для индекса старого формата)."""
+    gen_dir = _read_manifest().get("dir")
+    if gen_dir and (CACHE_DIR / gen_dir).is_dir():
+        return CACHE_DIR / gen_dir
+    return CACHE_DIR
+
+def _next_generation():
+    with _generation_lock:
+        return max(_index.generation, _read_manifest().get("generation", 0)) + 1
+
+def _cleanup_generations(keep):
+    for path in CACHE_DIR.glob("gen_*"):
+        if path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def _publish_index(index):
+    """
+    Делает index текущим. Индекс полностью построен до вызова и после него
+    не изменяется, поэтому читатели, получившие ссылку через get_current_index(),
+    всегда работают с целым снимком; смена снимка — одно присваивание.
+    """
+    global _index
+    with _generation_lock:
+        if index.generation <= _index.generation:
+            index.generation = _index.generation + 1
+        _index = index
+    logger.info(f"Опубликовано поколение индекса {index.generation}: {len(index)} элементов")
+    pool = get_shard_pool()
+    if pool is not None and not index.postings_external:
+        # Пока шарды загружаются, запросы ранжируются в текущем процессе
+        threading.Thread(target=pool.load, args=(index,), daemon=True).start()
+
+def get_index_generation():
+    return _index.generation
+
+def iter_index_chunks():
+    """Сохранённый индекс порциями по BLOCKS_PER_FILE записей ({путь: [текст, леммы, метаданные]})."""
+    store = get_index_store()
+    if store is not None:
+        yield from store.iter_chunks(BLOCKS_PER_FILE)
+        return
+    for file in sorted(_current_chunk_dir().glob("index_*.json")):
+        try:
+            with open(file, "r", encoding="utf-8") as f:
+                yield json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке {file}: {e}")
+
+def has_saved_index():
+    store = get_index_store()
+    if store is not None:
+        return store.count() > 0
+    return bool(list(_current_chunk_dir().glob("index_*.json")))
+
+def save_index_chunks(index_data, generation=None):
+    """
+    Сохраняет индекс как новое поколение.
+    Для JSON-чанков поколение пишется целиком во временную папку, которая затем
+    атомарно переименовывается в Cache/gen_NNNNNN, после чего подменяется манифест;
+    предыдущее поколение остаётся на диске для читателей, начавших работу раньше.
+
+    Returns:
+        int: Номер записанного поколения
+    """
+    if generation is None:
+        generation = _next_generation()
+    store = get_index_store()
+    if store is not None:
+        stats = store.sync(index_data)
+        logger.info(
+            f"Индекс сохранён в SQLite: +{stats['added']}, ~{stats['updated']}, -{stats['removed']}"
+        )
+        # Поколение нужно и здесь: по нему сверяются векторы, ANN, embeddings
+        # и кэш результатов. Папка JSON-чанков остаётся в манифесте на случай
+        # возврата к index_backend = "json"
+        manifest = _read_manifest()
+        manifest.update({
+            "generation": generation,
+            "backend": "sqlite",
+            "count": store.count(),
+            "created": time.time(),
+        })
+        _write_manifest(manifest)
+        return generation
+    gen_name = f"gen_{generation:06}"
+    tmp_dir = CACHE_DIR / f"{gen_name}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
     items = list(index_data.items())
     for i in range(0, len(items), BLOCKS_PER_FILE):
         chunk = dict(items[i:i + BLOCKS_PER_FILE])
-        chunk_path = CACHE_DIR / f"index_{i // BLOCKS_PER_FILE:03}.json"
+        chunk_path = tmp_dir / f"index_{i // BLOCKS_PER_FILE:03}.json"
         with open(chunk_path, "w", encoding="utf-8") as f:
             json.dump(chunk, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(CACHE_DIR / gen_name, ignore_errors=True)
+    os.replace(tmp_dir, CACHE_DIR / gen_name)
+    previous = _read_manifest().get("dir")
+    _write_manifest({
+        "generation": generation,
+        "backend": "json",
+        "dir": gen_name,
+        "count": len(items),
+        "created": time.time(),
+    })
+    _cleanup_generations({gen_name, previous})
+    return generation
 
-def load_index():
-    global _index
-    _index.clear()
+def load_index(thumbnails_dir="thumbnails"):
+    """
+    Загружает сохранённый индекс и публикует его. При хранении в SQLite
+    в память читаются только пути и метаданные (фасеты, теги, поля):
+    кандидатов ищет FTS5, тексты читаются из базы только для найденных кадров.
+    """
+    index = _new_index(thumbnails_dir=thumbnails_dir)
     if not CACHE_DIR.exists():
         logger.warning("Папка Cache не найдена. Индекс не загружен.")
         return
-    for file in sorted(CACHE_DIR.glob("index_*.json")):
-        try:
-            with open(file, "r", encoding="utf-8") as f:
-                part = json.load(f)
-                _index.update(part)
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке {file}: {e}")
+    store = get_index_store()
+    if store is not None:
+        for part in store.iter_meta(BLOCKS_PER_FILE):
+            index.update(part)
+        index.postings_external = True
+    else:
+        for part in iter_index_chunks():
+            index.update(part)
+    manifest = _read_manifest()
+    backend = "sqlite" if store is not None else "json"
+    if manifest.get("backend", "json") == backend:
+        index.generation = manifest.get("generation", 0)
+    else:
+        # Манифест описывает другое хранилище: его поколение не соответствует
+        # загруженным данным, поэтому берём новое — кэши по поколению не совпадут
+        index.generation = _next_generation()
+    _publish_index(index)
 
 def read_file_with_detect(path):
     if not os.path.exists(path):
@@ -115,9 +330,236 @@ def read_file_with_detect(path):
     return raw.decode(enc, errors='replace')
 
 
-def build_index(thumbnails_dir="thumbnails"):
+# Разобранные descriptions_loc.json по папкам для ленивого чтения текстов кадров:
+# {папка: ((mtime, размер), данные)}, не больше _LOC_CACHE_FOLDERS папок
+_LOC_CACHE_FOLDERS = 64
+_loc_cache = OrderedDict()
+_loc_cache_lock = threading.Lock()
+
+def _cached_loc_data(root):
+    """descriptions_loc.json папки; файл читается заново, только если изменился."""
+    loc_json = os.path.join(root, "descriptions_loc.json")
+    try:
+        st = os.stat(loc_json)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    with _loc_cache_lock:
+        cached = _loc_cache.get(root)
+        if cached is not None and cached[0] == stamp:
+            _loc_cache.move_to_end(root)
+            return cached[1]
+    loc_data = _read_loc_data(root) if stamp is not None else {}
+    with _loc_cache_lock:
+        _loc_cache[root] = (stamp, loc_data)
+        _loc_cache.move_to_end(root)
+        while len(_loc_cache) > _LOC_CACHE_FOLDERS:
+            _loc_cache.popitem(last=False)
+    return loc_data
+
+def _read_loc_data(root):
+    loc_json = os.path.join(root, "descriptions_loc.json")
+    if os.path.exists(loc_json):
+        try:
+            loc_data = json.loads(read_file_with_detect(loc_json))
+            logger.debug(f"Загружен descriptions_loc.json из {root}")
+            return loc_data
+        except Exception as e:
+            logger.error(f"Ошибка при чтении descriptions_loc.json в {root}: {e}")
+    return {}
+
+# Строка тегов, которую Pixtral добавляет в конец описания: "Теги: танк, поле, небо"
+# (иногда на той же строке, что и текст; допускается markdown-разметка и вариант "Tags")
+_TAGS_LINE_RE = re.compile(r"[*_]*(?<!\w)(?:теги|tags)[\s*_]*:[\s*_]*(.*)$", re.IGNORECASE | re.MULTILINE)
+
+def parse_description(description):
+    """
+    Разбирает описание Pixtral на основной текст и список тегов.
+
+    Args:
+        description (str): Описание кадра
+
+    Returns:
+        tuple: (текст без строки тегов, список тегов в нижнем регистре без повторов)
+    """
+    tags = []
+    for match in _TAGS_LINE_RE.finditer(description):
+        for tag in re.split(r"[,;]", match.group(1)):
+            tag = " ".join(tag.strip(" \t.*_#\"'«»").lower().split())
+            if tag and tag not in tags:
+                tags.append(tag)
+    body = _TAGS_LINE_RE.sub("", description).strip()
+    return body, tags
+
+def _frame_text(root, fn, loc_data, use_summary=True):
+    """Текст кадра для индекса: имя файла, имя исходного видео и описание Pixtral (или краткое)."""
+    return " ".join(p for p in _frame_parts(root, fn, loc_data, use_summary) if p)
+
+def _frame_parts(root, fn, loc_data, use_summary=True):
+    """
+    Части текста кадра по отдельности.
+
+    Args:
+        use_summary (bool): Брать краткое описание (_summary.json), если оно
+            построено по текущему описанию Pixtral
+
+    Returns:
+        tuple: (имя файла без расширения, имя исходного видео, описание Pixtral);
+            отсутствующие части — пустые строки
+    """
+    stem = Path(fn).stem
+    source_name = ""
+    description = ""
+
+    # Проверяем наличие описания в loc_data
+    key = stem if stem in loc_data else f"{stem}.webp"
+    if key in loc_data:
+        v = loc_data[key]
+        source_name = os.path.basename(v.get("source", v) if isinstance(v, dict) else v)
+
+    # Проверяем наличие pixtral.json
+    pix = os.path.join(root, f"{stem}_pixtral.json")
+    if os.path.exists(pix):
+        try:
+            data = json.loads(read_file_with_detect(pix))
+            description = data.get("description", "") or data.get("text", "")
+            if description and use_summary:
+                description = read_summary(os.path.join(root, fn), description) or description
+            if description:
+                logger.debug(f"Добавлено описание для {fn}")
+        except Exception as e:
+            logger.error(f"Ошибка при чтении {pix}: {e}")
+    else:
+        logger.debug(f"Файл {pix} не найден")
+    return stem, source_name, description
+
+def _frame_meta(root, fn, loc_data):
+    """
+    Метаданные кадра для фасетов: исходное видео, позиция (сек), fps, таймкод
+    из descriptions_loc.json и время обработки (изменения _pixtral.json или самого кадра).
+    """
+    stem = Path(fn).stem
+    v = loc_data.get(fn, loc_data.get(stem))
+    meta = {}
+    if isinstance(v, dict):
+        meta["source"] = v.get("source", "")
+        if isinstance(v.get("position"), (int, float)):
+            meta["position"] = v["position"]
+        if v.get("fps"):
+            meta["fps"] = v["fps"]
+        if v.get("timestamp"):
+            meta["timecode"] = v["timestamp"]
+    elif isinstance(v, str):
+        meta["source"] = v
+    pix = os.path.join(root, f"{stem}_pixtral.json")
+    try:
+        meta["processed"] = os.path.getmtime(pix if os.path.exists(pix) else os.path.join(root, fn))
+    except OSError:
+        pass
+    return meta
+
+def load_frame_text(rel, thumbnails_dir="thumbnails", settings=None):
+    """
+    Читает полный текст кадра с диска (индекс в памяти хранит только леммы).
+
+    Args:
+        rel (str): Относительный путь к кадру
+        thumbnails_dir (str): Папка с миниатюрами
+        settings (dict): Настройки; None — прочитать (при чтении пачки кадров
+            лучше передать один раз, см. SearchIndex.texts)
+
+    Returns:
+        str: Текст кадра
+    """
+    settings = settings if settings is not None else load_settings()
+    store = get_index_store(settings)
+    if store is not None:
+        text = store.get_text(rel)
+        if text is not None:
+            return text
+    full = os.path.join(thumbnails_dir, rel)
+    root, fn = os.path.split(full)
+    return _frame_text(root, fn, _cached_loc_data(root), settings.get("use_frame_summaries", True))
+
+def _new_index(entries=None, thumbnails_dir="thumbnails"):
+    return SearchIndex(entries, text_loader=functools.partial(load_frame_text, thumbnails_dir=thumbnails_dir))
+
+def _index_folder(root, files, thumbnails_dir):
+    """
+    Индексирует одну папку с миниатюрами (один шард).
+
+    Returns:
+        dict: {относительный путь: (текст, леммы, метаданные)}
+    """
+    idx = {}
+    loc_data = _read_loc_data(root)
+    use_summary = load_settings().get("use_frame_summaries", True)
+
+    for fn in sorted(files):
+        if fn.lower().endswith(".webp"):
+            try:
+                rel = os.path.relpath(os.path.join(root, fn), thumbnails_dir)
+                stem, source_name, description = _frame_parts(root, fn, loc_data, use_summary)
+                text = " ".join(p for p in (stem, source_name, description) if p)
+                if text.strip():  # Добавляем в индекс только если есть текст
+                    meta = _frame_meta(root, fn, loc_data)
+                    _, tags = parse_description(description)
+                    meta["tags"] = tags
+                    meta["fields"] = {
+                        "tags": normalize_tokens(" ".join(tags)),
+                        "source": normalize_tokens(source_name),
+                    }
+                    idx[rel] = (text, normalize_tokens(text), meta)
+                    logger.debug(f"Добавлен в индекс: {rel}")
+                else:
+                    logger.warning(f"Пропущен файл {rel} - нет текстового описания")
+            except Exception as e:
+                logger.error(f"Ошибка при обработке файла {fn}: {e}")
+                continue
+    return idx
+
+def _init_index_worker():
+    # Каждый процесс держит свой MorphAnalyzer и не пишет в общий файл лемм:
+    # новые слова возвращаются родителю и сохраняются им
+    _lemmas.autoflush = False
+
+def _index_shard(root, files, thumbnails_dir):
+    """Задача для процесса-воркера: индексирует папку и возвращает новые леммы."""
+    started = time.perf_counter()
+    _lemmas.reset_stats()
+    idx = _index_folder(root, files, thumbnails_dir)
+    new_lemmas = _lemmas.new_entries()
+    _lemmas.clear_pending()
+    stats = (_lemmas.hits, _lemmas.misses)
+    return root, idx, new_lemmas, stats, time.perf_counter() - started
+
+def _resolve_index_workers(workers):
+    if workers is None:
+        workers = load_settings().get("index_workers", 1)
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+    return workers
+
+def build_index(thumbnails_dir="thumbnails", workers=None):
+    """
+    Строит индекс по папке с миниатюрами.
+    Папки (по одной на исходное видео) независимы, поэтому при workers > 1
+    они индексируются параллельно в ProcessPoolExecutor; результаты шардов
+    сливаются в порядке путей папок, так что итог не зависит от числа воркеров.
+
+    Args:
+        thumbnails_dir (str): Папка с миниатюрами
+        workers (int): Количество процессов; None — из настроек (index_workers),
+            0 — по числу ядер
+
+    Returns:
+        dict: {относительный путь: (текст, леммы, метаданные)}
+    """
+    global _last_build_timings
     idx = {}
+    timings = {}
     logger.info("Начинаем построение индекса...")
+    _lemmas.reset_stats()
     
     # Проверяем существование папки
     thumbnails_path = Path(thumbnails_dir)
@@ -126,88 +568,523 @@ def build_index(thumbnails_dir="thumbnails"):
         thumbnails_path.mkdir(parents=True, exist_ok=True)
         return idx
     
+    workers = _resolve_index_workers(workers)
     try:
-        for root, _, files in os.walk(thumbnails_dir):
-            loc_json = os.path.join(root, "descriptions_loc.json")
-            loc_data = {}
-            if os.path.exists(loc_json):
-                try:
-                    loc_data = json.loads(read_file_with_detect(loc_json))
-                    logger.debug(f"Загружен descriptions_loc.json из {root}")
-                except Exception as e:
-                    logger.error(f"Ошибка при чтении descriptions_loc.json в {root}: {e}")
-                    
-            for fn in files:
-                if fn.lower().endswith(".webp"):
-                    try:
-                        rel = os.path.relpath(os.path.join(root, fn), thumbnails_dir)
-                        stem = Path(fn).stem
-                        parts = [stem]
-                        
-                        # Проверяем наличие описания в loc_data
-                        key = stem if stem in loc_data else f"{stem}.webp"
-                        if key in loc_data:
-                            v = loc_data[key]
-                            parts.append(os.path.basename(v.get("source", v) if isinstance(v, dict) else v))
-                        
-                        # Проверяем наличие pixtral.json
-                        pix = os.path.join(root, f"{stem}_pixtral.json")
-                        if os.path.exists(pix):
-                            try:
-                                data = json.loads(read_file_with_detect(pix))
-                                description = data.get("description", "") or data.get("text", "")
-                                if description:
-                                    parts.append(description)
-                                    logger.debug(f"Добавлено описание для {fn}")
-                            except Exception as e:
-                                logger.error(f"Ошибка при чтении {pix}: {e}")
-                        else:
-                            logger.debug(f"Файл {pix} не найден")
-                        
-                        text = " ".join(parts)
-                        if text.strip():  # Добавляем в индекс только если есть текст
-                            idx[rel] = (text, list(normalize_text(text)))
-                            logger.debug(f"Добавлен в индекс: {rel}")
-                        else:
-                            logger.warning(f"Пропущен файл {rel} - нет текстового описания")
-                    except Exception as e:
-                        logger.error(f"Ошибка при обработке файла {fn}: {e}")
-                        continue
+        t0 = time.perf_counter()
+        folders = [(root, files) for root, _, files in os.walk(thumbnails_dir)
+                   if any(f.lower().endswith(".webp") for f in files)]
+        folders.sort(key=lambda item: item[0])
+        timings["scan"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        shards = []
+        if workers > 1 and len(folders) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_index_worker) as pool:
+                futures = [pool.submit(_index_shard, root, files, thumbnails_dir) for root, files in folders]
+                for future in futures:
+                    root, part, new_lemmas, (hits, misses), elapsed = future.result()
+                    _lemmas.merge(new_lemmas)
+                    _lemmas.hits += hits
+                    _lemmas.misses += misses
+                    shards.append((root, part, elapsed))
+        else:
+            for root, files in folders:
+                started = time.perf_counter()
+                shards.append((root, _index_folder(root, files, thumbnails_dir), time.perf_counter() - started))
+        timings["index"] = time.perf_counter() - t0
+        timings["index_cpu"] = sum(elapsed for _, _, elapsed in shards)
+
+        t0 = time.perf_counter()
+        for _, part, _ in shards:
+            idx.update(part)
+        timings["merge"] = time.perf_counter() - t0
     except Exception as e:
         logger.error(f"Ошибка при построении индекса: {e}")
     
-    logger.info(f"Индекс построен, содержит {len(idx)} элементов")
+    _lemmas.flush()
+    stats = _lemmas.stats()
+    _last_build_timings = timings
+    logger.info(
+        f"Индекс построен, содержит {len(idx)} элементов; "
+        f"кэш лемм: {stats['hits']} попаданий, {stats['misses']} промахов "
+        f"({stats['hit_rate']:.1%}), словарь {stats['size']} слов"
+    )
+    logger.info(
+        "Время построения (воркеров: %d): %s", workers,
+        ", ".join(f"{phase} {sec:.2f} с" for phase, sec in timings.items())
+    )
     return idx
 
+def rebuild_index(thumbnails_dir="thumbnails", workers=None):
+    """
+    Полное перестроение индекса с сохранением чанков.
+
+    Args:
+        thumbnails_dir (str): Папка с миниатюрами
+        workers (int): Количество процессов для построения
+
+    Новый индекс строится и сохраняется целиком, а затем публикуется
+    как следующее поколение; поиск во время перестроения продолжает
+    работать с предыдущим снимком.
+
+    Returns:
+        tuple: (SearchIndex, dict с временем фаз в секундах)
+    """
+    data = build_index(thumbnails_dir, workers=workers)
+    timings = dict(_last_build_timings)
+    store = get_index_store()
+    t0 = time.perf_counter()
+    if store is not None:
+        # Постинги текста живут в FTS5, в памяти — только метаданные
+        index = _new_index({path: ("", (), item[2]) for path, item in data.items()}, thumbnails_dir)
+        index.postings_external = True
+    else:
+        index = _new_index(data, thumbnails_dir)
+    timings["postings"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.generation = save_index_chunks(data)
+    timings["save"] = time.perf_counter() - t0
+    _publish_index(index)
+    if load_settings().get("semantic_search_enabled", False):
+        t0 = time.perf_counter()
+        build_semantic_index(index)
+        timings["semantic"] = time.perf_counter() - t0
+    if load_settings().get("embedding_search_enabled", False):
+        t0 = time.perf_counter()
+        sync_description_embeddings(data, index.generation)
+        timings["embeddings"] = time.perf_counter() - t0
+    return index, timings
+
+def get_last_build_timings():
+    return dict(_last_build_timings)
+
+# Полный индекс (с постингами) для хранения в SQLite: нужен только языку
+# запросов и построению LSA, загружается из базы один раз на поколение
+_postings_cache = None
+_postings_lock = threading.Lock()
+
+def _postings_index(index):
+    """
+    Индекс с постингами текста. Для облегчённого индекса (postings_external)
+    полный индекс читается из SQLite при первом обращении и кэшируется
+    до смены поколения.
+
+    Returns:
+        SearchIndex: index или его полная копия
+    """
+    global _postings_cache
+    if not index.postings_external:
+        return index
+    with _postings_lock:
+        full = _postings_cache
+        if full is None or full.generation != index.generation:
+            full = _new_index()
+            for part in iter_index_chunks():
+                full.update(part)
+            full.generation = index.generation
+            _postings_cache = full
+            logger.info(f"Загружены постинги индекса из SQLite: {len(full)} элементов")
+        return full
+
+class _StoreVocabulary:
+    """Словарь лемм FTS5 (fts5vocab) в интерфейсе SearchIndex для PrefixCompleter."""
+    def __init__(self, freqs, generation):
+        self._freqs = freqs
+        self.generation = generation
+
+    def vocabulary(self):
+        return list(self._freqs)
+
+    def doc_freq(self, lemma):
+        return self._freqs.get(lemma, 0)
+
+_store_vocabulary = None
+
+def _completion_source():
+    """Источник слов для автодополнения: текущий индекс или словарь FTS5."""
+    global _store_vocabulary
+    index = _index
+    if not index.postings_external:
+        return index
+    vocabulary = _store_vocabulary
+    if vocabulary is None or vocabulary.generation != index.generation:
+        store = get_index_store()
+        freqs = store.term_doc_freqs() if store is not None else {}
+        vocabulary = _store_vocabulary = _StoreVocabulary(freqs, index.generation)
+    return vocabulary
+
 def search_in_index(query):
     if not query.strip():
         return list(_index.keys())
     terms = normalize_text(query)
-    return [p for p, (_, norm) in _index.items() if any(any(t in n for n in norm) for t in terms)]
+    store = get_index_store()
+    if store is not None:
+        return store.search(terms)
+    return _index.containing(terms)
+
+def _ranking_params():
+    settings = load_settings()
+    weights = dict(DEFAULT_MATCH_WEIGHTS)
+    weights.update(settings.get("search_match_weights", {}))
+    k1 = settings.get("bm25_k1", DEFAULT_BM25_K1)
+    b = settings.get("bm25_b", DEFAULT_BM25_B)
+    return weights, k1, b
+
+def _field_boosts():
+    boosts = dict(DEFAULT_FIELD_BOOSTS)
+    boosts.update(load_settings().get("search_field_boosts", {}))
+    return boosts
+
+# Префиксы поиска по полю: tag:танк, tag:"военная техника", source:parade
+FIELD_PREFIXES = {"tag": "tags", "source": "source"}
+# --- Язык запросов ---
+#
+#   танк площадь            обычный запрос: любой из терминов, ранжирование BM25
+#   танк -учения            NOT (минус перед словом, фразой или скобкой)
+#   "красная площадь"       фраза: леммы подряд
+#   танк AND (парад OR марш) операторы AND/OR/NOT (И/ИЛИ/НЕ), только заглавными
+#   tag:танк source:parade  условие по полю
+#   танк*                   любое слово, начинающееся с "танк"
+#
+# Если в запросе есть хотя бы один из этих элементов, соседние условия
+# объединяются через AND; иначе запрос работает как раньше.
+
+_QUERY_OPERATORS = {"AND": "and", "И": "and", "OR": "or", "ИЛИ": "or", "NOT": "not", "НЕ": "not"}
+_QUERY_TOKEN_RE = re.compile(r'([()])|(-)(?=[\w"(])|(\w+):"([^"]*)"?|"([^"]*)"?|([^\s()"]+)')
+_QUERY_SYNTAX_RE = re.compile(r'["()*]|(?<!\S)-(?=[\w"(])|(?<!\S)(?:AND|OR|NOT|И|ИЛИ|НЕ)(?!\S)|(\w+):')
+
+def has_query_syntax(query):
+    """Есть ли в запросе операторы, фразы, скобки или условия по полям."""
+    for match in _QUERY_SYNTAX_RE.finditer(query):
+        field = match.group(1)
+        if field is None or field.lower() in FIELD_PREFIXES:
+            return True
+    return False
+
+def _tokenize_query(query):
+    tokens = []
+    depth = 0
+    for m in _QUERY_TOKEN_RE.finditer(query):
+        paren, minus, field, field_value, phrase, word = m.groups()
+        if paren == "(":
+            depth += 1
+            tokens.append(("(", None))
+        elif paren == ")":
+            # Лишние закрывающие скобки игнорируются
+            if depth:
+                depth -= 1
+                tokens.append((")", None))
+        elif minus:
+            tokens.append(("not", None))
+        elif field is not None:
+            tokens.append(("field", (field, field_value)))
+        elif phrase is not None:
+            tokens.append(("phrase", phrase))
+        elif word in _QUERY_OPERATORS:
+            tokens.append((_QUERY_OPERATORS[word], None))
+        else:
+            tokens.append(("word", word))
+    return tokens
+
+def _query_leaf(kind, value):
+    """Лист дерева запроса или None, если после нормализации от условия ничего не осталось."""
+    if kind == "word":
+        name, sep, rest = value.partition(":")
+        if sep and rest and name.lower() in FIELD_PREFIXES:
+            return _query_leaf("field", (name, rest))
+        if value.endswith("*") and len(value.strip("*")) >= 2:
+            return ("prefix", value.strip("*").lower())
+        value = value.strip("*")
+    if kind == "field":
+        field = FIELD_PREFIXES.get(value[0].lower())
+        lemmas = normalize_tokens(value[1])
+        if field is None:
+            return _query_leaf("phrase", f"{value[0]} {value[1]}")
+        return ("field", field, lemmas) if lemmas else None
+    lemmas = normalize_tokens(value)
+    if not lemmas:
+        return None
+    if len(lemmas) == 1:
+        return ("term", sorted(expand_synonyms({lemmas[0]})))
+    return ("phrase", lemmas)
+
+def parse_query(query):
+    """
+    Разбирает запрос в дерево условий.
+
+    Узлы: ("term", [лемма и синонимы]), ("prefix", начало), ("phrase", [леммы]),
+    ("field", поле, [леммы]), ("and", [узлы]), ("or", [узлы]), ("not", узел).
+
+    Returns:
+        tuple | None: Корень дерева или None для пустого запроса
+    """
+    tokens = _tokenize_query(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos][0] if pos < len(tokens) else None
+
+    def parse_or():
+        nonlocal pos
+        nodes = [parse_and()]
+        while peek() == "or":
+            pos += 1
+            nodes.append(parse_and())
+        nodes = [n for n in nodes if n is not None]
+        if not nodes:
+            return None
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and():
+        nonlocal pos
+        nodes = []
+        while peek() not in (None, ")", "or"):
+            if peek() == "and":
+                pos += 1
+                continue
+            node = parse_unary()
+            if node is not None:
+                nodes.append(node)
+        if not nodes:
+            return None
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_unary():
+        nonlocal pos
+        if peek() == "not":
+            pos += 1
+            node = parse_unary()
+            return ("not", node) if node is not None else None
+        if peek() in (None, ")", "or", "and"):
+            # Оператор без операнда ("танк NOT", "NOT )") пропускается
+            return None
+        return parse_primary()
+
+    def parse_primary():
+        nonlocal pos
+        kind, value = tokens[pos]
+        pos += 1
+        if kind == "(":
+            node = parse_or()
+            if peek() == ")":
+                pos += 1
+            return node
+        return _query_leaf(kind, value)
+
+    return parse_or()
+
+def _estimate(node, index):
+    """Оценка числа документов узла — для порядка пересечения в AND."""
+    kind = node[0]
+    if kind == "term":
+        return sum(index.doc_freq(lemma) for lemma in node[1])
+    if kind == "phrase":
+        return min(index.doc_freq(lemma) for lemma in node[1])
+    if kind == "field":
+        return min(index.field_doc_freq(node[1], lemma) for lemma in node[2])
+    if kind == "and":
+        return min(_estimate(n, index) for n in node[1] if n[0] != "not") if any(
+            n[0] != "not" for n in node[1]) else len(index)
+    if kind == "or":
+        return sum(_estimate(n, index) for n in node[1])
+    # prefix и not: точную оценку без вычисления не получить
+    return len(index)
+
+def _evaluate(node, index, candidates=None):
+    """
+    Вычисляет множество doc id узла по постингам.
+
+    Args:
+        node (tuple): Узел дерева parse_query
+        index (SearchIndex): Индекс
+        candidates (set): Если задано — результат ограничивается этим множеством;
+            маленькие наборы кандидатов проверяются по постингам бинарным поиском
+
+    Returns:
+        set: doc id подходящих документов
+    """
+    kind = node[0]
+    if kind == "term":
+        out = set()
+        for lemma in node[1]:
+            if candidates is not None and len(candidates) * 8 < index.doc_freq(lemma):
+                out |= index.filter_by_term(candidates, lemma)
+            else:
+                docs = index.term_doc_ids(lemma)
+                out.update(docs if candidates is None else candidates.intersection(docs))
+        return out
+    if kind == "prefix":
+        docs = index.prefix_doc_ids(node[1])
+        return docs if candidates is None else docs & candidates
+    if kind == "phrase":
+        docs = candidates
+        for lemma in sorted(node[1], key=index.doc_freq):
+            docs = _evaluate(("term", [lemma]), index, docs)
+            if not docs:
+                return set()
+        return index.phrase_doc_ids(node[1], docs)
+    if kind == "field":
+        docs = candidates
+        for lemma in node[2]:
+            matched = index.field_doc_ids(node[1], lemma)
+            docs = matched if docs is None else docs & matched
+            if not docs:
+                return set()
+        return docs
+    if kind == "not":
+        base = candidates if candidates is not None else index.all_doc_ids()
+        return base - _evaluate(node[1], index, base)
+    if kind == "or":
+        out = set()
+        for child in node[1]:
+            out |= _evaluate(child, index, candidates)
+        return out
+    # AND: сначала самые короткие списки, каждый следующий проверяется только
+    # на уже найденных документах; отрицания вычитаются в конце
+    positives = sorted((n for n in node[1] if n[0] != "not"), key=lambda n: _estimate(n, index))
+    negatives = [n[1] for n in node[1] if n[0] == "not"]
+    docs = candidates
+    for child in positives:
+        docs = _evaluate(child, index, docs)
+        if not docs:
+            return set()
+    if docs is None:
+        docs = index.all_doc_ids()
+    for child in negatives:
+        if not docs:
+            break
+        docs = docs - _evaluate(child, index, docs)
+    return docs
+
+def _positive_terms(node, out):
+    """Термины из неотрицаемых условий запроса — по ним ранжируется результат."""
+    kind = node[0]
+    if kind == "term":
+        out.update(node[1])
+    elif kind == "prefix":
+        out.add(node[1])
+    elif kind == "phrase":
+        out.update(node[1])
+    elif kind == "field":
+        out.update(node[2])
+    elif kind in ("and", "or"):
+        for child in node[1]:
+            _positive_terms(child, out)
+    return out
+
+def _keyword_scores(index, query, fuzz_threshold=90):
+    """
+    BM25-оценки документов по запросу.
+    Запрос с операторами, фразами или условиями по полям сначала вычисляется
+    по постингам (parse_query/_evaluate), а затем найденные кадры ранжируются
+    по его неотрицаемым терминам; обычный запрос — любой из терминов.
+
+    Returns:
+        dict: {doc id: оценка}
+    """
+    if index.postings_external:
+        if not has_query_syntax(query):
+            # Кандидаты и оценки — из FTS5 (bm25), без постингов в памяти
+            store = get_index_store()
+            if store is not None:
+                scores = {}
+                for score, path in store.search_scored(expand_synonyms(normalize_text(query))):
+                    doc_id = index.doc_id(path)
+                    if doc_id is not None:
+                        scores[doc_id] = score
+                return scores
+        full = _postings_index(index)
+        scores = {}
+        for doc_id, score in _keyword_scores(full, query, fuzz_threshold).items():
+            own = index.doc_id(full.path(doc_id))
+            if own is not None:
+                scores[own] = score
+        return scores
+    weights, k1, b = _ranking_params()
+    boosts = _field_boosts()
+    if not has_query_syntax(query):
+        terms = expand_synonyms(normalize_text(query))
+        return index.score_ids(terms, weights, fuzz_threshold=fuzz_threshold, k1=k1, b=b,
+                               field_boosts=boosts)
+    tree = parse_query(query)
+    if tree is None:
+        return {}
+    allowed = _evaluate(tree, index)
+    if not allowed:
+        return {}
+    terms = _positive_terms(tree, set())
+    scores = index.score_ids(terms, weights, fuzz_threshold=fuzz_threshold, k1=k1, b=b,
+                             field_boosts=boosts) if terms else {}
+    return {d: scores.get(d, 0.0) for d in allowed}
 
-def smart_keyword_search(query, fuzz_threshold=90, min_score=1):
+def get_tag_frequencies(prefix="", limit=50):
+    """Самые частые теги индекса (для облака тегов и подсказок): [(тег, число кадров)]."""
+    return _index.tag_frequencies(prefix, limit)
+
+_completer = PrefixCompleter(_completion_source, _lemmas)
+
+# Подсказки по словам начинаются со второй буквы: по одной букве подходит слишком много слов
+SUGGEST_MIN_CHARS = 2
+
+def suggest_completions(query, limit=8):
+    """
+    Подсказки для последнего слова запроса (для выпадающего списка под полем поиска).
+    После префикса tag: подсказываются теги из таблицы частот.
+
+    Args:
+        query (str): Текущий текст поля поиска
+        limit (int): Максимальное количество подсказок
+
+    Returns:
+        list: Пары (запрос с дополненным последним словом, число кадров)
+    """
+    if not query or query[-1].isspace():
+        return []
+    head, _, last = query.rpartition(" ")
+    head = head + " " if head else ""
+    field, sep, value = last.partition(":")
+    if sep and FIELD_PREFIXES.get(field.lower()) == "tags":
+        value = value.strip('"')
+        return [
+            (f'{head}{field}:"{tag}"' if " " in tag else f"{head}{field}:{tag}", n)
+            for tag, n in _index.tag_frequencies(value, limit)
+        ]
+    if len(last) < SUGGEST_MIN_CHARS:
+        return []
+    return [(head + word, n) for word, n in _completer.complete(last, limit)]
+
+def smart_keyword_search(query, fuzz_threshold=90, min_score=0.0):
+    """
+    Ранжированный поиск по ключевым словам (BM25 с весами уровней совпадения
+    и полей). Поддерживает язык запросов: AND/OR/NOT, "фразы", скобки,
+    условия по полям (tag:танк, source:parade) и префиксы (танк*).
+
+    Returns:
+        RankedResults: Ленивая последовательность путей по убыванию релевантности
+    """
     if not query.strip():
-        return list(_index.keys())
-    terms = normalize_text(query)
-    terms = expand_synonyms(terms)
-    results = []
-    for p, (text, norm) in _index.items():
-        score = 0
-        for t in terms:
-            for n in norm:
-                # 1. Точное совпадение или морфология
-                if t == n:
-                    score += 3
-                # 2. Совпадение по началу слова
-                elif n.startswith(t) or t.startswith(n):
-                    score += 2
-                # 3. Фаззи-поиск (опечатки)
-                elif rapidfuzz.fuzz.ratio(t, n) >= fuzz_threshold:
-                    score += 1
-        if score >= min_score:
-            results.append((score, p))
-    results.sort(reverse=True)
-    return [p for score, p in results]
+        return IndexOrderCursor(_index)
+    index = _index
+    pool = None
+    if not (has_query_syntax(query) or index.postings_external):
+        pool = get_shard_pool()
+    if pool is not None:
+        terms = expand_synonyms(normalize_text(query))
+        weights, k1, b = _ranking_params()
+        answer = pool.score(terms, weights, fuzz_threshold, k1, b, _field_boosts(),
+                            index.generation, min_score)
+        if answer is not None:
+            top, total = answer
+            logger.info(f"Ранжирование на {pool.shards} шардах: {total} совпадений, лучшие {len(top)}")
+            # Шарды возвращают только top-k; дальние страницы ранжируются локально
+            # (с теми же глобальными статистиками, поэтому порядок совпадает)
+            return TopKResults(top, total, lambda: _rank_locally(index, query, fuzz_threshold, min_score))
+    return _rank_locally(index, query, fuzz_threshold, min_score)
+
+def _rank_locally(index, query, fuzz_threshold, min_score):
+    scores = _keyword_scores(index, query, fuzz_threshold)
+    return RankedResults((s, index.path(d)) for d, s in scores.items() if s >= min_score)
 
 def enable_smart_search():
     pass
@@ -217,31 +1094,318 @@ def disable_smart_search():
     _smart_model = None
     gc.collect()
 
-def smart_search(query, top_k=50, force=False):
+def _smart_candidates(query, k, settings):
+    """
+    Первый этап smart-поиска: до k кандидатов локально, без обращения к LLM.
+    Берутся лучшие по BM25 и, если включены, ближайшие по векторам описаний
+    (Mistral embeddings или LSA); списки сливаются поочерёдно, без повторов.
+
+    Returns:
+        list: Пути кандидатов по убыванию релевантности
+    """
+    lists = [list(smart_keyword_search(query)[:k])]
+    if settings.get("embedding_search_enabled", False):
+        hits = embedding_search(query, k)
+        if hits:
+            lists.append([path for _, path in hits])
+    elif settings.get("semantic_search_enabled", False):
+        lists.append(list(semantic_search(query, k)[:k]))
+    candidates = []
+    seen = set()
+    for group in itertools.zip_longest(*lists):
+        for path in group:
+            if path is not None and path not in seen:
+                seen.add(path)
+                candidates.append(path)
+    return candidates[:k]
+
+def _candidate_chunks(paths, index=None):
+    """Чанки индекса ({путь: [текст]}) только из кандидатов — в формате, который ждёт parallel_rank_frames."""
+    index = index or _index
+    paths = list(paths)
+    settings = load_settings()
+    texts = {}
+    store = get_index_store(settings) if index.postings_external else None
+    if store is not None:
+        # Тексты только найденных кадров, одним запросом на пачку
+        texts = store.get_texts(paths)
+    missing = [p for p in paths if p not in texts]
+    texts.update(zip(missing, index.texts(missing, settings=settings)))
+    chunk = {}
+    for path in paths:
+        chunk[path] = [texts[path]]
+        if len(chunk) >= BLOCKS_PER_FILE:
+            yield chunk
+            chunk = {}
+    if chunk:
+        yield chunk
+
+def smart_search(query, top_k=50, force=False, on_batch=None, cancel_event=None):
+    """
+    Поиск с ранжированием нейросетью в два этапа: локальный отбор
+    smart_candidates_k кандидатов (BM25 и векторы описаний), затем
+    переранжирование только этих кандидатов в Mistral — один-два запроса
+    вместо запроса на каждый чанк библиотеки. Если локально ничего не нашлось,
+    нейросети отправляется весь индекс (smart_full_scan_fallback).
+
+    Args:
+        on_batch (callable): Получает новые найденные пути по мере ответов нейросети
+        cancel_event (threading.Event): Отмена — новые запросы к API не отправляются
+
+    Returns:
+        list: Пути подходящих кадров
+    """
     logger.info("Smart search called: query=%r, force=%s", query, force)
-    if not (force or load_settings().get("smart_search_enabled", False)):
+    settings = load_settings()
+    if not (force or settings.get("smart_search_enabled", False)):
         return []
     if not force:
         return []
 
-    if not list(CACHE_DIR.glob("index_*.json")):
-        _index = build_index()
-        save_index_chunks(_index)
+    allowed = None
+    k = settings.get("smart_candidates_k", 200)
+    if k:
+        candidates = _smart_candidates(query, k, settings)
+        logger.info(f"Кандидатов для переранжирования: {len(candidates)}")
+        if not settings.get("smart_llm_rerank", True):
+            if on_batch is not None and candidates:
+                on_batch(candidates)
+            return candidates
+        if candidates or not settings.get("smart_full_scan_fallback", True):
+            if not candidates:
+                return []
+            allowed = set(candidates)
+            index_chunks = list(_candidate_chunks(candidates))
+        else:
+            logger.info("Локальных кандидатов нет, переранжируем весь индекс")
 
-    index_chunks = []
-    for file in sorted(CACHE_DIR.glob("index_*.json")):
-        try:
-            with open(file, "r", encoding="utf-8") as f:
-                part = json.load(f)
-                index_chunks.append(part)
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке {file}: {e}")
+    if allowed is None:
+        if not has_saved_index():
+            _index = build_index()
+            save_index_chunks(_index)
+        index_chunks = list(iter_index_chunks())
+
+    def progress(done, total, paths):
+        if on_batch is not None:
+            paths = [p for p in paths if allowed is None or p in allowed]
+            if paths:
+                on_batch(paths)
 
     try:
-        return parallel_rank_frames(query=query, list_of_indexes=index_chunks)
+        ranked = parallel_rank_frames(query=query, list_of_indexes=index_chunks, on_progress=progress,
+                                      cancel_event=cancel_event)
     except Exception:
         logger.exception("Ошибка в parallel_rank_frames")
         return []
+    if allowed is not None:
+        ranked = [path for path in ranked if path in allowed]
+    return list(dict.fromkeys(ranked))
+
+def build_semantic_index(index=None, refit=False):
+    """
+    Строит векторы описаний для поколения индекса и сохраняет их в Cache/semantic.
+    Обученная модель LSA переиспользуется: новые кадры проецируются в её
+    пространство, а переобучение происходит, только если доля лемм индекса,
+    неизвестных модели, превысила semantic_refit_ratio.
+
+    Args:
+        index (SearchIndex): Индекс; по умолчанию текущий
+        refit (bool): Обучить модель заново
+
+    Returns:
+        SemanticIndex | None: Построенный индекс или None, если NumPy недоступен
+    """
+    global _semantic
+    try:
+        from modules.semantic_index import SemanticIndex, DEFAULT_DIM
+    except ImportError:
+        logger.warning("NumPy не установлен — семантический поиск недоступен")
+        return None
+    index = _postings_index(index or _index)
+    settings = load_settings()
+    dim = settings.get("semantic_dim", DEFAULT_DIM)
+    with _semantic_lock:
+        if not refit and _semantic is not None and _semantic.generation == index.generation:
+            return _semantic
+        previous = _semantic or SemanticIndex.load()
+        model = None if refit or previous is None else previous.model
+        if model is not None and model.dim != dim:
+            model = None
+        if model is not None:
+            vocabulary = index.vocabulary()
+            unknown = sum(1 for lemma in vocabulary if lemma not in model.columns)
+            if vocabulary and unknown / len(vocabulary) > settings.get("semantic_refit_ratio", 0.2):
+                logger.info(f"Модель LSA устарела ({unknown} новых лемм из {len(vocabulary)}), переобучаем")
+                model = None
+        _semantic = SemanticIndex.build(index, dim=dim, model=model)
+        _semantic.save()
+        _update_ann(_semantic, settings)
+        return _semantic
+
+def _update_ann(semantic, settings):
+    """
+    Обновляет приближённый индекс (IVF) под новые векторы.
+    Кластеры обучаются один раз и переиспользуются: кодируются только
+    новые и изменившиеся векторы. Переобучение — при смене модели LSA,
+    типа квантования или числа кластеров. Вызывается под _semantic_lock.
+    """
+    global _ann
+    if not settings.get("ann_enabled", True) or len(semantic) < settings.get("ann_min_vectors", 50000):
+        _ann = None
+        return
+    from modules.ann_index import IVFIndex
+    quantization = settings.get("ann_quantization", "int8")
+    nlist = settings.get("ann_nlist", 0)
+    previous = _ann or IVFIndex.load()
+    if (previous is None or previous.dim != semantic.model.dim or previous.quantization != quantization
+            or (nlist and previous.nlist != nlist)):
+        started = time.perf_counter()
+        ann = IVFIndex.train(semantic.vectors, nlist=nlist, quantization=quantization)
+        logger.info(f"ANN-индекс обучен: {ann.nlist} кластеров, {quantization}, "
+                    f"за {time.perf_counter() - started:.2f} с")
+    else:
+        # Копия: текущий индекс продолжает обслуживать запросы, пока строится новый
+        ann = copy.copy(previous)
+    encoded = ann.update(semantic.paths, semantic.vectors, semantic.generation)
+    ann.save()
+    _ann = ann
+    logger.info(f"ANN-индекс обновлён: {len(ann)} векторов, закодировано заново {encoded}")
+
+def get_ann_index(semantic):
+    """ANN-индекс того же поколения, что и векторы, или None (тогда поиск полным перебором)."""
+    global _ann
+    try:
+        from modules.ann_index import IVFIndex
+    except ImportError:
+        return None
+    with _semantic_lock:
+        if _ann is None and len(semantic) >= load_settings().get("ann_min_vectors", 50000):
+            _ann = IVFIndex.load()
+        if _ann is not None and _ann.generation == semantic.generation:
+            return _ann
+    return None
+
+def get_semantic_index():
+    """Векторы текущего поколения индекса: из памяти, с диска или построенные заново."""
+    global _semantic
+    try:
+        from modules.semantic_index import SemanticIndex
+    except ImportError:
+        logger.warning("NumPy не установлен — семантический поиск недоступен")
+        return None
+    with _semantic_lock:
+        if _semantic is None:
+            _semantic = SemanticIndex.load()
+        if _semantic is not None and _semantic.generation == _index.generation:
+            return _semantic
+    return build_semantic_index(_index)
+
+def semantic_search(query, top_k=None):
+    """
+    Локальный семантический поиск: косинусная близость векторов LSA
+    запроса и описаний, без обращения к нейросети.
+
+    Returns:
+        RankedResults: Пути кадров по убыванию близости
+    """
+    semantic = get_semantic_index()
+    if semantic is None:
+        return ListCursor()
+    settings = load_settings()
+    top_k = top_k or settings.get("semantic_top_k", 200)
+    tokens = sorted(expand_synonyms(set(normalize_tokens(query))))
+    ann = get_ann_index(semantic) if settings.get("ann_enabled", True) else None
+    hits = semantic.search(tokens, top_k, settings.get("semantic_min_similarity", 0.1), ann=ann,
+                           nprobe=settings.get("ann_nprobe", 16), rerank=settings.get("ann_rerank", 4))
+    return RankedResults(hits)
+
+def _embedding_function(settings):
+    """Функция векторизации пачки текстов; ключи API чередуются по кругу."""
+    keys = settings.get("api_keys", [])
+    if not keys:
+        return None
+    model = settings.get("embedding_model", EMBED_MODEL)
+
+    def embed(texts):
+        key = keys[next(_embedding_key_counter) % len(keys)]
+        return request_embeddings(key, texts, model=model)
+    return embed
+
+def sync_description_embeddings(index_data=None, generation=None):
+    """
+    Векторизует описания кадров через Mistral embeddings и сохраняет векторы
+    в Cache/embeddings. Запрашиваются только новые и изменившиеся описания.
+
+    Args:
+        index_data (dict): {путь: (текст, леммы, метаданные)}; по умолчанию текущий индекс
+        generation (int): Поколение индекса
+
+    Returns:
+        EmbeddingIndex | None: Векторы или None, если векторизация недоступна
+    """
+    global _embeddings
+    try:
+        from modules.embedding_index import EmbeddingIndex
+    except ImportError:
+        logger.warning("NumPy не установлен — поиск по векторам Mistral недоступен")
+        return None
+    settings = load_settings()
+    embed = _embedding_function(settings)
+    if embed is None:
+        logger.warning("Нет API-ключей для векторизации описаний")
+        return None
+    if index_data is None:
+        index = _index
+        paths = list(index)
+        texts = dict(zip(paths, index.texts(paths, settings=settings)))
+        generation = index.generation
+    else:
+        texts = {path: data[0] for path, data in index_data.items()}
+    with _embeddings_lock:
+        current = _embeddings or EmbeddingIndex.load() or EmbeddingIndex()
+        updated, stats = current.sync(
+            texts, embed,
+            model=settings.get("embedding_model", EMBED_MODEL),
+            batch_size=settings.get("embedding_batch_size", 64),
+            workers=len(settings.get("api_keys", [])),
+            generation=generation,
+        )
+        if stats["embedded"] or stats["removed"] or updated.generation != current.generation:
+            updated.save()
+        _embeddings = updated
+        return updated
+
+def get_embedding_index():
+    global _embeddings
+    try:
+        from modules.embedding_index import EmbeddingIndex
+    except ImportError:
+        return None
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = EmbeddingIndex.load()
+        return _embeddings
+
+def embedding_search(query, top_k=50):
+    """
+    Поиск по заранее полученным векторам описаний: один запрос embeddings
+    для текста запроса и локальный top-k.
+
+    Returns:
+        list | None: Пары (близость, путь) по убыванию близости или None,
+            если векторов нет или запрос не удался (тогда работает обычный smart-поиск)
+    """
+    embeddings = get_embedding_index()
+    if embeddings is None or not len(embeddings):
+        return None
+    settings = load_settings()
+    embed = _embedding_function(settings)
+    if embed is None:
+        return None
+    vectors = embed([query])
+    if not vectors:
+        return None
+    return embeddings.search(vectors[0], top_k, settings.get("embedding_min_similarity", 0.0))
 
 def start_search_monitoring(thumbnails_dir="thumbnails"):
     global _search_thread, _last_files, _index
@@ -255,22 +1419,22 @@ def start_search_monitoring(thumbnails_dir="thumbnails"):
     if _search_thread and _search_thread.is_alive():
         return
         
-    load_index()
+    load_index(thumbnails_dir)
     _last_files = {
         os.path.join(dp, f)
         for dp, _, fs in os.walk(thumbnails_dir)
-        for f in fs if f.lower().endswith((".webp", "_pixtral.json"))
+        for f in fs if f.lower().endswith((".webp", "_pixtral.json", SUMMARY_SUFFIX))
     }
     _stop_event.clear()
 
     def monitor():
-        global _index, _last_files
+        global _last_files
         while not _stop_event.is_set():
             try:
                 curr = {
                     os.path.join(dp, f)
                     for dp, _, fs in os.walk(thumbnails_dir)
-                    for f in fs if f.lower().endswith((".webp", "_pixtral.json"))
+                    for f in fs if f.lower().endswith((".webp", "_pixtral.json", SUMMARY_SUFFIX))
                 }
                 
                 # Проверяем изменения в файлах
@@ -295,10 +1459,9 @@ def start_search_monitoring(thumbnails_dir="thumbnails"):
                 
                 if needs_rebuild:
                     logger.info("Обнаружены изменения, перестраиваем индекс")
-                    _index = build_index(thumbnails_dir)
-                    save_index_chunks(_index)
+                    index, timings = rebuild_index(thumbnails_dir)
                     _last_files = curr
-                    logger.info(f"Индекс перестроен, содержит {len(_index)} элементов")
+                    logger.info(f"Индекс перестроен, содержит {len(index)} элементов")
             except Exception as e:
                 logger.error(f"Ошибка в мониторинге: {e}")
             time.sleep(2)  # Уменьшаем интервал проверки до 2 секунд
@@ -308,59 +1471,466 @@ def start_search_monitoring(thumbnails_dir="thumbnails"):
 
 def stop_search_monitoring():
     _stop_event.set()
+    _lemmas.flush()
     disable_smart_search()
+    with _shard_lock:
+        if _shard_pool is not None:
+            _shard_pool.stop()
 
-def very_smart_filter(paths, query):
+def very_smart_filter(paths, query, on_match=None, cancel_event=None, max_matches=None):
+    """
+    Проверяет кандидатов по изображениям (Pixtral, да/нет). Вердикты берутся
+    из постоянного кэша одним запросом до проверки; к API уходят только кадры
+    без вердикта, и каждый полученный вердикт сразу записывается в кэш.
 
-    
-    from modules.pixtral_api import PixtralAPI
+    Непроверенные кадры делятся на пакеты и кладутся в общую очередь в порядке
+    ранжирования: по одному потоку на ключ, каждый поток берёт следующий пакет,
+    как только освободится, поэтому медленный ключ не задерживает остальные,
+    а лучшие кандидаты проверяются первыми.
+
+    Args:
+        paths (list): Кандидаты в порядке убывания релевантности
+        query (str): Поисковый запрос
+        on_match (callable): Вызывается с путём каждого подтверждённого кадра сразу
+        cancel_event (threading.Event): Отмена — оставшиеся кадры не проверяются
+        max_matches (int): Остановиться после стольких подтверждённых кадров
+            (уже отправленные запросы дополняют результат); по умолчанию —
+            very_smart_max_matches из настроек, 0 — проверять всех
+
+    Returns:
+        list: Подтверждённые пути в порядке ранжирования
+    """
+    from modules.pixtral_api import (
+        PixtralAPI, PIXTRAL_MODEL, DEFAULT_VERIFY_BATCH, DEFAULT_VERIFY_IMAGE_SIZE, get_verdict_cache,
+    )
     settings = load_settings()
     thumbs = settings.get("thumbnails_folder", "thumbnails")
     keys = settings.get("api_keys", [])
+    if max_matches is None:
+        max_matches = settings.get("very_smart_max_matches", 0)
+    # Кадров в одном запросе (1 — по одному кадру) и размер уменьшенного кадра
+    batch_size = max(1, int(settings.get("verify_batch_size", DEFAULT_VERIFY_BATCH)))
+    max_side = settings.get("verify_image_size", DEFAULT_VERIFY_IMAGE_SIZE)
+    interval = settings.get("mistral_key_interval", 1.1)
+    max_attempts = settings.get("max_chunk_attempts", 3)
     logger.info(f"[Pixtral] very_smart_filter запущен: {len(paths)} путей, запрос: '{query}'")
-    chunks = [paths[i::len(keys)] for i in range(len(keys))]
-    logger.info(f"[Pixtral] Распараллелено на {len(chunks)} чанков (по ключам)")    
-    cache_path = "very_smart_cache.json"
-    cache = json.load(open(cache_path, "r", encoding="utf-8")) if os.path.exists(cache_path) else {}
+    cache = get_verdict_cache(settings)
+    rank = {p: position for position, p in enumerate(dict.fromkeys(paths))}
+
     out = []
     lock = threading.Lock()
-    threads = []
-
-    chunks = [paths[i::len(keys)] for i in range(len(keys))]
-
-    for i, chunk in enumerate(chunks):
-        def worker(sublist):
-            pix = PixtralAPI()
-            local_out = []
-            for p in sublist:
-                key_cache = f"{query}|{p}"
-                if cache.get(key_cache) == "yes":
-                    local_out.append(p)
-                    continue
-                full = os.path.join(thumbs, p)
-                if not os.path.exists(full):
-                    cache[key_cache] = "no"
-                    continue
-                try:
-                    ok = pix.ask_yes_no(full, query)
-                    cache[key_cache] = "yes" if ok else "no"
-                    if ok:
-                        local_out.append(p)
-                except Exception as e:
-                    logger.error("Pixtral error: %s", e)
+    stop = threading.Event()
+
+    def confirm(p):
+        with lock:
+            out.append(p)
+            if max_matches and len(out) >= max_matches:
+                stop.set()
+        if on_match is not None:
+            on_match(p)
+
+    pending = []
+    cache_keys = {}
+    for p in rank:
+        digest = frame_digest(os.path.join(thumbs, p))
+        if digest is None:
+            continue
+        cache_keys[p] = verdict_key(query, digest, PIXTRAL_MODEL)
+    known = cache.get_many(cache_keys.values()) if cache is not None else {}
+    for p, key in cache_keys.items():
+        verdict = known.get(key)
+        if verdict is None:
+            pending.append(p)
+        elif verdict and not stop.is_set():
+            confirm(p)
+    logger.info(f"[Pixtral] Из кэша: {len(known)} вердиктов ({len(out)} да), к проверке {len(pending)}")
+
+    if pending and not keys:
+        logger.error("[Pixtral] Нет API-ключей: кадры без вердикта в кэше не проверены")
+        pending = []
+
+    # (ранг первого кадра пакета в исходном списке, попытка, пакет): пакет,
+    # возвращённый после ошибки API, сохраняет свой приоритет
+    tasks = queue.PriorityQueue()
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        tasks.put((rank[batch[0]], 1, batch))
+    state = {"requests": 0, "failed": 0}
+    started = time.perf_counter()
+
+    def finished():
+        return stop.is_set() or (cancel_event is not None and cancel_event.is_set())
+
+    def worker(api_key):
+        pix = PixtralAPI([api_key])
+        next_allowed = 0.0
+        while not finished():
+            try:
+                position, attempt, batch = tasks.get_nowait()
+            except queue.Empty:
+                return
+            wait = next_allowed - time.monotonic()
+            if wait > 0:
+                if cancel_event is not None:
+                    if cancel_event.wait(wait):
+                        return
+                else:
+                    time.sleep(wait)
+                if finished():
+                    return
+            next_allowed = time.monotonic() + interval
+            try:
+                if len(batch) == 1:
+                    verdicts = [pix.ask_yes_no(os.path.join(thumbs, batch[0]), query)]
+                else:
+                    verdicts = pix.ask_yes_no_batch([os.path.join(thumbs, p) for p in batch], query, max_side)
+            except Exception as e:
+                logger.error("Pixtral error: %s", e)
+                verdicts = [None] * len(batch)
             with lock:
-                out.extend(local_out)
-        t = threading.Thread(target=worker, args=(chunk,))
-        t.start()
-        threads.append(t)
-        time.sleep(1.1)
+                state["requests"] += 1
+            # Ошибка API — не вердикт: кадры возвращаются в очередь (их может
+            # взять другой ключ), после max_chunk_attempts — до следующего поиска
+            retry = [p for p, ok in zip(batch, verdicts) if ok is None]
+            if retry:
+                if attempt < max_attempts:
+                    tasks.put((rank[retry[0]], attempt + 1, retry))
+                else:
+                    with lock:
+                        state["failed"] += len(retry)
+            for p, ok in zip(batch, verdicts):
+                if ok is None:
+                    continue
+                if cache is not None:
+                    cache.put(cache_keys[p], ok)
+                if ok:
+                    confirm(p)
 
+    threads = [threading.Thread(target=worker, args=(key,), daemon=True) for key in keys[:tasks.qsize()]]
+    for t in threads:
+        t.start()
     for t in threads:
         t.join()
-    logger.info(f"[Pixtral] Завершено: {len(out)} релевантных кадров найдено")
 
-    json.dump(cache, open(cache_path, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
-    return out
+    logger.info(
+        "[Pixtral] Проверка%s: %d кадров к проверке, %d запросов, %d ключей, не удалось %d, "
+        "найдено %d, %.1f с",
+        " остановлена" if finished() else "", len(pending), state["requests"], len(threads),
+        state["failed"], len(out), time.perf_counter() - started,
+    )
+    return sorted(out, key=rank.get)
+
+def parse_timecode(value):
+    """
+    Переводит таймкод в секунды: "ММ:СС", "ЧЧ:ММ:СС" или "ЧЧ:ММ:СС:КК"
+    (кадры отбрасываются). Числа возвращаются как есть, пустое значение — None.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    parts = [float(p) for p in str(value).strip().split(":")]
+    if len(parts) == 4:
+        parts = parts[:3]
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+_favorite_facets = {"key": None, "facets": {}}
+_favorite_facets_lock = threading.Lock()
+
+def get_favorite_facets(index=None, favorites_file="favorites.json", thumbnails_dir="thumbnails"):
+    """
+    Фасет категорий избранного: {категория: отсортированный массив doc id}.
+    Пересчитывается только при смене поколения индекса или изменении файла избранного.
+    """
+    from modules.favorites_manager import FavoritesManager
+    index = index or _index
+    try:
+        mtime = os.path.getmtime(favorites_file)
+    except OSError:
+        mtime = None
+    key = (index.generation, id(index), mtime)
+    with _favorite_facets_lock:
+        if _favorite_facets["key"] == key:
+            return _favorite_facets["facets"]
+        facets = {}
+        base = os.path.abspath(thumbnails_dir)
+        for path, data in FavoritesManager(favorites_file).get_favorites().items():
+            doc_id = index.doc_id(os.path.relpath(os.path.abspath(path), base))
+            if doc_id is None:
+                continue
+            for category in data.get("categories", []):
+                facets.setdefault(category, []).append(doc_id)
+        facets = {"category": {c: sorted(ids) for c, ids in facets.items()}}
+        _favorite_facets["key"] = key
+        _favorite_facets["facets"] = facets
+        return facets
+
+def faceted_search(query, filters=None, mode="keyword"):
+    """
+    Поиск с фильтрами по фасетам и подсчётом значений для панели фильтров.
+
+    Args:
+        query (str): Поисковый запрос (пустой — все кадры)
+        filters (dict): {"source": [...], "folder": [...], "category": [...],
+            "position": ("00:10", "00:20"), "processed": (от, до) в секундах epoch}
+        mode (str): Режим поиска, см. get_search_mode
+
+    Returns:
+        tuple: (ResultCursor, dict со счётчиками фасетов). Счётчики для каждого
+            фасета считаются без учёта фильтра по этому же фасету.
+    """
+    index = _index
+    filters = dict(filters or {})
+    if "position" in filters and filters["position"]:
+        low, high = filters["position"]
+        filters["position"] = (parse_timecode(low), parse_timecode(high))
+    extra = get_favorite_facets(index)
+
+    # Совпадения по тексту (doc id -> оценка); None — запроса нет, подходят все кадры
+    scores = None
+    if query.strip():
+        if mode == "keyword":
+            scores = _keyword_scores(index, query)
+        else:
+            matched = run_search(query, mode)
+            scores = {}
+            for rank, path in enumerate(matched):
+                doc_id = index.doc_id(path)
+                if doc_id is not None:
+                    scores[doc_id] = float(len(matched) - rank)
+    matched_ids = None if scores is None else set(scores)
+
+    allowed = index.filter_doc_ids(filters, extra)
+    if matched_ids is None:
+        result_ids = allowed
+    elif allowed is None:
+        result_ids = matched_ids
+    else:
+        result_ids = matched_ids & allowed
+
+    if scores is None:
+        cursor = IndexOrderCursor(index) if result_ids is None else DocIdCursor(index, result_ids)
+    else:
+        cursor = RankedResults((scores[d], index.path(d)) for d in result_ids)
+
+    # Фасеты без собственного фильтра считаются по одному набору (allowed) —
+    # одним проходом; отдельный проход нужен только фасетам с активным фильтром
+    order = list(FACETS) + list(extra) + list(RANGE_FIELDS)
+    groups = {}
+    for facet in order:
+        active = filters.get(facet) not in (None, "", [], ())
+        groups.setdefault(facet if active else None, []).append(facet)
+    counts = {}
+    for skip, facets in groups.items():
+        others = allowed if skip is None else index.filter_doc_ids(filters, extra, skip=skip)
+        if matched_ids is None:
+            base = others
+        elif others is None:
+            base = matched_ids
+        else:
+            base = matched_ids & others
+        counts.update(index.facet_counts(base, extra, facets))
+    return cursor, {facet: counts[facet] for facet in order}
+
+SEARCH_MODES = ("keyword", "smart", "very_smart", "semantic")
+
+def get_search_mode(settings=None):
+    """Режим поиска по настройкам: "keyword", "smart", "very_smart" или "semantic"."""
+    settings = settings or load_settings()
+    if settings.get("very_smart_enabled", False):
+        return "very_smart"
+    if settings.get("smart_search_enabled", False):
+        return "smart"
+    if settings.get("semantic_search_enabled", False):
+        return "semantic"
+    return "keyword"
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class SearchResultCache:
+    """
+    Общий LRU-кэш результатов поиска.
+    Ключ — (нормализованный запрос, режим поиска, поколение индекса), поэтому
+    любое перестроение индекса (даже без изменения числа кадров) автоматически
+    делает старые записи недостижимыми; они вытесняются при смене поколения.
+    """
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            max_entries (int): Максимальное число запросов в кэше
+            max_bytes (int): Примерный предел занимаемой памяти
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop(self, key):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _check_generation(self, generation):
+        if generation != self._generation:
+            for key in [k for k in self._entries if k[2] != generation]:
+                self._drop(key)
+            self._generation = generation
+
+    def get(self, key):
+        with self._lock:
+            self._check_generation(key[2])
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, results):
+        size = results.approx_bytes()
+        with self._lock:
+            self._check_generation(key[2])
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (results, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+_default_settings = load_settings()
+_result_cache = SearchResultCache(
+    max_entries=_default_settings.get("search_cache_entries", 256),
+    max_bytes=_default_settings.get("search_cache_mb", 64) * 1024 * 1024,
+)
+
+def get_search_cache_stats():
+    return _result_cache.stats()
+
+def run_search(query, mode=None):
+    """
+    Единая точка входа поиска для интерфейса с кэшированием результатов.
+
+    Args:
+        query (str): Поисковый запрос
+        mode (str): "keyword", "smart", "very_smart" или "semantic"; по умолчанию — из настроек
+
+    Returns:
+        ResultCursor: Курсор по путям найденных кадров; пустой запрос —
+            все кадры в порядке видео и таймкода, обычный поиск — по релевантности
+    """
+    query = query.strip()
+    if not query:
+        return IndexOrderCursor(_index)
+    mode = mode or get_search_mode()
+    key = (normalize_query(query), mode, _index.generation)
+    cached = _result_cache.get(key)
+    if cached is not None:
+        logger.info(f"Используем кэшированный результат для запроса: '{query}' ({mode})")
+        return cached
+
+    if mode == "very_smart":
+        candidates = smart_search(query, force=True)
+        logger.info(f"Кандидатов от smart_search: {len(candidates)}")
+        results = ListCursor(very_smart_filter(candidates, query))
+    elif mode == "smart":
+        results = ListCursor(smart_search(query, force=True))
+    elif mode == "semantic":
+        results = semantic_search(query)
+    else:
+        results = smart_keyword_search(query)
+
+    # Пустой ответ нейросети чаще означает сбой API, чем отсутствие совпадений
+    if results or mode in ("keyword", "semantic"):
+        _result_cache.put(key, results)
+    return results
+
+def run_search_stream(query, on_results, mode=None, cancel_event=None):
+    """
+    Поиск с выдачей результатов по мере поступления. В режимах smart и very_smart
+    курсор пополняется после каждого ответа нейросети (чанка ранжирования или
+    подтверждённого кадра), остальные режимы отдают результат сразу целиком.
+
+    Args:
+        query (str): Поисковый запрос
+        on_results (callable): Вызывается с аргументами (курсор, поиск завершён);
+            курсор один и тот же: растёт по мере ответов, а по завершении
+            упорядочивается так же, как результат run_search
+        mode (str): Режим поиска; по умолчанию — из настроек
+        cancel_event (threading.Event): Отмена (например, пользователь изменил запрос):
+            новые запросы к API не отправляются, on_results больше не вызывается
+
+    Returns:
+        ResultCursor: Итоговый курсор
+    """
+    mode = mode or get_search_mode()
+    query = query.strip()
+    key = (normalize_query(query), mode, _index.generation)
+    cached = _result_cache.get(key) if query else None
+    if not query or mode not in ("smart", "very_smart") or cached is not None:
+        results = cached if cached is not None else run_search(query, mode)
+        on_results(results, True)
+        return results
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    cursor = GrowingCursor()
+
+    def emit(paths):
+        if cursor.extend(paths) and not cancelled():
+            on_results(cursor, False)
+
+    if mode == "smart":
+        ranked = smart_search(query, force=True, on_batch=emit, cancel_event=cancel_event)
+    else:
+        ranked = []
+        candidates = smart_search(query, force=True, cancel_event=cancel_event)
+        logger.info(f"Кандидатов от smart_search: {len(candidates)}")
+        if candidates and not cancelled():
+            ranked = very_smart_filter(candidates, query, on_match=lambda p: emit([p]),
+                                       cancel_event=cancel_event)
+    # Частичные результаты приходят в порядке ответов; итог (и кэш) — в том же
+    # порядке, что и у run_search
+    cursor.finish(ranked)
+    if cancelled():
+        logger.info(f"Поиск отменён: '{query}' ({mode}), успело прийти {len(cursor)}")
+        return cursor
+    # Пустой ответ нейросети чаще означает сбой API, чем отсутствие совпадений
+    if len(cursor):
+        _result_cache.put(key, cursor)
+    on_results(cursor, True)
+    return cursor
 
 def get_current_index():
     return _index
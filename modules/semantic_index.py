@@ -0,0 +1,313 @@
+"""
+Модуль локального семантического поиска (без обращения к нейросети).
+Описания кадров представляются плотными векторами методом латентно-семантического
+анализа: TF-IDF по леммам, сжатый усечённым SVD (рандомизированный алгоритм на NumPy).
+Векторы хранятся на диске матрицей float32, запрос сравнивается со всеми кадрами
+одним матричным умножением (косинусная близость), а на больших корпусах —
+через приближённый индекс modules.ann_index.
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_DIR = Path("Cache") / "semantic"
+
+# Размерность векторов и объём выборки для обучения SVD
+DEFAULT_DIM = 128
+DEFAULT_FIT_SAMPLE = 20000
+
+# Сколько строк разреженной матрицы обрабатывать за раз (ограничивает пиковую память)
+_BLOCK_ROWS = 4096
+
+
+def _tfidf_rows(token_lists, columns, idf):
+    """
+    Разреженная матрица TF-IDF в формате CSR (сублинейный tf, строки нормированы).
+    Леммы, которых нет в columns, пропускаются.
+
+    Returns:
+        tuple: (indptr, indices, data)
+    """
+    indptr = [0]
+    indices = []
+    data = []
+    for tokens in token_lists:
+        counts = {}
+        for lemma in tokens:
+            col = columns.get(lemma)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        weights = [(col, (1.0 + math.log(tf)) * idf[col]) for col, tf in counts.items()]
+        norm = math.sqrt(sum(w * w for _, w in weights)) or 1.0
+        for col, w in sorted(weights):
+            indices.append(col)
+            data.append(w / norm)
+        indptr.append(len(indices))
+    return (
+        np.asarray(indptr, dtype=np.int64),
+        np.asarray(indices, dtype=np.int64),
+        np.asarray(data, dtype=np.float32),
+    )
+
+
+def _csr_dot(csr, matrix):
+    """Произведение разреженной матрицы CSR на плотную: (n x V) @ (V x r)."""
+    indptr, indices, data = csr
+    n = len(indptr) - 1
+    out = np.zeros((n, matrix.shape[1]), dtype=np.float32)
+    for start in range(0, n, _BLOCK_ROWS):
+        stop = min(start + _BLOCK_ROWS, n)
+        lo, hi = indptr[start], indptr[stop]
+        if lo == hi:
+            continue
+        values = data[lo:hi, None] * matrix[indices[lo:hi]]
+        starts = indptr[start:stop] - lo
+        nonempty = indptr[start:stop] < indptr[start + 1:stop + 1]
+        out[start:stop][nonempty] = np.add.reduceat(values, starts[nonempty], axis=0)
+    return out
+
+
+def _csr_t_dot(csr, matrix, n_cols):
+    """Произведение транспонированной CSR-матрицы на плотную: (V x n) @ (n x r)."""
+    indptr, indices, data = csr
+    n = len(indptr) - 1
+    out = np.zeros((n_cols, matrix.shape[1]), dtype=np.float32)
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    for start in range(0, n, _BLOCK_ROWS):
+        stop = min(start + _BLOCK_ROWS, n)
+        lo, hi = indptr[start], indptr[stop]
+        if lo == hi:
+            continue
+        order = np.argsort(indices[lo:hi], kind="stable")
+        cols = indices[lo:hi][order]
+        values = (data[lo:hi, None] * matrix[rows[lo:hi]])[order]
+        uniq, starts = np.unique(cols, return_index=True)
+        out[uniq] += np.add.reduceat(values, starts, axis=0)
+    return out
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class SemanticModel:
+    """
+    Модель LSA: словарь лемм, их idf и матрица проекции (леммы x размерность).
+    Обучается один раз на выборке описаний; новые кадры проецируются
+    в то же пространство без переобучения (леммы вне словаря модели игнорируются).
+    """
+    def __init__(self, vocabulary, idf, projection):
+        """
+        Args:
+            vocabulary (list): Леммы в порядке столбцов
+            idf (np.ndarray): idf каждой леммы
+            projection (np.ndarray): Матрица проекции V x dim (float32)
+        """
+        self.vocabulary = list(vocabulary)
+        self.columns = {lemma: col for col, lemma in enumerate(self.vocabulary)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.projection = np.asarray(projection, dtype=np.float32)
+
+    @property
+    def dim(self):
+        return self.projection.shape[1]
+
+    @classmethod
+    def fit(cls, token_lists, dim=DEFAULT_DIM, sample=DEFAULT_FIT_SAMPLE, power_iterations=2, seed=0):
+        """
+        Обучает модель рандомизированным усечённым SVD матрицы TF-IDF.
+
+        Args:
+            token_lists (list): Леммы документов
+            dim (int): Размерность векторов
+            sample (int): Максимальное число документов для обучения
+            power_iterations (int): Число степенных итераций (точность SVD)
+            seed (int): Зерно генератора случайных чисел
+
+        Returns:
+            SemanticModel: Обученная модель
+        """
+        rng = np.random.default_rng(seed)
+        if len(token_lists) > sample:
+            picked = rng.choice(len(token_lists), size=sample, replace=False)
+            token_lists = [token_lists[i] for i in sorted(picked)]
+        n = len(token_lists)
+        df = {}
+        for tokens in token_lists:
+            for lemma in set(tokens):
+                df[lemma] = df.get(lemma, 0) + 1
+        vocabulary = sorted(df)
+        idf = np.array([math.log((1 + n) / (1 + df[lemma])) + 1.0 for lemma in vocabulary], dtype=np.float32)
+        columns = {lemma: col for col, lemma in enumerate(vocabulary)}
+        csr = _tfidf_rows(token_lists, columns, idf)
+        n_cols = len(vocabulary)
+        dim = max(1, min(dim, n, n_cols))
+        rank = min(dim + 10, n, n_cols)
+
+        omega = rng.standard_normal((n_cols, rank)).astype(np.float32)
+        y = _csr_dot(csr, omega)
+        for _ in range(power_iterations):
+            q, _ = np.linalg.qr(y)
+            z, _ = np.linalg.qr(_csr_t_dot(csr, q, n_cols))
+            y = _csr_dot(csr, z)
+        q, _ = np.linalg.qr(y)
+        b = _csr_t_dot(csr, q, n_cols).T
+        _, _, vt = np.linalg.svd(b, full_matrices=False)
+        return cls(vocabulary, idf, vt[:dim].T)
+
+    def embed(self, token_lists):
+        """
+        Returns:
+            np.ndarray: Нормированные векторы документов (n x dim, float32);
+                документ без известных модели лемм даёт нулевой вектор
+        """
+        csr = _tfidf_rows(token_lists, self.columns, self.idf)
+        return _normalize_rows(_csr_dot(csr, self.projection))
+
+    def save(self, path):
+        tmp = Path(f"{path}.tmp.npz")
+        np.savez(tmp, vocabulary=np.array(self.vocabulary, dtype=str), idf=self.idf, projection=self.projection)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["vocabulary"].tolist(), data["idf"], data["projection"])
+
+
+class SemanticIndex:
+    """
+    Векторы описаний всех кадров одного поколения индекса.
+    Матрица читается с диска через memory map, поэтому загрузка мгновенная,
+    а в памяти оказываются только реально используемые страницы.
+    """
+    def __init__(self, model, paths, vectors, generation=0):
+        """
+        Args:
+            model (SemanticModel): Модель для векторизации запросов
+            paths (list): Пути кадров в порядке строк матрицы
+            vectors (np.ndarray): Матрица n x dim (float32)
+            generation (int): Поколение индекса, по которому построены векторы
+        """
+        self.model = model
+        self.paths = list(paths)
+        self.vectors = vectors
+        self.generation = generation
+        self._rows = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def build(cls, index, dim=DEFAULT_DIM, model=None):
+        """
+        Строит векторы для всех кадров SearchIndex.
+
+        Args:
+            index (SearchIndex): Текстовый индекс
+            dim (int): Размерность векторов (если модель обучается заново)
+            model (SemanticModel): Готовая модель; None — обучить на этом индексе
+
+        Returns:
+            SemanticIndex: Построенный индекс
+        """
+        started = time.perf_counter()
+        paths = list(index)
+        token_lists = [index.tokens(index.doc_id(p)) for p in paths]
+        if model is None:
+            model = SemanticModel.fit(token_lists, dim=dim)
+        vectors = model.embed(token_lists) if paths else np.zeros((0, model.dim), dtype=np.float32)
+        logger.info(
+            f"Семантические векторы построены: {len(paths)} кадров x {model.dim} "
+            f"за {time.perf_counter() - started:.2f} с"
+        )
+        return cls(model, paths, vectors, index.generation)
+
+    def save(self, directory=SEMANTIC_DIR):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.model.save(directory / "model.npz")
+        # Предыдущая матрица может быть открыта через memory map (в Windows её
+        # нельзя заменить), поэтому каждое сохранение пишет файл с новым именем
+        vectors_file = f"vectors_{uuid.uuid4().hex[:8]}.npy"
+        np.save(directory / vectors_file, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        tmp = directory / "index.tmp.json"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": self.generation, "dim": self.model.dim, "vectors": vectors_file,
+                       "paths": self.paths}, f, ensure_ascii=False)
+        os.replace(tmp, directory / "index.json")
+        for stale in directory.glob("vectors*.npy"):
+            if stale.name != vectors_file:
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, directory=SEMANTIC_DIR):
+        """
+        Returns:
+            SemanticIndex | None: Индекс с диска или None, если его нет
+        """
+        directory = Path(directory)
+        try:
+            with open(directory / "index.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            model = SemanticModel.load(directory / "model.npz")
+            vectors = np.load(directory / meta.get("vectors", "vectors.npy"), mmap_mode="r")
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"Семантический индекс не загружен: {e}")
+            return None
+        if len(vectors) != len(meta["paths"]):
+            logger.warning("Семантический индекс повреждён: число векторов не совпадает с числом кадров")
+            return None
+        return cls(model, meta["paths"], vectors, meta.get("generation", 0))
+
+    def vectors_for(self, paths):
+        """
+        Returns:
+            np.ndarray: Векторы кадров в порядке paths
+        """
+        if self._rows is None:
+            self._rows = {path: row for row, path in enumerate(self.paths)}
+        return self.vectors[[self._rows[p] for p in paths]]
+
+    def search(self, tokens, top_k=200, min_similarity=0.0, ann=None, nprobe=16, rerank=4):
+        """
+        Косинусный поиск ближайших к запросу кадров.
+
+        Args:
+            tokens (list): Леммы запроса
+            top_k (int): Максимальное число результатов
+            min_similarity (float): Минимальная косинусная близость
+            ann (IVFIndex): Приближённый индекс этого же поколения; None — полный перебор
+            nprobe (int): Сколько кластеров ANN-индекса просматривать
+            rerank (int): Во сколько раз больше кандидатов ANN переоценивать по точным векторам
+
+        Returns:
+            list: Пары (близость, путь) по убыванию близости
+        """
+        if not len(self.paths):
+            return []
+        query = self.model.embed([tokens])[0]
+        if not query.any():
+            return []
+        if ann is not None and ann.generation == self.generation:
+            hits = ann.search(query, top_k, nprobe=nprobe, rerank=rerank, exact_vectors=self.vectors_for)
+            return [(score, path) for score, path in hits if score >= min_similarity]
+        scores = self.vectors @ query
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(float(scores[i]), self.paths[i]) for i in best if scores[i] >= min_similarity]
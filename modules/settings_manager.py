@@ -35,6 +35,78 @@ def load_settings():
                 "very_smart_enabled": False,
                 "scene_edit_detection": False,
                 "thumbnails_folder": "thumbnails",
+                # Веса уровней совпадения и параметры BM25 для поиска по ключевым словам
+                "search_match_weights": {"exact": 3.0, "prefix": 2.0, "fuzzy": 1.0},
+                "bm25_k1": 1.2,
+                "bm25_b": 0.75,
+                # Дополнительный вес совпадений в тегах и имени исходного видео
+                "search_field_boosts": {"tags": 1.5, "source": 1.0},
+                # Количество процессов для построения индекса (0 — по числу ядер)
+                "index_workers": 1,
+                # Хранилище индекса: "json" (чанки в Cache/) или "sqlite" (FTS5)
+                "index_backend": "json",
+                # Пределы общего кэша результатов поиска
+                "search_cache_entries": 256,
+                "search_cache_mb": 64,
+                # Шарды для параллельного ранжирования (0 или 1 — без шардов)
+                # и сколько лучших результатов возвращает каждый шард
+                "search_shards": 0,
+                "search_shard_top_k": 1000,
+                # Локальный семантический поиск (векторы LSA по описаниям)
+                "semantic_search_enabled": False,
+                "semantic_dim": 128,
+                "semantic_top_k": 200,
+                "semantic_min_similarity": 0.1,
+                "semantic_refit_ratio": 0.2,
+                # Приближённый поиск соседей (IVF) для больших корпусов: включается
+                # от ann_min_vectors векторов; ann_nlist 0 — 4 * sqrt(n) кластеров;
+                # квантование "float32", "int8" или "pq"
+                "ann_enabled": True,
+                "ann_min_vectors": 50000,
+                "ann_nlist": 0,
+                "ann_nprobe": 16,
+                "ann_quantization": "int8",
+                "ann_rerank": 4,
+                # Поиск по векторам описаний Mistral (mistral-embed) вместо LLM-ранжирования чанков;
+                # mistral_api_base — адрес API или локальной заглушки modules/mistral_stub.py
+                "embedding_search_enabled": False,
+                "embedding_model": "mistral-embed",
+                "embedding_batch_size": 64,
+                "embedding_top_k": 50,
+                "embedding_min_similarity": 0.0,
+                "mistral_api_base": "",
+                # Smart-поиск в два этапа: локальный отбор кандидатов (0 — весь индекс),
+                # переранжирование их нейросетью и полный просмотр, если кандидатов нет
+                "smart_candidates_k": 200,
+                "smart_llm_rerank": True,
+                "smart_full_scan_fallback": True,
+                # Бюджет оценки токенов на один запрос ранжирования, минимальный интервал
+                # между запросами одного ключа (сек) и число попыток на чанк
+                "smart_chunk_tokens": 12000,
+                "mistral_key_interval": 1.1,
+                "max_chunk_attempts": 3,
+                # Описания в промпте ранжирования под номерами, ответ — JSON-массив номеров
+                # (шаблон можно переопределить в prompt_templates.smart_search_ids)
+                "smart_prompt_ids": True,
+                # Краткие поисковые описания кадров (_summary.json) фоновым этапом после Pixtral;
+                # индекс и промпты smart-поиска берут их вместо полных описаний
+                "frame_summaries_enabled": False,
+                "summary_max_tokens": 200,
+                "use_frame_summaries": True,
+                # Постоянный кэш ответов LLM-ранжирования по чанкам (Cache/rank_cache.sqlite3)
+                "llm_cache_enabled": True,
+                "llm_cache_ttl_days": 7,
+                "llm_cache_max_entries": 50000,
+                # Постоянный кэш вердиктов very_smart-проверки кадров (Cache/verdict_cache.sqlite3)
+                "verdict_cache_enabled": True,
+                "verdict_cache_ttl_days": 30,
+                "verdict_cache_max_entries": 200000,
+                # very_smart: сколько уменьшенных кадров проверять одним запросом Pixtral
+                # (1 — по одному) и наибольшая сторона уменьшенного кадра в пикселях
+                "verify_batch_size": 4,
+                "verify_image_size": 512,
+                # very_smart: остановить проверку после стольких подтверждённых кадров (0 — проверять всех)
+                "very_smart_max_matches": 0,
                 "prompt_templates": {
                     "image_description": "Опиши что изображено на этом кадре. Ответ должен быть подробным, но не слишком длинным (до 200 символов).",
                     "smart_search": "Ответь на вопрос: {query}. Найди все релевантные изображения из списка {images}. Возвращай только список имен файлов, которые соответствуют запросу."
@@ -0,0 +1,258 @@
+"""
+Модуль параллельного выполнения поисковых запросов по шардам индекса.
+Индекс делится на N частей, каждую держит в памяти отдельный процесс.
+Запрос выполняется в два круга: сначала шарды параллельно сопоставляют термины
+со своей долей общего словаря (нечёткое сравнение — самая дорогая часть
+широких запросов), затем по объединённому списку совпадений каждый шард
+ранжирует свои документы и возвращает лучшие k; итоговый top-k получается
+слиянием этих списков.
+
+Запуск бенчмарка масштабирования: python -m modules.shard_pool [кадров] [шардов]
+"""
+
+import sys
+import time
+import heapq
+import itertools
+import random
+import threading
+import logging
+import multiprocessing as mp
+
+from modules.search_index import SearchIndex, match_vocabulary
+
+logger = logging.getLogger(__name__)
+
+# Сколько лучших результатов возвращает каждый шард
+DEFAULT_SHARD_TOP_K = 1000
+
+
+def _no_text(path, **options):
+    # Шарду нужен только инвертированный индекс, тексты кадров остаются в основном процессе
+    return ""
+
+
+def _shard_worker(conn):
+    """
+    Цикл процесса-шарда. Команды приходят по каналу по порядку:
+    ("reset", статистика корпуса, номер шарда, число шардов), ("add", порция документов),
+    ("match", ...) и ("score", ...) — команды с ответом, ("stop",).
+    """
+    index = SearchIndex(text_loader=_no_text)
+    vocabulary, own = [], set()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        command = message[0]
+        if command == "reset":
+            stats, number, shards = message[1:]
+            index = SearchIndex(text_loader=_no_text)
+            index.set_global_stats(stats)
+            # Доля общего словаря, которую этот шард сопоставляет с терминами запроса
+            vocabulary = sorted(stats["doc_freqs"])[number::shards]
+            own = set(vocabulary)
+        elif command == "add":
+            index.update(message[1])
+        elif command == "match":
+            terms, fuzz_threshold = message[1:]
+            try:
+                matches = {}
+                for term in terms:
+                    exact = [(term, "exact")] if term in own else []
+                    matches[term] = exact + match_vocabulary(term, vocabulary, fuzz_threshold)
+                conn.send(("ok", matches, None))
+            except Exception as e:
+                conn.send(("error", repr(e), None))
+        elif command == "score":
+            terms, matches, weights, k1, b, field_boosts, k, min_score = message[1:]
+            try:
+                scores = index.score_ids(terms, weights, k1=k1, b=b, field_boosts=field_boosts,
+                                         matches=matches)
+                matched = [(-s, index.path(d)) for d, s in scores.items() if s >= min_score]
+                top = heapq.nsmallest(k, matched)
+                conn.send(("ok", len(matched), top))
+            except Exception as e:
+                conn.send(("error", repr(e), None))
+        elif command == "stop":
+            break
+    conn.close()
+
+
+class ShardPool:
+    """
+    Набор процессов-шардов.
+    Документы раздаются шардам порциями по кругу; вместе с ними каждый шард
+    получает статистику всего корпуса, поэтому BM25-оценки совпадают с оценками
+    неразделённого индекса и результаты шардов можно сливать напрямую.
+    Запросы не ждут загрузки: пока шарды заняты или держат другое поколение
+    индекса, score() возвращает None и вызывающий код считает оценки сам.
+    """
+    def __init__(self, shards, top_k=DEFAULT_SHARD_TOP_K):
+        """
+        Args:
+            shards (int): Количество процессов-шардов
+            top_k (int): Сколько лучших результатов возвращает каждый шард
+        """
+        self.shards = shards
+        self.top_k = top_k
+        self.generation = None
+        self._newest = -1
+        self._conns = []
+        self._processes = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._processes:
+            return
+        for number in range(self.shards):
+            parent_conn, child_conn = mp.Pipe()
+            process = mp.Process(target=_shard_worker, args=(child_conn,), daemon=True,
+                                 name=f"search-shard-{number}")
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        logger.info(f"Запущено шардов поиска: {self.shards}")
+
+    def stop(self):
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.send(("stop",))
+                    conn.close()
+                except OSError:
+                    pass
+            for process in self._processes:
+                process.join(timeout=5)
+            self._conns = []
+            self._processes = []
+            self.generation = None
+
+    def _broadcast(self, request):
+        """Отправляет запрос всем шардам сразу и собирает ответы (None — ошибка в шарде)."""
+        for conn in self._conns:
+            conn.send(request)
+        replies = []
+        for conn in self._conns:
+            status, payload, extra = conn.recv()
+            if status != "ok":
+                logger.error(f"Ошибка в шарде поиска: {payload}")
+                replies.append(None)
+            else:
+                replies.append((payload, extra))
+        return replies
+
+    def load(self, index):
+        """
+        Раздаёт шардам документы индекса (вызывается при публикации нового поколения).
+
+        Args:
+            index (SearchIndex): Полный индекс
+        """
+        self.start()
+        started = time.perf_counter()
+        with self._lock:
+            # Загрузка устаревшего поколения, опередившая более новую, не нужна
+            if index.generation < self._newest:
+                return
+            self._newest = index.generation
+            self.generation = None
+            stats = index.global_stats()
+            for number, conn in enumerate(self._conns):
+                conn.send(("reset", stats, number, self.shards))
+            for number, chunk in enumerate(index.iter_entries()):
+                self._conns[number % self.shards].send(("add", chunk))
+            self.generation = index.generation
+        logger.info(
+            f"Поколение {index.generation} загружено в {self.shards} шардов "
+            f"за {time.perf_counter() - started:.2f} с"
+        )
+
+    def score(self, terms, weights, fuzz_threshold, k1, b, field_boosts, generation, min_score=0.0):
+        """
+        Выполняет ранжирование на всех шардах параллельно.
+
+        Args:
+            generation (int): Поколение индекса, для которого нужен ответ
+
+        Returns:
+            tuple | None: (список пар (оценка, путь) — общий top-k по убыванию оценки,
+                общее число совпадений) или None, если шарды сейчас недоступны
+        """
+        if generation != self.generation or not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if generation != self.generation:
+                return None
+            # Отсортированный список терминов: одинаковый порядок сложения в любом процессе
+            terms = sorted(terms)
+            matches = {term: [] for term in terms}
+            for part in self._broadcast(("match", terms, fuzz_threshold)):
+                if part is None:
+                    return None
+                for term, found in part[0].items():
+                    matches[term].extend(found)
+            total = 0
+            parts = []
+            request = ("score", terms, matches, weights, k1, b, field_boosts, self.top_k, min_score)
+            for part in self._broadcast(request):
+                if part is None:
+                    return None
+                total += part[0]
+                parts.append(part[1])
+        finally:
+            self._lock.release()
+        merged = itertools.islice(heapq.merge(*parts), self.top_k)
+        return [(-neg, path) for neg, path in merged], total
+
+
+def benchmark(frames=200000, max_shards=4, queries=20, vocab_size=50000, seed=1):
+    """
+    Измеряет время ранжирования синтетического корпуса при 1..max_shards шардах
+    и проверяет, что результаты совпадают с неразделённым индексом.
+
+    Returns:
+        list: Пары (число шардов, среднее время запроса в миллисекундах)
+    """
+    rnd = random.Random(seed)
+    alphabet = "абвгдежзиклмнопрстуфхцчшэюя"
+    vocab = sorted({"".join(rnd.choice(alphabet) for _ in range(rnd.randint(4, 9))) for _ in range(vocab_size)})
+    common = vocab[:200]
+    index = SearchIndex(text_loader=_no_text)
+    for i in range(frames):
+        tokens = rnd.choices(common, k=15) + rnd.choices(vocab, k=25)
+        index.add(f"video_{i // 500}/preview_{i % 500:05d}.webp", "", tokens, {"source": f"video_{i // 500}.mp4"})
+    workload = [rnd.sample(vocab, 2) for _ in range(queries)]
+    params = (None, 90, 1.2, 0.75, None)
+
+    def local(terms):
+        scores = index.score(sorted(terms), *params)
+        return heapq.nsmallest(DEFAULT_SHARD_TOP_K, ((-s, p) for p, s in scores.items() if s > 0))
+
+    started = time.perf_counter()
+    expected = [local(terms) for terms in workload]
+    results = [(0, (time.perf_counter() - started) / queries * 1000)]
+    print(f"без шардов: {results[0][1]:.1f} мс/запрос ({frames} кадров)")
+
+    for shards in range(1, max_shards + 1):
+        pool = ShardPool(shards)
+        pool.load(index)
+        started = time.perf_counter()
+        answers = [pool.score(terms, *params, generation=index.generation) for terms in workload]
+        elapsed = (time.perf_counter() - started) / queries * 1000
+        pool.stop()
+        for answer, reference in zip(answers, expected):
+            got = [path for _, path in answer[0]]
+            want = [path for _, path in reference]
+            if got != want:
+                raise AssertionError(f"Результаты {shards} шардов расходятся с неразделённым индексом")
+        results.append((shards, elapsed))
+        print(f"шардов {shards}: {elapsed:.1f} мс/запрос, ускорение x{results[0][1] / elapsed:.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    benchmark(*args)
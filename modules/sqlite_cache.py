@@ -0,0 +1,143 @@
+"""
+Модуль общего постоянного кэша ответов нейросети в SQLite (WAL).
+Записи вытесняются по возрасту (TTL) и по количеству (давно не использованные
+первыми). Конкретные кэши (rank_cache, verdict_cache) задают только таблицу,
+столбец значения и его кодирование.
+"""
+
+import time
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в записях) проверять пределы кэша
+_EVICT_EVERY = 256
+
+
+class SqliteCache:
+    """
+    Кэш {ключ: значение} с TTL и вытеснением по давности использования.
+    Потокобезопасен: потоки пишут в него по мере получения ответов.
+
+    Наследники задают TABLE, VALUE_COLUMN, VALUE_TYPE, NAME (для журнала)
+    и при необходимости encode/decode значения.
+    """
+    TABLE = ""
+    VALUE_COLUMN = "value"
+    VALUE_TYPE = "TEXT"
+    NAME = "Кэш"
+
+    def __init__(self, db_path, ttl, max_entries):
+        """
+        Args:
+            db_path (Path): Путь к файлу базы
+            ttl (float): Время жизни записи в секундах (0 — без ограничения)
+            max_entries (int): Максимальное число записей (0 — без ограничения)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(f"""
+CREATE TABLE IF NOT EXISTS {self.TABLE} (
+    key TEXT PRIMARY KEY,
+    {self.VALUE_COLUMN} {self.VALUE_TYPE} NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {self.TABLE}_used ON {self.TABLE} (used);
+""")
+        self.evict()
+
+    def encode(self, value):
+        """Значение для записи в базу."""
+        return value
+
+    def decode(self, stored):
+        """Значение, прочитанное из базы."""
+        return stored
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_many(self, keys):
+        """
+        Returns:
+            dict: {ключ: значение} для найденных и не устаревших ключей
+        """
+        keys = list(keys)
+        found = {}
+        now = time.time()
+        oldest = now - self.ttl if self.ttl else 0
+        with self._lock, self._conn:
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, {self.VALUE_COLUMN} FROM {self.TABLE} "
+                    f"WHERE created >= ? AND key IN ({marks})",
+                    [oldest] + part,
+                ).fetchall()
+                for key, stored in rows:
+                    found[key] = self.decode(stored)
+            if found:
+                self._conn.executemany(
+                    f"UPDATE {self.TABLE} SET used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, value):
+        """Записывает значение отдельной транзакцией — оно сохранится, даже если поиск прервётся."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.TABLE} (key, {self.VALUE_COLUMN}, created, used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, self.encode(value), now, now),
+            )
+            self._puts += 1
+            due = self._puts % _EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Удаляет устаревшие записи и самые давно использованные сверх max_entries."""
+        with self._lock, self._conn:
+            removed = 0
+            if self.ttl:
+                removed += self._conn.execute(
+                    f"DELETE FROM {self.TABLE} WHERE created < ?", (time.time() - self.ttl,)
+                ).rowcount
+            if self.max_entries:
+                count = self._conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+                if count > self.max_entries:
+                    removed += self._conn.execute(
+                        f"DELETE FROM {self.TABLE} WHERE key IN "
+                        f"(SELECT key FROM {self.TABLE} ORDER BY used LIMIT ?)",
+                        (count - self.max_entries,),
+                    ).rowcount
+        if removed:
+            logger.info(f"{self.NAME}: вытеснено {removed} записей")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+            return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
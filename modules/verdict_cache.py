@@ -0,0 +1,75 @@
+"""
+Модуль постоянного кэша ответов проверки кадров (very_smart: Pixtral, да/нет).
+Ключ — (нормализованный запрос, отпечаток содержимого кадра, модель), поэтому
+заменённый кадр или смена модели проверяются заново, а переименование папки
+не сбрасывает вердикты. Хранится в SQLite (WAL): каждый вердикт записывается
+сразу после ответа, параллельные потоки и поиски не затирают друг друга.
+Записи вытесняются по возрасту (TTL) и по количеству.
+"""
+
+import os
+import hashlib
+import threading
+from pathlib import Path
+
+from modules.sqlite_cache import SqliteCache
+
+VERDICT_CACHE_FILE = Path("Cache") / "verdict_cache.sqlite3"
+
+# Отпечатки файлов кадров: {путь: ((размер, mtime), отпечаток)} — файл читается
+# заново только если изменился
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def frame_digest(image_path):
+    """
+    Отпечаток содержимого файла кадра.
+
+    Returns:
+        str | None: Отпечаток или None, если файл недоступен
+    """
+    try:
+        st = os.stat(image_path)
+    except OSError:
+        return None
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        known = _digests.get(image_path)
+    if known is not None and known[0] == stamp:
+        return known[1]
+    try:
+        with open(image_path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+    with _digests_lock:
+        _digests[image_path] = (stamp, digest)
+    return digest
+
+
+def verdict_key(query, digest, model):
+    """Ключ вердикта: запрос (регистр и пробелы нормализуются), отпечаток кадра, модель."""
+    h = hashlib.sha1(" ".join(query.lower().split()).encode("utf-8"))
+    h.update(b"\x00" + digest.encode("utf-8") + b"\x00" + model.encode("utf-8"))
+    return h.hexdigest()
+
+
+class VerdictCache(SqliteCache):
+    """
+    Кэш {ключ вердикта: да/нет}. Потокобезопасен: потоки проверки пишут
+    в него по мере получения ответов.
+    """
+    TABLE = "verdicts"
+    VALUE_COLUMN = "verdict"
+    VALUE_TYPE = "INTEGER"
+    NAME = "Кэш проверки кадров"
+
+    def __init__(self, db_path=VERDICT_CACHE_FILE, ttl=30 * 86400, max_entries=200000):
+        super().__init__(db_path, ttl, max_entries)
+
+    def encode(self, verdict):
+        return int(bool(verdict))
+
+    def decode(self, stored):
+        return bool(stored)
@@ -6,13 +6,16 @@ import logging
 from pathlib import Path
 from modules.video_processor import start_processing, stop_processing, get_thumbnail_by_video_path
 from modules.search_manager import (
-    search_in_index,
-    smart_search,
-    very_smart_filter,
+    run_search,
+    run_search_stream,
+    faceted_search,
+    get_tag_frequencies,
+    get_search_mode,
+    suggest_completions,
+    ListCursor,
     get_current_index,
     start_search_monitoring,
     enable_smart_search,
-    smart_keyword_search,
 )
 from modules.enhanced_neural_processor import start_enhanced_neural_processing, stop_enhanced_neural_processing
 from ui.image_view import create_image_view
@@ -37,8 +40,9 @@ def create_main_view(page, on_settings=None, on_favorites=None):
     current_view = "thumbnails"
     current_query = ""
     current_page = 0
-    filtered_results = []
+    filtered_results = ListCursor()
     page_thumbnails = []
+    ITEMS_PER_PAGE = 25  # миниатюр на странице сетки
 
     model_loader = ft.ProgressRing(width=24, height=24, visible=False)
    #def update_if_changed(query_str):
@@ -50,23 +54,7 @@ def create_main_view(page, on_settings=None, on_favorites=None):
    #    update_search_results(perform_search(query_str))
    #
     def perform_search(query):
-        query = query.strip()
-        if not query:
-            return list(get_current_index().keys())
-
-        settings = load_settings()
-        use_smart = settings.get("smart_search_enabled", False)
-        use_very  = settings.get("very_smart_enabled", False)
-
-        if use_very:
-            candidates = smart_search(query, force=True)
-            logger.info(f"Кандидатов от smart_search: {len(candidates)}")
-            return very_smart_filter(candidates, query)
-
-        if use_smart:
-            return smart_search(query, force=True)
-
-        return smart_keyword_search(query)
+        return run_search(query)
     def update_search_results(results):
         nonlocal filtered_results
         filtered_results = results
@@ -272,7 +260,7 @@ def create_main_view(page, on_settings=None, on_favorites=None):
     
     def load_thumbnails_from_results():
         nonlocal current_page, filtered_results, page_thumbnails
-        items_per_page = 25
+        items_per_page = ITEMS_PER_PAGE
         total_thumbnails = len(filtered_results)
         total_pages = (total_thumbnails + items_per_page - 1) // items_per_page
     
@@ -285,9 +273,8 @@ def create_main_view(page, on_settings=None, on_favorites=None):
         next_button.disabled = (current_page >= total_pages - 1 or total_pages <= 1)
         page_text.value = f"Страница {current_page + 1} из {max(total_pages, 1)}"
     
-        start_idx = current_page * items_per_page
-        end_idx = min(start_idx + items_per_page, total_thumbnails)
-        page_thumbnails = filtered_results[start_idx:end_idx]
+        # Курсор отдаёт только кадры текущей страницы, весь список не строится
+        page_thumbnails = filtered_results.page(current_page, items_per_page)
     
         thumbnails_grid.controls.clear()
     
@@ -356,28 +343,9 @@ def create_main_view(page, on_settings=None, on_favorites=None):
 
     
     def perform_search(query):
-        query = query.strip()
-        if not query:
-            return list(get_current_index().keys())
-    
-        settings = load_settings()
-        use_smart = settings.get("smart_search_enabled", False)
-        use_very  = settings.get("very_smart_enabled", False)
-    
-        # 1) «Супер‑умный» = сначала semantic‑search, потом Pixtral‑filter
-
-        if use_very:
-            candidates = smart_search(query, force=True)
-            logger.info(f"Кандидатов от smart_search: {len(candidates)}")
-            return very_smart_filter(candidates, query)
-
-    
-        # 2) Только semantic
-        if use_smart:
-            return smart_search(query, force=True)
-    
-        # 3) Обычный keyword‑search
-        return smart_keyword_search(query)
+        # Режим (обычный / умный / супер‑умный) берётся из настроек,
+        # результаты кэшируются в search_manager по поколению индекса
+        return run_search(query)
     
     
     
@@ -402,19 +370,208 @@ def create_main_view(page, on_settings=None, on_favorites=None):
     # Используем только on_submit – запрос отправляется при нажатии Enter
 
 
-    search_field.on_submit = lambda e: (
-        set_status("🔍 Поиск...", loading=True),
-        update_search_results(perform_search(e.control.value)),
-        set_status("✅ Результаты обновлены", loading=False)
+    # Текущий поиск: умные режимы выполняются в фоне и присылают результаты
+    # частями; новый запрос отменяет предыдущий
+    search_cancel = None
+    search_query = None
+    search_token = 0
+
+    def cancel_running_search():
+        """Отменяет идущий поиск. Возвращает True, если поиск действительно шёл."""
+        nonlocal search_cancel, search_query
+        if search_cancel is None:
+            return False
+        search_cancel.set()
+        search_cancel = None
+        search_query = None
+        return True
+
+    def finish_search(token):
+        # Завершившийся поиск больше нечего отменять
+        nonlocal search_cancel, search_query
+        if token == search_token:
+            search_cancel = None
+            search_query = None
+
+    def refresh_streamed_results(results):
+        nonlocal filtered_results
+        filtered_results = results
+        # Полную страницу не перерисовываем — меняется только число страниц
+        if len(page_thumbnails) < ITEMS_PER_PAGE:
+            load_thumbnails_from_results()
+        else:
+            total_pages = (len(results) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
+            next_button.disabled = current_page >= total_pages - 1
+            page_text.value = f"Страница {current_page + 1} из {max(total_pages, 1)}"
+            page.update()
+
+    def start_search(query_str):
+        nonlocal search_cancel, search_query, search_token
+        cancel_running_search()
+        hide_suggestions()
+        set_status("🔍 Поиск...", loading=True)
+        search_token += 1
+        token = search_token
+        cancel = threading.Event()
+        search_cancel, search_query = cancel, query_str
+
+        def on_results(results, done):
+            if token != search_token or cancel.is_set():
+                return
+            if done:
+                finish_search(token)
+                update_search_results(results)
+                set_status("✅ Результаты обновлены", loading=False)
+            else:
+                refresh_streamed_results(results)
+                set_status(f"🔍 Найдено {len(results)}, поиск продолжается...", loading=True)
+
+        filters = current_filters()
+
+        def worker():
+            try:
+                if filters:
+                    # С фильтрами — обычный (не потоковый) поиск с пересчётом счётчиков
+                    results, counts = faceted_search(query_str, filters, get_search_mode())
+                    on_results(results, True)
+                    if token == search_token:
+                        apply_facet_counts(counts)
+                else:
+                    results = run_search_stream(query_str, on_results, cancel_event=cancel)
+                    # Счётчики фасетов для найденного; непустой результат уже в кэше
+                    # поиска, поэтому повторного обращения к нейросети нет
+                    if token == search_token and not cancel.is_set() and len(results):
+                        apply_facet_counts(faceted_search(query_str, {}, get_search_mode())[1])
+            except Exception as ex:
+                logger.error(f"Ошибка поиска: {ex}")
+                if token == search_token:
+                    finish_search(token)
+                    set_status("❌ Ошибка поиска", loading=False)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    search_field.on_submit = lambda e: start_search(e.control.value)
+
+    # Фильтры по фасетам (исходное видео, папка) и облако частых тегов
+    ALL_VALUES = "__all__"
+    FACET_OPTIONS_LIMIT = 50
+    TAG_CHIPS = 12
+
+    def on_filter_change(e):
+        start_search(search_field.value or "")
+
+    source_filter = ft.Dropdown(label="Видео", width=220, dense=True, value=ALL_VALUES, on_change=on_filter_change)
+    folder_filter = ft.Dropdown(label="Папка", width=220, dense=True, value=ALL_VALUES, on_change=on_filter_change)
+    facet_dropdowns = {"source": source_filter, "folder": folder_filter}
+    tag_chips = ft.Row(wrap=True, spacing=5, expand=True)
+
+    def current_filters():
+        return {
+            facet: [dropdown.value]
+            for facet, dropdown in facet_dropdowns.items()
+            if dropdown.value and dropdown.value != ALL_VALUES
+        }
+
+    def apply_facet_counts(counts):
+        # Выбранное значение остаётся в списке, даже если по нему сейчас 0 кадров
+        for facet, dropdown in facet_dropdowns.items():
+            per_value = dict(counts.get(facet, {}))
+            if dropdown.value and dropdown.value != ALL_VALUES:
+                per_value.setdefault(dropdown.value, 0)
+            values = sorted((v for v in per_value if v), key=lambda v: (-per_value[v], v))[:FACET_OPTIONS_LIMIT]
+            dropdown.options = [ft.dropdown.Option(key=ALL_VALUES, text="Все")] + [
+                ft.dropdown.Option(key=v, text=f"{os.path.basename(v) or v} ({per_value[v]})") for v in values
+            ]
+        page.update()
+
+    def search_tag(tag):
+        term = f'tag:"{tag}"' if " " in tag else f"tag:{tag}"
+        query_str = (search_field.value or "").strip()
+        if term not in query_str.split():
+            query_str = f"{query_str} {term}".strip()
+        search_field.value = query_str
+        start_search(query_str)
+
+    def refresh_filters():
+        """Счётчики фасетов и частые теги по всему индексу (без запроса и фильтров)."""
+        try:
+            _, counts = faceted_search("", {})
+            tags = get_tag_frequencies(limit=TAG_CHIPS)
+        except Exception as ex:
+            logger.error(f"Ошибка при получении фильтров: {ex}")
+            return
+        tag_chips.controls = [
+            ft.TextButton(text=f"{tag} ({n})", on_click=lambda e, t=tag: search_tag(t))
+            for tag, n in tags
+        ]
+        apply_facet_counts(counts)
+
+    filters_bar = ft.Row([source_filter, folder_filter, tag_chips], spacing=10)
+
+
+
+    # Выпадающий список подсказок под полем поиска
+    suggestions_list = ft.Column(spacing=0, tight=True)
+    suggestions_box = ft.Container(
+        content=suggestions_list,
+        visible=False,
+        bgcolor=ft.colors.SURFACE_VARIANT,
+        border_radius=8,
+        padding=5,
     )
+    suggest_timer = None
+    SUGGEST_DELAY = 0.15  # секунд тишины после ввода перед запросом подсказок
 
+    def hide_suggestions():
+        if suggestions_box.visible:
+            suggestions_box.visible = False
+            page.update()
 
+    def apply_suggestion(query_str):
+        search_field.value = query_str + " "
+        suggestions_box.visible = False
+        page.update()
+        search_field.focus()
+
+    def show_suggestions(query_str):
+        # Пока таймер ждал, текст мог измениться — такие подсказки уже не нужны
+        if search_field.value != query_str:
+            return
+        items = suggest_completions(query_str)
+        suggestions_list.controls = [
+            ft.TextButton(
+                text=f"{completion}  ({count})",
+                on_click=lambda e, q=completion: apply_suggestion(q),
+            )
+            for completion, count in items
+        ]
+        suggestions_box.visible = bool(items)
+        page.update()
+
+    def schedule_suggestions(query_str):
+        nonlocal suggest_timer
+        if suggest_timer is not None:
+            suggest_timer.cancel()
+        suggest_timer = threading.Timer(SUGGEST_DELAY, show_suggestions, args=(query_str,))
+        suggest_timer.daemon = True
+        suggest_timer.start()
 
     # добавим on_change, чтобы при очистке сразу вернуть все без Enter
     def on_search_change(e):
         # если поле опустело — сбрасываем поиск
+        # изменённый запрос делает идущий поиск ненужным — не тратим на него ключи
+        if search_query is not None and e.control.value.strip() != search_query.strip():
+            if cancel_running_search():
+                set_status("Поиск отменён", loading=False)
         if not e.control.value.strip():
-            update_search_results(perform_search(""))
+            hide_suggestions()
+            if current_filters():
+                start_search("")
+            else:
+                update_search_results(perform_search(""))
+                refresh_filters()
+        else:
+            schedule_suggestions(e.control.value)
     
     search_field.on_change = on_search_change
     
@@ -497,6 +654,8 @@ def create_main_view(page, on_settings=None, on_favorites=None):
     view = ft.Container(
         content=ft.Column([
             toolbar,
+            suggestions_box,
+            filters_bar,
             ft.Divider(height=1),
             ft.Stack([thumbnails_grid, image_view_container], expand=True),
             ft.Divider(height=1),
@@ -654,6 +813,8 @@ def create_main_view(page, on_settings=None, on_favorites=None):
     
                 if count != last_loaded_count:
                     last_loaded_count = count
+                    # Новые кадры меняют счётчики фасетов и частые теги
+                    refresh_filters()
     
                     # обновляем только если ты в главном окне и НЕ в предпросмотре
                     if current_view == "main" and not image_view_container.visible:
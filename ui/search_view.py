@@ -1,11 +1,9 @@
 import time
 import threading
 import logging
-from modules.settings_manager import load_settings
 from modules.search_manager import (
-    search_in_index,
-    smart_search,
-    very_smart_filter,
+    run_search,
+    get_search_mode,
     get_current_index
 )
 from ui.thumbnail_view import load_thumbnails_from_results
@@ -13,68 +11,19 @@ from ui.thumbnail_view import load_thumbnails_from_results
 # Настраиваем логгер
 logger = logging.getLogger(__name__)
 
-# Кэш для хранения результатов поиска
-_search_cache = {}
-_search_cache_lock = threading.Lock()
-_last_index_count = 0
-
 def perform_search(query):
     """
     Выполняет поиск в индексе на основе запроса с кэшированием результатов.
+    Кэш общий с главным окном и сбрасывается при каждом новом поколении индекса.
     
     Args:
         query (str): Поисковый запрос
         
     Returns:
-        list: Список путей к найденным миниатюрам
+        ResultCursor: Курсор по путям к найденным миниатюрам
     """
-    global _search_cache, _last_index_count
-    
-    # Нормализуем запрос для кэширования
-    query = query.strip().lower()
-    
-    # Проверяем, изменился ли индекс
-    current_index = get_current_index()
-    current_index_count = len(current_index)
-    index_changed = current_index_count != _last_index_count
-    _last_index_count = current_index_count
-    
-    # Проверяем кэш при неизменном индексе и существующем запросе
-    if not index_changed and query in _search_cache:
-        logger.info(f"Используем кэшированный результат для запроса: '{query}'")
-        return _search_cache[query]
-    
-    # Выполняем запрос в зависимости от настроек
-    if not query:
-        result = list(current_index.keys())
-    else:
-        settings = load_settings()
-        use_smart = settings.get("smart_search_enabled", False)
-        use_very = settings.get("very_smart_enabled", False)
-        
-        # Выбираем стратегию поиска
-        if use_very:
-            logger.info(f"Выполняем супер-умный поиск: '{query}'")
-            candidates = smart_search(query, force=True)
-            logger.info(f"Кандидатов от smart_search: {len(candidates)}")
-            result = very_smart_filter(candidates, query)
-        elif use_smart:
-            logger.info(f"Выполняем умный поиск: '{query}'")
-            result = smart_search(query, force=True)
-        else:
-            logger.info(f"Выполняем стандартный поиск: '{query}'")
-            result = search_in_index(query)
-    
-    # Кэшируем результат
-    with _search_cache_lock:
-        # Ограничиваем размер кэша
-        if len(_search_cache) > 50:  # Храним не более 50 запросов
-            oldest_query = next(iter(_search_cache))
-            del _search_cache[oldest_query]
-        
-        _search_cache[query] = result
-    
-    return result
+    logger.info(f"Выполняем поиск ({get_search_mode()}): '{query.strip()}'")
+    return run_search(query)
 
 def update_search_results(page, results, filtered_results, current_page, current_query):
     """
@@ -82,14 +31,11 @@ def update_search_results(page, results, filtered_results, current_page, current
     
     Args:
         page (ft.Page): Страница Flet
-        results (list): Результаты поиска
-        filtered_results (list): Список для хранения отфильтрованных результатов
+        results (ResultCursor): Результаты поиска (курсор, страницы читаются по требованию)
+        filtered_results (list): Не используется, оставлен для совместимости
         current_page (int): Текущая страница
         current_query (str): Текущий поисковый запрос
     """
-    # Обновляем результаты
-    filtered_results.clear()
-    filtered_results.extend(results)
     
     # Находим элементы интерфейса на странице
     thumbnails_grid = None
@@ -117,7 +63,7 @@ def update_search_results(page, results, filtered_results, current_page, current
             page,
             thumbnails_grid,
             image_view_container,
-            filtered_results,
+            results,
             current_page
         )
 
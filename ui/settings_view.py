@@ -119,7 +119,8 @@ def create_settings_view(page, on_back=None):
         # если включили super — выключаем обычный
         if val:
             smart_search_switch.value = False
-            update_settings({"smart_search_enabled": False})
+            semantic_switch.value = False
+            update_settings({"smart_search_enabled": False, "semantic_search_enabled": False})
             disable_smart_search()
         page.update()
     
@@ -127,9 +128,10 @@ def create_settings_view(page, on_back=None):
         val = e.control.value
         update_settings({"smart_search_enabled": val})
         if val:
-            # если включили обычный — выключаем super
+            # если включили обычный — выключаем super и локальный семантический
             very_smart_switch.value = False
-            update_settings({"very_smart_enabled": False})
+            semantic_switch.value = False
+            update_settings({"very_smart_enabled": False, "semantic_search_enabled": False})
         # подгружаем/выгружаем модель
         if val:
             enable_smart_search()
@@ -137,6 +139,17 @@ def create_settings_view(page, on_back=None):
             disable_smart_search()
         page.update()
     
+    def on_semantic_change(e):
+        val = e.control.value
+        update_settings({"semantic_search_enabled": val})
+        if val:
+            # локальный семантический поиск заменяет поиск через нейросеть
+            smart_search_switch.value = False
+            very_smart_switch.value = False
+            update_settings({"smart_search_enabled": False, "very_smart_enabled": False})
+            disable_smart_search()
+        page.update()
+
     very_smart_switch = ft.Switch(
         label="Очень умный поиск (Pixtral)",
         value=settings.get("very_smart_enabled", False),
@@ -147,6 +160,11 @@ def create_settings_view(page, on_back=None):
         value=settings.get("smart_search_enabled", True),
         on_change=on_smart_change
     )
+    semantic_switch = ft.Switch(
+        label="Семантический поиск без интернета (локальные векторы)",
+        value=settings.get("semantic_search_enabled", False),
+        on_change=on_semantic_change
+    )
     # Переключатель автоматической нейрообработки
     neural_switch = ft.Switch(
         label="Автоматическая обработка нейросетями",
@@ -298,6 +316,7 @@ def create_settings_view(page, on_back=None):
             ft.Text("Функции", size=18, weight="bold"),
             smart_search_switch,
             very_smart_switch,
+            semantic_switch,
             neural_switch,
             scene_detection_switch,
         ], spacing=10),
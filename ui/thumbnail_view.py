@@ -101,7 +101,7 @@ def load_thumbnails_from_results(page, thumbnails_grid, image_view_container, fi
         page (ft.Page): Страница Flet
         thumbnails_grid (ft.GridView): Сетка для отображения миниатюр
         image_view_container (ft.Container): Контейнер для просмотра изображения
-        filtered_results (list): Список путей к отфильтрованным миниатюрам
+        filtered_results (ResultCursor): Курсор по путям к отфильтрованным миниатюрам
         current_page (int): Текущая страница для отображения
     """
     start_time = time.time()
@@ -145,10 +145,8 @@ def load_thumbnails_from_results(page, thumbnails_grid, image_view_container, fi
         prev_button.on_click = lambda e, p=current_page: load_thumbnails_from_results_page(page, thumbnails_grid, image_view_container, filtered_results, p - 1)
         next_button.on_click = lambda e, p=current_page: load_thumbnails_from_results_page(page, thumbnails_grid, image_view_container, filtered_results, p + 1)
     
-    # Вычисляем диапазон элементов для текущей страницы
-    start_idx = current_page * items_per_page
-    end_idx = min(start_idx + items_per_page, total_thumbnails)
-    page_thumbnails = filtered_results[start_idx:end_idx]
+    # Получаем у курсора только элементы текущей страницы
+    page_thumbnails = filtered_results.page(current_page, items_per_page)
     
     # Очищаем сетку
     thumbnails_grid.controls.clear()
@@ -233,7 +231,7 @@ def load_thumbnails_from_results_page(page, thumbnails_grid, image_view_containe
         page (ft.Page): Страница Flet
         thumbnails_grid (ft.GridView): Сетка для отображения миниатюр
         image_view_container (ft.Container): Контейнер для просмотра изображения
-        filtered_results (list): Список путей к отфильтрованным миниатюрам
+        filtered_results (ResultCursor): Курсор по путям к отфильтрованным миниатюрам
         new_page (int): Номер страницы для загрузки
     """
     logger.info(f"Запрошена страница: {new_page + 1}")